@@ -0,0 +1,58 @@
+# Asignación de stock para pedidos en varias ubicaciones.
+#
+# La ruta abre la transacción con BEGIN IMMEDIATE, así el plan (lectura) y los
+# descuentos (UPDATE ... WHERE cantidad >= ?) ocurren bajo el mismo bloqueo de
+# escritura y dos pedidos concurrentes no pueden vender el mismo stock.
+
+from shared.allocation import DEFAULT_LOCATION_ID, InsufficientStock
+
+# Orden en que se toman las ubicaciones de un producto
+STRATEGIES = {
+    # La ubicación preferida del pedido primero y después las demás por id. No hay
+    # coordenadas: el nombre es histórico y el id no mide distancia a nada
+    'nearest': 'CASE WHEN ubicacion_id = ? THEN 0 ELSE 1 END, ubicacion_id',
+    # Menos divisiones: primero la ubicación con más stock
+    'largest': 'cantidad DESC, ubicacion_id',
+    # Primero el stock que lleva más tiempo sin moverse
+    'fifo': 'fecha_actualizacion, id',
+}
+
+
+def allocate_stock(cursor, cantidades, strategy='nearest', preferred_location=DEFAULT_LOCATION_ID):
+    """Descontar stock de las ubicaciones según la estrategia.
+
+    Debe llamarse dentro de una transacción de escritura ya iniciada. Lanza
+    InsufficientStock antes de tocar nada si algún producto no alcanza.
+    """
+    order_by = STRATEGIES[strategy]
+    order_params = [preferred_location] if strategy == 'nearest' else []
+
+    plan = []
+    for producto_id, solicitado in cantidades.items():
+        cursor.execute(f'''
+            SELECT ubicacion_id, cantidad FROM inventario
+            WHERE producto_id = ? AND cantidad > 0
+            ORDER BY {order_by}
+        ''', [producto_id] + order_params)
+
+        pendiente = solicitado
+        for ubicacion_id, cantidad in cursor.fetchall():
+            tomar = min(pendiente, cantidad)
+            plan.append((producto_id, ubicacion_id, tomar))
+            pendiente -= tomar
+            if pendiente == 0:
+                break
+        if pendiente > 0:
+            raise InsufficientStock(producto_id, solicitado, solicitado - pendiente)
+
+    for producto_id, ubicacion_id, tomar in plan:
+        cursor.execute('''
+            UPDATE inventario
+            SET cantidad = cantidad - ?, fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE producto_id = ? AND ubicacion_id = ? AND cantidad >= ?
+        ''', (tomar, producto_id, ubicacion_id, tomar))
+        if cursor.rowcount != 1:
+            cursor.execute('SELECT COALESCE(SUM(cantidad), 0) FROM inventario WHERE producto_id = ?', (producto_id,))
+            raise InsufficientStock(producto_id, cantidades[producto_id], cursor.fetchone()[0])
+
+    return [{'producto_id': p, 'ubicacion_id': u, 'cantidad': c} for p, u, c in plan]
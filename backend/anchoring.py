@@ -0,0 +1,222 @@
+# Anclaje de transacciones en la cadena local simulada.
+#
+# Un hilo en segundo plano agrupa las transacciones pendientes
+# (blockchain_confirmado = 0) en bloques. Cada bloque guarda la raíz Merkle de
+# sus transacciones y el hash del bloque anterior. Cada transacción guarda su
+# hoja y su prueba de inclusión. create_transaction no espera al anclaje: solo
+# deja la fila pendiente.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from db import PoolTimeout
+from shared.canonical import GENESIS_HASH, TX_COLUMNS, canonical_transaction
+from shared.merkle import build_tree, hash_leaves, proof_path
+
+logger = logging.getLogger(__name__)
+
+CHAIN_ID = 'local-simulada'
+BLOCK_SIZE = 8192
+ANCHOR_INTERVAL = 5.0  # segundos entre rondas del hilo de anclaje
+
+ANCHORING_DDL = '''
+    CREATE TABLE IF NOT EXISTS bloques (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hash VARCHAR(64) UNIQUE NOT NULL,
+        hash_anterior VARCHAR(64) NOT NULL,
+        merkle_root VARCHAR(64) NOT NULL,
+        cantidad_transacciones INTEGER NOT NULL,
+        primera_transaccion_id INTEGER NOT NULL,
+        ultima_transaccion_id INTEGER NOT NULL,
+        fecha_creacion TIMESTAMP NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS pruebas_merkle (
+        transaccion_id INTEGER PRIMARY KEY,
+        bloque_id INTEGER NOT NULL,
+        indice INTEGER NOT NULL,
+        hoja VARCHAR(64) NOT NULL,
+        prueba TEXT NOT NULL,
+        FOREIGN KEY (transaccion_id) REFERENCES transacciones (id),
+        FOREIGN KEY (bloque_id) REFERENCES bloques (id)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_pruebas_merkle_bloque ON pruebas_merkle (bloque_id, indice);
+
+    -- Solo las filas pendientes: la cola del anclaje no recorre el historial confirmado
+    CREATE INDEX IF NOT EXISTS idx_transacciones_pendientes ON transacciones (id) WHERE blockchain_confirmado = 0;
+'''
+
+
+def ensure_anchoring_schema(cursor):
+    cursor.executescript(ANCHORING_DDL)
+
+
+def block_hash(hash_anterior, merkle_root, cantidad, primera_id, ultima_id, fecha):
+    header = json.dumps([hash_anterior, merkle_root, cantidad, primera_id, ultima_id, fecha], separators=(',', ':'))
+    return hashlib.sha256(header.encode('utf-8')).hexdigest()
+
+
+def anchor_pending(conn, block_size=BLOCK_SIZE):
+    """Anclar el siguiente bloque de transacciones pendientes.
+
+    El hashing se hace fuera del bloqueo de escritura. Devuelve el bloque creado,
+    o None si no había pendientes u otro proceso las ancló primero.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {", ".join(TX_COLUMNS)} FROM transacciones
+        WHERE blockchain_confirmado = 0
+        ORDER BY id LIMIT ?
+    ''', (block_size,))
+    rows = cursor.fetchall()
+    conn.rollback()  # cerrar la lectura antes de hashear
+    if not rows:
+        return None
+
+    leaves = hash_leaves([canonical_transaction(row) for row in rows])
+    levels = build_tree(leaves)
+    merkle_root = levels[-1][0]
+    primera_id, ultima_id = rows[0]['id'], rows[-1]['id']
+
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('SELECT hash FROM bloques ORDER BY id DESC LIMIT 1')
+        last = cursor.fetchone()
+        hash_anterior = last[0] if last else GENESIS_HASH
+        fecha = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        hash_bloque = block_hash(hash_anterior, merkle_root, len(rows), primera_id, ultima_id, fecha)
+
+        # Confirmar solo si siguen pendientes; si no, otro anclador ganó la carrera
+        cursor.executemany('''
+            UPDATE transacciones SET blockchain_tx_hash = ?, blockchain_confirmado = 1
+            WHERE id = ? AND blockchain_confirmado = 0
+        ''', [(hash_bloque, row['id']) for row in rows])
+        if cursor.rowcount != len(rows):
+            conn.rollback()
+            return None
+
+        cursor.execute('''
+            INSERT INTO bloques (hash, hash_anterior, merkle_root, cantidad_transacciones,
+                                 primera_transaccion_id, ultima_transaccion_id, fecha_creacion)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (hash_bloque, hash_anterior, merkle_root, len(rows), primera_id, ultima_id, fecha))
+        bloque_id = cursor.lastrowid
+
+        cursor.executemany('''
+            INSERT INTO pruebas_merkle (transaccion_id, bloque_id, indice, hoja, prueba)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(
+            row['id'], bloque_id, index, leaves[index],
+            json.dumps(proof_path(levels, index), separators=(',', ':'))
+        ) for index, row in enumerate(rows)])
+
+        # El hash de un producto apunta al último bloque que ancló movimientos suyos
+        cursor.executemany('UPDATE productos SET blockchain_hash = ? WHERE id = ?',
+                           [(hash_bloque, producto_id) for producto_id in {row['producto_id'] for row in rows}])
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        'id': bloque_id,
+        'hash': hash_bloque,
+        'hash_anterior': hash_anterior,
+        'merkle_root': merkle_root,
+        'cantidad_transacciones': len(rows),
+        'primera_transaccion_id': primera_id,
+        'ultima_transaccion_id': ultima_id,
+        'fecha_creacion': fecha
+    }
+
+
+def anchor_all(conn, block_size=BLOCK_SIZE):
+    """Anclar bloques hasta vaciar la cola de pendientes"""
+    blocks = []
+    while True:
+        block = anchor_pending(conn, block_size)
+        if block is None:
+            return blocks
+        blocks.append(block)
+        if block['cantidad_transacciones'] < block_size:
+            return blocks
+
+
+def chain_status(cursor):
+    cursor.execute('SELECT COUNT(*), COALESCE(MAX(id), 0) FROM bloques')
+    bloques, ultimo_bloque = cursor.fetchone()
+    cursor.execute('SELECT COUNT(*) FROM transacciones WHERE blockchain_confirmado = 1')
+    confirmadas = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(*) FROM transacciones WHERE blockchain_confirmado = 0')
+    pendientes = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(*) FROM productos WHERE blockchain_hash IS NOT NULL')
+    productos = cursor.fetchone()[0]
+    return {
+        'blocks': bloques,
+        'block_number': ultimo_bloque,
+        'confirmed_transactions': confirmadas,
+        'pending_transactions': pendientes,
+        'anchored_products': productos
+    }
+
+
+class Anchorer:
+    """Hilo que ancla las transacciones pendientes cada `interval` segundos"""
+
+    def __init__(self, pool, interval=ANCHOR_INTERVAL, block_size=BLOCK_SIZE, on_anchor=None):
+        self.pool = pool
+        self.interval = interval
+        self.block_size = block_size
+        self.on_anchor = on_anchor
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """Arrancar el hilo con la primera petición de cada proceso que sirve (como JobWorkers)"""
+        app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            self.start()
+
+    def start(self):
+        """Arrancar el hilo; una sola vez por proceso"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return self
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='anchorer', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            conn = None
+            try:
+                conn = self.pool.acquire()
+                blocks = anchor_all(conn, self.block_size)
+                for block in blocks:
+                    logger.info('Bloque %s anclado: %s transacciones, raíz %s',
+                                block['id'], block['cantidad_transacciones'], block['merkle_root'])
+                if blocks and self.on_anchor:
+                    self.on_anchor(blocks)
+            except PoolTimeout:
+                logger.warning('Sin conexión libre para anclar; se reintenta en %s s', self.interval)
+            except Exception:
+                logger.exception('Error al anclar transacciones')
+            finally:
+                if conn is not None:
+                    self.pool.release(conn)
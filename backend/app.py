@@ -1,13 +1,46 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, g
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
+import base64
+import click
 import json
 import sqlite3
 import os
+import sys
+import time
 from datetime import datetime, timedelta
 import uuid
 
+# El código común (shared/) está en la raíz del repositorio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from allocation import STRATEGIES, allocate_stock
+from anchoring import CHAIN_ID, Anchorer, anchor_all, chain_status, ensure_anchoring_schema
+from auth import ROLES, STAFF_ROLES, RevokedUsers, access_claims, current_role, require_role
+from batch import BatchError, ingest_transactions, parse_batch_payload
+from costing import (adjust_cost_layers, cost_of_sales, ensure_cost_layers, inventory_valuation, rebuild_cost_layers,
+                     record_movements, verify_cost_layers)
+from db import ConnectionPool
+from export import stream_export
+from forecast import refresh_reorder_points, reorder_points
+from jobs import HANDLERS, JobWorkers, enqueue, ensure_jobs_schema, queue_stats, run_pending
+from ledger import ensure_ledger, extend_chain, verify_chain
+from orders import EXPANSIONS, expand_orders, parse_expand
+from migrations import LATEST_VERSION, check_query_plans, migrate, optimize, schema_version
+from proofs import MAX_VERIFY, block_cache, transaction_proof, verify_transactions
+from search import ensure_search_index
+from shared.allocation import DEFAULT_LOCATION_ID, InsufficientStock, merge_items, preferred_location
+from shared.cache import MemoryBackend, ResponseCache, SQLiteBackend
+from shared.export import EXPORTS, FORMATS, gzip_chunks, parse_date_range
+from shared.forecast import FORECAST_AVAILABLE, ForecastUnavailable
+from shared.passwords import HasherBusy, PasswordHasher
+from shared.search import SEARCH_RANK, fts_query
+from shared.serializers import RowMapper, json_response, response_format
+from snapshots import InventorySnapshots, NoHistory, stock_as_of, take_snapshot
+from stock import ensure_stock_totals, rebuild_stock_totals, verify_stock_totals
+from versions import ensure_table_versions, make_conditional
+
 app = Flask(__name__)
 CORS(app)  # Permitir solicitudes CORS desde cualquier origen
 
@@ -19,14 +52,95 @@ jwt = JWTManager(app)
 # Configuración de base de datos
 DATABASE_PATH = 'database/app.db'
 
+# Estrategia de asignación de stock por defecto para pedidos (nearest: ubicación preferida y
+# luego por id; largest; fifo)
+ALLOCATION_STRATEGY = 'nearest'
+
+# Caché de respuestas: 'memory' (por proceso) o 'sqlite' (archivo local compartido entre procesos)
+CACHE_BACKEND = 'memory'
+CACHE_PATH = 'database/cache.db'
+CACHE_TTL = 60
+
+# Hilos que ejecutan la cola de trabajos (efectos secundarios de pedidos y pagos)
+JOB_WORKERS = 2
+
+# Hash de contraseñas: método de werkzeug con su costo (p. ej. 'scrypt:32768:8:1' o
+# 'pbkdf2:sha256:600000'; los hashes anteriores se actualizan en el login), procesos
+# del pool y operaciones en curso antes de responder 503. Cada login en curso ocupa un
+# hilo de petición: el límite queda por debajo de los hilos WSGI de asgi.py
+PASSWORD_METHOD = 'scrypt:32768:8:1'
+PASSWORD_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+PASSWORD_MAX_PENDING = 4
+
+# Hilos del servidor ASGI (asgi.py) para las rutas de Flask: cada uno usa una conexión a la vez
+WSGI_WORKERS = 6
+
+# Exportaciones en streaming simultáneas: cada una retiene su conexión hasta el último bloque,
+# sin ocupar un hilo de petición entre bloques
+EXPORT_STREAMS = 2
+
+# Pool compartido: las rutas toman una conexión por petición y la devuelven al terminar.
+# Se dimensiona con todos sus consumidores para que los hilos de fondo no compitan con las
+# peticiones: hilos de petición, exportaciones, cola de trabajos, anclaje, fotos de
+# inventario y /api/system/health
+DB_POOL_SIZE = WSGI_WORKERS + EXPORT_STREAMS + JOB_WORKERS + 3
+pool = ConnectionPool(DATABASE_PATH, max_size=DB_POOL_SIZE)
+
+password_hasher = PasswordHasher(PASSWORD_METHOD, workers=PASSWORD_WORKERS, max_pending=PASSWORD_MAX_PENDING)
+
+def get_db():
+    """Conexión del pool asociada a la petición actual"""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+# GET condicional (ETag / 304) según las versiones de las tablas consultadas
+conditional = make_conditional(get_db)
+
+def load_access_versions(since):
+    """Versiones de acceso de los usuarios cambiados después de `since` (epoch)"""
+    cursor = get_db().cursor()
+    cursor.execute('SELECT usuario_id, version FROM cambios_acceso WHERE version > ?', (since,))
+    return [(row['usuario_id'], row['version']) for row in cursor.fetchall()]
+
+# Tokens emitidos antes de un cambio de rol o estado del usuario
+revoked_users = RevokedUsers(load_access_versions, app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds())
+
+@jwt.token_in_blocklist_loader
+def token_revoked(jwt_header, jwt_payload):
+    return revoked_users.is_revoked(jwt_payload)
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
 def init_database():
-    """Inicializar la base de datos con las tablas necesarias"""
+    """Crear o actualizar el esquema de la base de datos.
+
+    Con la base al día es una sola lectura de PRAGMA user_version; el esquema base
+    y las migraciones solo corren en una base nueva o con migraciones pendientes.
+    """
     if not os.path.exists('database'):
         os.makedirs('database')
     
     conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
+    try:
+        if schema_version(conn) >= LATEST_VERSION:
+            return
+        conn.execute('PRAGMA journal_mode=WAL')
+        create_schema(conn.cursor())
+        conn.commit()
+        
+        # Migraciones versionadas
+        migrate(conn)
+        ensure_cost_layers(conn, DATABASE_PATH)
+    finally:
+        conn.close()
+
+def create_schema(cursor):
+    """Esquema base (anterior a las migraciones); todas las sentencias son idempotentes"""
     # Tabla de usuarios con roles
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS usuarios (
@@ -183,24 +297,49 @@ def init_database():
         )
     ''')
     
-    conn.commit()
-    conn.close()
+    # Índices compuestos para la paginación por cursor
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_nombre_id ON productos (nombre, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transacciones_fecha_id ON transacciones (fecha_creacion, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pedidos_cliente_fecha_id ON pedidos (cliente_id, fecha_pedido, id)')
+    # Exportación de pedidos por rango de fechas
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pedidos_fecha_id ON pedidos (fecha_pedido, id)')
+    
+    # Índice de búsqueda de texto completo sobre productos
+    ensure_search_index(cursor)
+    
+    # Totales de stock materializados (mantenidos por triggers)
+    ensure_stock_totals(cursor)
+    
+    # Bloques y pruebas Merkle de la cadena local simulada
+    ensure_anchoring_schema(cursor)
+    
+    # Cadena de hashes del libro de transacciones (solo anexado)
+    ensure_ledger(cursor)
+    
+    # Versiones por tabla para ETag / Last-Modified
+    ensure_table_versions(cursor)
+    
+    # Cola de trabajos en segundo plano
+    ensure_jobs_schema(cursor)
 
 def insert_initial_data():
-    """Insertar datos iniciales"""
+    """Insertar datos iniciales en una base sin usuarios; devuelve False si ya tenía datos"""
     conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
     
-    # Verificar si ya existen datos
+    # Verificar si ya existen datos, con el bloqueo de escritura tomado: dos procesos
+    # que siembran a la vez no insertan dos veces
+    cursor.execute('BEGIN IMMEDIATE')
     cursor.execute('SELECT COUNT(*) FROM usuarios')
     if cursor.fetchone()[0] > 0:
+        conn.rollback()
         conn.close()
-        return
+        return False
     
     # Usuarios iniciales
-    admin_password = generate_password_hash('admin123')
-    employee_password = generate_password_hash('empleado123')
-    client_password = generate_password_hash('cliente123')
+    admin_password = generate_password_hash('admin123', PASSWORD_METHOD)
+    employee_password = generate_password_hash('empleado123', PASSWORD_METHOD)
+    client_password = generate_password_hash('cliente123', PASSWORD_METHOD)
     
     cursor.execute('''
         INSERT INTO usuarios (username, email, password_hash, rol, nombre)
@@ -279,12 +418,186 @@ def insert_initial_data():
             VALUES (?, ?, ?)
         ''', inv)
     
+    # Capas de costo iniciales, al precio de compra de cada producto
+    record_movements(cursor, [(producto_id, ubicacion_id, cantidad, None, 'apertura', None)
+                              for producto_id, ubicacion_id, cantidad in inventario_inicial])
+    
     conn.commit()
     conn.close()
+    return True
+
+# Comandos de mantenimiento de stock_totals (flask --app app <comando>)
+@app.cli.command('verify-stock-totals')
+@click.option('--fix', is_flag=True, help='Reconstruir la tabla si se detectan diferencias')
+def verify_stock_totals_command(fix):
+    """Comparar stock_totals con inventario y reportar diferencias"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    drift = verify_stock_totals(cursor)
+    for producto_id, esperado, actual, bajo_esperado, bajo_actual in drift:
+        click.echo(f'Producto {producto_id}: stock esperado {esperado}, materializado {actual} '
+                   f'(bajo_stock {bajo_esperado}/{bajo_actual})')
+    if not drift:
+        click.echo('stock_totals coincide con inventario')
+    elif fix:
+        rebuild_stock_totals(cursor)
+        conn.commit()
+        click.echo(f'stock_totals reconstruida ({len(drift)} productos corregidos)')
+    conn.close()
+    if drift and not fix:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-stock-totals')
+def rebuild_stock_totals_command():
+    """Recalcular stock_totals desde inventario"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    rebuild_stock_totals(conn.cursor())
+    conn.commit()
+    conn.close()
+    click.echo('stock_totals reconstruida')
+
+@app.cli.command('snapshot-inventory')
+def snapshot_inventory_command():
+    """Tomar ahora una foto del inventario (el hilo de fotos las toma solo cuando corresponde)"""
+    conn = pool.acquire()
+    try:
+        snapshot_id = take_snapshot(conn)
+    finally:
+        pool.release(conn)
+    click.echo(f'Foto de inventario {snapshot_id} tomada' if snapshot_id else 'Sin movimientos desde la última foto')
+
+@app.cli.command('anchor-transactions')
+@click.option('--block-size', default=None, type=int, help='Transacciones por bloque')
+def anchor_transactions_command(block_size):
+    """Anclar ahora todas las transacciones pendientes"""
+    conn = pool.acquire()
+    try:
+        blocks = anchor_all(conn, block_size) if block_size else anchor_all(conn)
+    finally:
+        pool.release(conn)
+    for block in blocks:
+        click.echo(f'Bloque {block["id"]}: {block["cantidad_transacciones"]} transacciones, raíz {block["merkle_root"]}')
+    if not blocks:
+        click.echo('No hay transacciones pendientes')
+
+@app.cli.command('verify-ledger')
+@click.option('--resume', is_flag=True, help='Continuar desde el último checkpoint en vez de recorrer desde el inicio')
+def verify_ledger_command(resume):
+    """Verificar la cadena de hashes de transacciones"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    result = verify_chain(conn, resume=resume,
+                          progress=lambda last_id, checked: click.echo(f'... {checked} filas (id {last_id})'))
+    conn.close()
+    if not result['valid']:
+        click.echo(f'Cadena rota en la transacción {result["first_invalid_id"]} ({result["reason"]})')
+        raise SystemExit(1)
+    click.echo(f'Cadena válida: {result["checked"]} filas verificadas desde la transacción '
+               f'{result["resumed_from"]}, {result["total"]} en total')
+
+@app.cli.command('forecast-reorder')
+def forecast_reorder_command():
+    """Recalcular ahora la demanda y los puntos de reorden (sin pasar por la cola)"""
+    conn = pool.acquire()
+    try:
+        start = time.perf_counter()
+        try:
+            series = refresh_reorder_points(conn.cursor())
+        except ForecastUnavailable as e:
+            conn.rollback()
+            raise click.ClickException(str(e))
+        conn.commit()
+    finally:
+        pool.release(conn)
+    click.echo(f'{series} series producto/ubicación calculadas en {time.perf_counter() - start:.2f} s')
+
+@app.cli.command('rebuild-cost-layers')
+@click.option('--workers', default=os.cpu_count() or 1, type=int, help='Procesos entre los que repartir los productos')
+def rebuild_cost_layers_command(workers):
+    """Recalcular capas FIFO, costo promedio y costo de ventas desde movimientos_costo"""
+    conn = pool.acquire()
+    try:
+        start = time.perf_counter()
+        series = rebuild_cost_layers(conn, DATABASE_PATH, workers)
+    finally:
+        pool.release(conn)
+    click.echo(f'{series} series producto/ubicación recalculadas en {time.perf_counter() - start:.2f} s')
+
+@app.cli.command('verify-cost-layers')
+@click.option('--fix', is_flag=True, help='Registrar ajustes para las diferencias')
+def verify_cost_layers_command(fix):
+    """Comparar las cantidades con costo con inventario y reportar diferencias"""
+    conn = pool.acquire()
+    try:
+        cursor = conn.cursor()
+        drift = verify_cost_layers(cursor)
+        for producto_id, ubicacion_id, inventario, costeado in drift:
+            click.echo(f'Producto {producto_id} en ubicación {ubicacion_id}: inventario {inventario}, con costo {costeado}')
+        if not drift:
+            click.echo('Las capas de costo coinciden con inventario')
+        elif fix:
+            adjust_cost_layers(cursor, drift)
+            conn.commit()
+            click.echo(f'{len(drift)} ajustes de costo registrados')
+    finally:
+        pool.release(conn)
+    if drift and not fix:
+        raise SystemExit(1)
+
+@app.cli.command('run-jobs')
+@click.option('--limit', default=None, type=int, help='Máximo de trabajos a ejecutar')
+def run_jobs_command(limit):
+    """Ejecutar ahora los trabajos pendientes de la cola"""
+    conn = pool.acquire()
+    try:
+        done, failed = run_pending(conn, HANDLERS, limit)
+    finally:
+        pool.release(conn)
+    click.echo(f'{done} trabajos completados, {failed} con error')
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Verificar con EXPLAIN QUERY PLAN que las consultas calientes usan su índice"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    failures = check_query_plans(conn)
+    conn.close()
+    for name, index, plan in failures:
+        click.echo(f'{name}: no usa {index} ({" / ".join(plan)})')
+    if failures:
+        raise SystemExit(1)
+    click.echo('Todas las consultas calientes usan su índice')
 
-# Inicializar base de datos al iniciar la aplicación
+@app.cli.command('optimize-db')
+def optimize_db_command():
+    """ANALYZE y PRAGMA optimize (por ejemplo después de una carga masiva)"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    optimize(conn, analyze=True)
+    conn.close()
+    click.echo('Estadísticas del planificador actualizadas')
+
+@app.cli.command('seed-db')
+def seed_db_command():
+    """Cargar los datos iniciales (usuarios de demostración, catálogo e inventario)"""
+    if insert_initial_data():
+        click.echo('Datos iniciales cargados')
+    else:
+        click.echo('La base ya tiene usuarios; no se cargaron datos iniciales')
+
+# Crear o actualizar el esquema al iniciar la aplicación (los datos iniciales: flask --app app seed-db)
 init_database()
-insert_initial_data()
+
+job_workers = JobWorkers(pool, HANDLERS, workers=JOB_WORKERS)
+job_workers.init_app(app)
+
+anchorer = Anchorer(pool)
+anchorer.init_app(app)
+
+inventory_snapshots = InventorySnapshots(pool)
+inventory_snapshots.init_app(app)
+
+response_cache = ResponseCache(
+    SQLiteBackend(CACHE_PATH) if CACHE_BACKEND == 'sqlite' else MemoryBackend(),
+    ttl=CACHE_TTL
+)
 
 # Rutas de autenticación
 @app.route('/api/auth/login', methods=['POST'])
@@ -297,21 +610,32 @@ def login():
         if not username or not password:
             return jsonify({'error': 'Username y password son requeridos'}), 400
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT id, username, email, password_hash, rol, nombre, activo
-            FROM usuarios 
-            WHERE username = ? AND activo = 1
+            SELECT u.id, u.username, u.email, u.password_hash, u.rol, u.nombre, u.activo, c.version AS version_acceso
+            FROM usuarios u
+            LEFT JOIN cambios_acceso c ON c.usuario_id = u.id
+            WHERE u.username = ? AND u.activo = 1
         ''', (username,))
         
         user = cursor.fetchone()
-        conn.close()
+        # La conexión vuelve al pool mientras se verifica la contraseña
+        release_db(None)
         
-        if user and check_password_hash(user['password_hash'], password):
-            access_token = create_access_token(identity=user['id'])
+        valid, new_hash = password_hasher.verify(user['password_hash'], password) if user else (False, None)
+        
+        if valid:
+            if new_hash:
+                # Parámetros del hash desactualizados: se guarda el recalculado con los actuales
+                conn = get_db()
+                conn.execute('UPDATE usuarios SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
+                conn.commit()
+            
+            # Rol y versión de acceso en el token: las rutas autorizan sin consultar usuarios
+            access_token = create_access_token(identity=user['id'],
+                                               additional_claims=access_claims(user['rol'], user['version_acceso']))
             
             return jsonify({
                 'message': 'Login exitoso',
@@ -327,6 +651,8 @@ def login():
         else:
             return jsonify({'error': 'Credenciales inválidas'}), 401
             
+    except HasherBusy:
+        return jsonify({'error': 'Servicio ocupado, reintente en unos segundos'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -337,7 +663,6 @@ def register():
         username = data.get('username')
         email = data.get('email')
         password = data.get('password')
-        rol = data.get('rol', 'cliente')
         nombre = data.get('nombre', '')
         telefono = data.get('telefono', '')
         direccion = data.get('direccion', '')
@@ -345,9 +670,15 @@ def register():
         if not username or not email or not password:
             return jsonify({'error': 'Username, email y password son requeridos'}), 400
         
-        password_hash = generate_password_hash(password)
+        # El rol viaja en el token y @require_role confía en él: el registro abierto solo crea
+        # clientes, los demás roles los asigna un administrador con /users/<id>/access
+        rol = data.get('rol') or 'cliente'
+        if rol != 'cliente':
+            return jsonify({'error': 'Solo un administrador puede asignar otro rol'}), 403
         
-        conn = sqlite3.connect(DATABASE_PATH)
+        password_hash = password_hasher.hash(password)
+        
+        conn = get_db()
         cursor = conn.cursor()
         
         try:
@@ -357,12 +688,10 @@ def register():
             ''', (username, email, password_hash, rol, nombre, telefono, direccion))
             
             conn.commit()
-            conn.close()
             
             return jsonify({'message': 'Usuario registrado exitosamente'}), 201
             
         except sqlite3.IntegrityError as e:
-            conn.close()
             if 'username' in str(e):
                 return jsonify({'error': 'El nombre de usuario ya existe'}), 400
             elif 'email' in str(e):
@@ -370,6 +699,8 @@ def register():
             else:
                 return jsonify({'error': 'Error de integridad de datos'}), 400
                 
+    except HasherBusy:
+        return jsonify({'error': 'Servicio ocupado, reintente en unos segundos'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -379,8 +710,7 @@ def get_profile():
     try:
         user_id = get_jwt_identity()
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -390,7 +720,6 @@ def get_profile():
         ''', (user_id,))
         
         user = cursor.fetchone()
-        conn.close()
         
         if user:
             return jsonify({
@@ -411,35 +740,155 @@ def get_profile():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/auth/users/<int:user_id>/access', methods=['PUT'])
+@require_role('administrador')
+def update_user_access(user_id):
+    """Cambiar el rol o el estado de un usuario; sus tokens anteriores quedan revocados"""
+    try:
+        data = request.get_json() or {}
+        rol = data.get('rol')
+        activo = data.get('activo')
+        
+        if rol is None and activo is None:
+            return jsonify({'error': 'Se requiere rol o activo'}), 400
+        if rol is not None and rol not in ROLES:
+            return jsonify({'error': f'Rol inválido: {rol}'}), 400
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        # El cambio y su versión de acceso en la misma transacción
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT id, rol, activo FROM usuarios WHERE id = ?', (user_id,))
+        user = cursor.fetchone()
+        if not user:
+            conn.rollback()
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        rol = user['rol'] if rol is None else rol
+        activo = bool(user['activo']) if activo is None else bool(activo)
+        version = time.time()
+        cursor.execute('UPDATE usuarios SET rol = ?, activo = ? WHERE id = ?', (rol, activo, user_id))
+        cursor.execute('''
+            INSERT INTO cambios_acceso (usuario_id, version) VALUES (?, ?)
+            ON CONFLICT (usuario_id) DO UPDATE SET version = excluded.version
+        ''', (user_id, version))
+        conn.commit()
+        revoked_users.changed(user_id, version)
+        
+        return jsonify({
+            'message': 'Acceso actualizado',
+            'user': {'id': user_id, 'rol': rol, 'activo': activo}
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Continúa en el siguiente mensaje...
 
 
+# Paginación por cursor (keyset): el cursor codifica la clave de orden de la
+# última fila devuelta, así cada página es un rango del índice y no un OFFSET.
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """[clave de orden, id] de ?cursor=; ValueError si no es válido"""
+    if not cursor:
+        return None
+    values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    # Los valores van a la consulta como parámetros: una lista u objeto haría fallar sqlite3 con 500
+    if (not isinstance(values, list) or len(values) != 2
+            or not isinstance(values[0], (str, int, float)) or isinstance(values[0], bool)
+            or not isinstance(values[1], int) or isinstance(values[1], bool)):
+        raise ValueError('Cursor inválido')
+    return values
+
+def page_limit(default=None):
+    limit = request.args.get('limit', default, type=int)
+    if limit is None:
+        return None
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def next_page(rows, limit, key):
+    """Recortar la fila extra pedida con LIMIT n+1 y calcular next_cursor"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
+
 # Rutas de productos
+# Consulta base del catálogo: el stock total sale de stock_totals (mantenida
+# por triggers), sin agregar inventario en cada lectura.
+# Con `match` se une el índice FTS y se expone su puntuación como search_rank.
+def catalog_query(product_id=None, match=None):
+    search_columns = ''
+    search_join = ''
+    params = []
+    if match:
+        search_columns = ', f.search_rank'
+        search_join = f'''
+        JOIN (
+            SELECT rowid as producto_id, {SEARCH_RANK} as search_rank
+            FROM productos_fts
+            WHERE productos_fts MATCH ?
+        ) f ON f.producto_id = p.id'''
+        params.append(match)
+    
+    query = f'''
+        SELECT p.*, c.nombre as categoria_nombre,
+               COALESCE(s.stock_total, 0) as stock_total{search_columns}
+        FROM productos p{search_join}
+        LEFT JOIN categorias c ON p.categoria_id = c.id
+        LEFT JOIN stock_totals s ON s.producto_id = p.id
+        WHERE p.activo = 1
+    '''
+    
+    if product_id is not None:
+        query += ' AND p.id = ?'
+        params.append(product_id)
+    
+    return query, params
+
+# Campos públicos de un producto (sin search_rank ni columnas internas)
+product_mapper = RowMapper(('id', 'codigo', 'nombre', 'descripcion', 'categoria_id', 'categoria_nombre',
+                            'precio_unitario', 'precio_venta', 'unidad_medida', 'stock_minimo', 'stock_total',
+                            'imagen_url', 'disponible_venta', 'fecha_creacion'))
+transaction_mapper = RowMapper()
+order_mapper = RowMapper()
+stock_mapper = RowMapper()
+reorder_mapper = RowMapper()
+valuation_mapper = RowMapper()
+cost_mapper = RowMapper()
+
 @app.route('/api/products', methods=['GET'])
+@conditional('productos', 'inventario', 'categorias')
+@response_cache.cached('products', 'inventory')
 def get_products():
     try:
         search = request.args.get('search', '')
         category_id = request.args.get('category_id', '')
         available_only = request.args.get('available_only', 'false').lower() == 'true'
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        try:
+            cursor_values = decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        limit = page_limit()
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({'error': 'Formato inválido'}), 400
         
-        query = '''
-            SELECT p.*, c.nombre as categoria_nombre,
-                   COALESCE(SUM(i.cantidad), 0) as stock_total
-            FROM productos p
-            LEFT JOIN categorias c ON p.categoria_id = c.id
-            LEFT JOIN inventario i ON p.id = i.producto_id
-            WHERE p.activo = 1
-        '''
-        params = []
+        conn = get_db()
+        cursor = conn.cursor()
         
-        if search:
-            query += ' AND (p.codigo LIKE ? OR p.nombre LIKE ? OR p.descripcion LIKE ?)'
-            search_param = f'%{search}%'
-            params.extend([search_param, search_param, search_param])
+        # Búsqueda por índice FTS (prefijos, ordenada por relevancia bm25)
+        match = fts_query(search)
+        query, params = catalog_query(match=match)
         
         if category_id:
             query += ' AND p.categoria_id = ?'
@@ -448,75 +897,41 @@ def get_products():
         if available_only:
             query += ' AND p.disponible_venta = 1'
         
-        query += ' GROUP BY p.id ORDER BY p.nombre'
+        sort_column = 'f.search_rank' if match else 'p.nombre'
+        
+        if cursor_values:
+            query += f' AND ({sort_column}, p.id) > (?, ?)'
+            params.extend(cursor_values)
+        
+        query += f' ORDER BY {sort_column}, p.id'
+        
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit + 1)
         
         cursor.execute(query, params)
-        products = cursor.fetchall()
-        conn.close()
+        sort_key = 'search_rank' if match else 'nombre'
+        products, next_cursor = next_page(cursor.fetchall(), limit, lambda row: (row[sort_key], row['id']))
         
-        products_list = []
-        for product in products:
-            products_list.append({
-                'id': product['id'],
-                'codigo': product['codigo'],
-                'nombre': product['nombre'],
-                'descripcion': product['descripcion'],
-                'categoria_id': product['categoria_id'],
-                'categoria_nombre': product['categoria_nombre'],
-                'precio_unitario': product['precio_unitario'],
-                'precio_venta': product['precio_venta'],
-                'unidad_medida': product['unidad_medida'],
-                'stock_minimo': product['stock_minimo'],
-                'stock_total': product['stock_total'],
-                'imagen_url': product['imagen_url'],
-                'disponible_venta': product['disponible_venta'],
-                'fecha_creacion': product['fecha_creacion']
-            })
-        
-        return jsonify({'products': products_list}), 200
+        return json_response({'products': product_mapper.serialize(products, fmt), 'next_cursor': next_cursor})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
+@conditional('productos', 'inventario', 'categorias')
+@response_cache.cached('products', 'inventory')
 def get_product(product_id):
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT p.*, c.nombre as categoria_nombre,
-                   COALESCE(SUM(i.cantidad), 0) as stock_total
-            FROM productos p
-            LEFT JOIN categorias c ON p.categoria_id = c.id
-            LEFT JOIN inventario i ON p.id = i.producto_id
-            WHERE p.id = ? AND p.activo = 1
-            GROUP BY p.id
-        ''', (product_id,))
+        cursor.execute(*catalog_query(product_id))
         
         product = cursor.fetchone()
-        conn.close()
         
         if product:
-            return jsonify({
-                'product': {
-                    'id': product['id'],
-                    'codigo': product['codigo'],
-                    'nombre': product['nombre'],
-                    'descripcion': product['descripcion'],
-                    'categoria_id': product['categoria_id'],
-                    'categoria_nombre': product['categoria_nombre'],
-                    'precio_unitario': product['precio_unitario'],
-                    'precio_venta': product['precio_venta'],
-                    'unidad_medida': product['unidad_medida'],
-                    'stock_minimo': product['stock_minimo'],
-                    'stock_total': product['stock_total'],
-                    'imagen_url': product['imagen_url'],
-                    'disponible_venta': product['disponible_venta'],
-                    'fecha_creacion': product['fecha_creacion']
-                }
-            }), 200
+            return json_response({'product': product_mapper.one(product)})
         else:
             return jsonify({'error': 'Producto no encontrado'}), 404
             
@@ -524,23 +939,14 @@ def get_product(product_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/products', methods=['POST'])
-@jwt_required()
+@require_role(*STAFF_ROLES)
 def create_product():
     try:
-        user_id = get_jwt_identity()
         data = request.get_json()
         
-        # Verificar que el usuario sea administrador o empleado
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT rol FROM usuarios WHERE id = ?', (user_id,))
-        user_role = cursor.fetchone()
-        
-        if not user_role or user_role[0] not in ['administrador', 'empleado']:
-            conn.close()
-            return jsonify({'error': 'Permisos insuficientes'}), 403
-        
         # Crear producto
         cursor.execute('''
             INSERT INTO productos (codigo, nombre, descripcion, categoria_id, precio_unitario, precio_venta, unidad_medida, stock_minimo, imagen_url, disponible_venta)
@@ -560,7 +966,7 @@ def create_product():
         
         product_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        response_cache.invalidate('products')
         
         return jsonify({
             'message': 'Producto creado exitosamente',
@@ -573,11 +979,26 @@ def create_product():
         return jsonify({'error': str(e)}), 500
 
 # Rutas de inventario
+def low_stock_products(cursor, limit=None):
+    query = '''
+        SELECT p.id, p.codigo, p.nombre, p.stock_minimo, s.stock_total
+        FROM stock_totals s
+        JOIN productos p ON s.producto_id = p.id
+        WHERE s.bajo_stock = 1
+        ORDER BY s.stock_total - p.stock_minimo, p.id
+    '''
+    params = []
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
 @app.route('/api/inventory/summary', methods=['GET'])
+@conditional('productos', 'inventario', 'ubicaciones', 'costos_inventario')
 def get_inventory_summary():
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cursor = conn.cursor()
         
         # Resumen general
@@ -588,48 +1009,49 @@ def get_inventory_summary():
         total_ubicaciones = cursor.fetchone()['total']
         
         cursor.execute('''
-            SELECT COALESCE(SUM(p.precio_venta * i.cantidad), 0) as valor_total
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
+            SELECT COALESCE(SUM(p.precio_venta * s.stock_total), 0) as valor_total
+            FROM stock_totals s
+            JOIN productos p ON s.producto_id = p.id
             WHERE p.activo = 1
         ''')
         valor_total = cursor.fetchone()['valor_total']
         
-        # Productos con stock bajo
+        # Valor al costo desde las capas de costo (una fila por producto y ubicación)
         cursor.execute('''
-            SELECT COUNT(*) as bajo_stock
-            FROM (
-                SELECT p.id, COALESCE(SUM(i.cantidad), 0) as stock_total
-                FROM productos p
-                LEFT JOIN inventario i ON p.id = i.producto_id
-                WHERE p.activo = 1
-                GROUP BY p.id
-                HAVING stock_total <= p.stock_minimo AND p.stock_minimo > 0
-            )
+            SELECT COALESCE(SUM(c.valor_fifo), 0) as valor_fifo,
+                   COALESCE(SUM(MAX(c.cantidad, 0) * c.costo_promedio), 0) as valor_promedio
+            FROM costos_inventario c
+            JOIN productos p ON c.producto_id = p.id
+            WHERE p.activo = 1
         ''')
+        valor_costo = cursor.fetchone()
+        
+        # Productos con stock bajo (índice parcial sobre stock_totals.bajo_stock)
+        cursor.execute('SELECT COUNT(*) as bajo_stock FROM stock_totals WHERE bajo_stock = 1')
         productos_bajo_stock = cursor.fetchone()['bajo_stock']
         
+        alertas_stock = low_stock_products(cursor, limit=10)
+        
         # Top productos
         cursor.execute('''
-            SELECT p.id, p.codigo, p.nombre, p.precio_venta, COALESCE(SUM(i.cantidad), 0) as stock_total
-            FROM productos p
-            LEFT JOIN inventario i ON p.id = i.producto_id
+            SELECT p.id, p.codigo, p.nombre, p.precio_venta, s.stock_total
+            FROM stock_totals s
+            JOIN productos p ON s.producto_id = p.id
             WHERE p.activo = 1
-            GROUP BY p.id
-            ORDER BY stock_total DESC
+            ORDER BY s.stock_total DESC
             LIMIT 5
         ''')
         top_productos = cursor.fetchall()
         
-        conn.close()
-        
         return jsonify({
             'summary': {
                 'total_productos': total_productos,
                 'total_ubicaciones': total_ubicaciones,
                 'valor_total': float(valor_total) if valor_total else 0,
+                'valor_costo_fifo': float(valor_costo['valor_fifo']),
+                'valor_costo_promedio': float(valor_costo['valor_promedio']),
                 'productos_bajo_stock': productos_bajo_stock,
-                'alertas_stock': []
+                'alertas_stock': [dict(row) for row in alertas_stock]
             },
             'top_productos': [dict(row) for row in top_productos]
         }), 200
@@ -637,11 +1059,123 @@ def get_inventory_summary():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/inventory/low-stock', methods=['GET'])
+@conditional('productos', 'inventario')
+def get_low_stock():
+    try:
+        conn = get_db()
+        products = low_stock_products(conn.cursor())
+        
+        return jsonify({
+            'products': [dict(row) for row in products]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/reorder-points', methods=['GET'])
+@require_role(*STAFF_ROLES)
+def get_reorder_points():
+    """Demanda pronosticada y punto de reorden por producto y ubicación, con el stock actual"""
+    try:
+        try:
+            after = decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        limit = page_limit(default=100)
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({'error': 'Formato inválido'}), 400
+        
+        rows = reorder_points(get_db().cursor(), after, limit + 1 if limit else None,
+                              below=request.args.get('below') in ('1', 'true'),
+                              producto_id=request.args.get('producto_id', type=int),
+                              ubicacion_id=request.args.get('ubicacion_id', type=int))
+        rows, next_cursor = next_page(rows, limit, lambda row: (row['producto_id'], row['ubicacion_id']))
+        
+        return json_response({
+            'reorder_points': reorder_mapper.serialize(rows, fmt),
+            'next_cursor': next_cursor
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/reorder-points/refresh', methods=['POST'])
+@require_role('administrador')
+def refresh_reorder_points_route():
+    """Encolar el recálculo; la demanda se agrupa por días completos, así que basta uno por día"""
+    try:
+        if not FORECAST_AVAILABLE:
+            return jsonify({'error': 'El pronóstico de demanda requiere numpy'}), 503
+        conn = get_db()
+        cursor = conn.cursor()
+        queued = enqueue(cursor, 'pronostico_reposicion', {},
+                         clave=f"pronostico_reposicion-{time.strftime('%Y-%m-%d', time.gmtime())}")
+        conn.commit()
+        job_workers.notify()
+        
+        return jsonify({
+            'message': 'Recálculo encolado' if queued else 'El recálculo de hoy ya estaba encolado',
+            'queued': queued
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/valuation', methods=['GET'])
+@require_role(*STAFF_ROLES)
+def get_inventory_valuation():
+    """Valor del inventario al costo por producto, FIFO y promedio ponderado"""
+    try:
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({'error': 'Formato inválido'}), 400
+        
+        rows = inventory_valuation(get_db().cursor(), request.args.get('ubicacion_id', type=int))
+        
+        return json_response({
+            'valor_fifo': sum(row['valor_fifo'] for row in rows),
+            'valor_promedio': sum(row['valor_promedio'] for row in rows),
+            'products': valuation_mapper.serialize(rows, fmt)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/cost-of-sales', methods=['GET'])
+@require_role(*STAFF_ROLES)
+def get_cost_of_sales():
+    """Costo de ventas por producto (FIFO y promedio), acumulado o entre desde/hasta (días completos)"""
+    try:
+        try:
+            date_range = parse_date_range(request.args.get('desde'), request.args.get('hasta'))
+        except ValueError:
+            return jsonify({'error': 'Fecha inválida, use el formato AAAA-MM-DD'}), 400
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({'error': 'Formato inválido'}), 400
+        
+        rows = cost_of_sales(get_db().cursor(), date_range, request.args.get('ubicacion_id', type=int))
+        
+        return json_response({
+            'costo_fifo': sum(row['costo_fifo'] for row in rows),
+            'costo_promedio': sum(row['costo_promedio'] for row in rows),
+            'products': cost_mapper.serialize(rows, fmt)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/inventory/locations', methods=['GET'])
+@conditional('ubicaciones')
+@response_cache.cached('locations')
 def get_locations():
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -652,7 +1186,6 @@ def get_locations():
         ''')
         
         locations = cursor.fetchall()
-        conn.close()
         
         return jsonify({
             'locations': [dict(row) for row in locations]
@@ -661,16 +1194,61 @@ def get_locations():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/inventory/as-of', methods=['GET'])
+@require_role(*STAFF_ROLES)
+@conditional('productos', 'inventario', 'ubicaciones')
+def get_inventory_as_of():
+    """Stock por producto y ubicación a una fecha: la foto anterior más los movimientos hasta esa fecha"""
+    try:
+        date = request.args.get('date')
+        if not date:
+            return jsonify({'error': 'El parámetro date es requerido'}), 400
+        try:
+            date_bound = parse_date_range(None, date)[0]
+        except ValueError:
+            return jsonify({'error': 'Fecha inválida, use el formato AAAA-MM-DD'}), 400
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({'error': 'Formato inválido'}), 400
+        
+        cursor = get_db().cursor()
+        try:
+            rows, snapshot, replayed = stock_as_of(cursor, date_bound,
+                                                   request.args.get('producto_id', type=int),
+                                                   request.args.get('ubicacion_id', type=int))
+        except NoHistory:
+            return jsonify({'error': f'No hay historial de inventario anterior a {date}'}), 404
+        
+        return json_response({
+            'date': date,
+            'snapshot': {'id': snapshot['id'], 'fecha': snapshot['fecha']},
+            'movimientos': replayed,
+            'inventory': stock_mapper.serialize(rows, fmt)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Rutas de transacciones
 @app.route('/api/transactions', methods=['GET'])
 @jwt_required()
 def get_transactions():
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        try:
+            cursor_values = decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        limit = page_limit(default=50)
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({'error': 'Formato inválido'}), 400
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        query = '''
             SELECT t.*, p.codigo as producto_codigo, p.nombre as producto_nombre,
                    u.nombre as ubicacion_nombre, tt.nombre as tipo_nombre,
                    usr.username as usuario_nombre
@@ -679,16 +1257,23 @@ def get_transactions():
             JOIN ubicaciones u ON t.ubicacion_id = u.id
             JOIN tipos_transaccion tt ON t.tipo_transaccion_id = tt.id
             JOIN usuarios usr ON t.usuario_id = usr.id
-            ORDER BY t.fecha_creacion DESC
-            LIMIT 50
-        ''')
+        '''
+        params = []
         
-        transactions = cursor.fetchall()
-        conn.close()
+        if cursor_values:
+            query += ' WHERE (t.fecha_creacion, t.id) < (?, ?)'
+            params.extend(cursor_values)
         
-        return jsonify({
-            'transactions': [dict(row) for row in transactions]
-        }), 200
+        query += ' ORDER BY t.fecha_creacion DESC, t.id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        cursor.execute(query, params)
+        transactions, next_cursor = next_page(cursor.fetchall(), limit, lambda row: (row['fecha_creacion'], row['id']))
+        
+        return json_response({
+            'transactions': transaction_mapper.serialize(transactions, fmt),
+            'next_cursor': next_cursor
+        })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -700,7 +1285,7 @@ def create_transaction():
         user_id = get_jwt_identity()
         data = request.get_json()
         
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Crear transacción
@@ -746,13 +1331,20 @@ def create_transaction():
                     WHERE producto_id = ? AND ubicacion_id = ?
                 ''', (nueva_cantidad, data.get('producto_id'), data.get('ubicacion_id')))
             else:
+                cantidad_cambio = max(0, cantidad_cambio)
                 cursor.execute('''
                     INSERT INTO inventario (producto_id, ubicacion_id, cantidad)
                     VALUES (?, ?, ?)
-                ''', (data.get('producto_id'), data.get('ubicacion_id'), max(0, cantidad_cambio)))
+                ''', (data.get('producto_id'), data.get('ubicacion_id'), cantidad_cambio))
+            
+            # Capas de costo: las entradas al precio de la transacción
+            record_movements(cursor, [(data.get('producto_id'), data.get('ubicacion_id'), cantidad_cambio,
+                                       data.get('precio_unitario'), 'transaccion', transaction_id)])
         
+        # Encadenar la fila nueva en la misma transacción
+        extend_chain(cursor)
         conn.commit()
-        conn.close()
+        response_cache.invalidate('inventory')
         
         return jsonify({
             'message': 'Transacción registrada exitosamente',
@@ -762,12 +1354,40 @@ def create_transaction():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/transactions/batch', methods=['POST'])
+@jwt_required()
+def create_transactions_batch():
+    try:
+        user_id = get_jwt_identity()
+        
+        try:
+            rows = parse_batch_payload(request)
+        except BatchError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Todo el lote en una transacción: executemany + UPSERT de inventario
+        results = ingest_transactions(get_db(), rows, user_id)
+        created = sum(1 for result in results if 'transaction_id' in result)
+        if created:
+            response_cache.invalidate('inventory')
+        
+        return jsonify({
+            'message': f'{created} de {len(results)} transacciones registradas',
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }), 201 if created else 400
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Rutas de categorías
 @app.route('/api/categories', methods=['GET'])
+@conditional('categorias')
+@response_cache.cached('categories')
 def get_categories():
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -778,7 +1398,6 @@ def get_categories():
         ''')
         
         categories = cursor.fetchall()
-        conn.close()
         
         return jsonify({
             'categories': [dict(row) for row in categories]
@@ -794,10 +1413,34 @@ def create_order():
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
+        items = data.get('items', [])
+        
+        strategy = data.get('estrategia_asignacion', ALLOCATION_STRATEGY)
+        if strategy not in STRATEGIES:
+            return jsonify({'error': f'Estrategia de asignación inválida: {strategy}'}), 400
+        try:
+            cantidades = merge_items(items)
+            ubicacion_preferida = preferred_location(data.get('ubicacion_preferida', DEFAULT_LOCATION_ID))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
+        # Bloqueo de escritura desde el inicio: la reserva de stock no puede competir con otro pedido
+        cursor.execute('BEGIN IMMEDIATE')
+        
+        try:
+            asignaciones = allocate_stock(cursor, cantidades, strategy, ubicacion_preferida)
+        except InsufficientStock as e:
+            conn.rollback()
+            return jsonify({
+                'error': str(e),
+                'producto_id': e.producto_id,
+                'solicitado': e.solicitado,
+                'disponible': e.disponible
+            }), 409
+        
         # Generar número de pedido único
         numero_pedido = f"PED-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
         
@@ -819,32 +1462,33 @@ def create_order():
         pedido_id = cursor.lastrowid
         
         # Crear detalles del pedido
-        for item in data.get('items', []):
-            cursor.execute('''
-                INSERT INTO detalle_pedidos (pedido_id, producto_id, cantidad, precio_unitario, subtotal)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                pedido_id,
-                item.get('producto_id'),
-                item.get('cantidad'),
-                item.get('precio_unitario'),
-                item.get('subtotal')
-            ))
-            
-            # Actualizar inventario (reducir stock)
-            cursor.execute('''
-                UPDATE inventario 
-                SET cantidad = cantidad - ?, fecha_actualizacion = CURRENT_TIMESTAMP
-                WHERE producto_id = ? AND ubicacion_id = 1
-            ''', (item.get('cantidad'), item.get('producto_id')))
+        cursor.executemany('''
+            INSERT INTO detalle_pedidos (pedido_id, producto_id, cantidad, precio_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(
+            pedido_id,
+            item.get('producto_id'),
+            item.get('cantidad'),
+            item.get('precio_unitario'),
+            item.get('subtotal')
+        ) for item in items])
+        
+        # Costo de lo vendido, por ubicación de origen
+        record_movements(cursor, [(a['producto_id'], a['ubicacion_id'], -a['cantidad'], None, 'pedido', pedido_id)
+                                  for a in asignaciones])
+        
+        enqueue(cursor, 'alerta_stock', {'pedido_id': pedido_id, 'productos': list(cantidades)},
+                clave=f'pedido-{pedido_id}-alerta_stock')
         
         conn.commit()
-        conn.close()
+        response_cache.invalidate('inventory')
+        job_workers.notify()
         
         return jsonify({
             'message': 'Pedido creado exitosamente',
             'pedido_id': pedido_id,
-            'numero_pedido': numero_pedido
+            'numero_pedido': numero_pedido,
+            'asignaciones': asignaciones
         }), 201
         
     except Exception as e:
@@ -856,32 +1500,156 @@ def get_user_orders(user_id):
     try:
         current_user_id = get_jwt_identity()
         
+        try:
+            cursor_values = decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        limit = page_limit()
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({'error': 'Formato inválido'}), 400
+        try:
+            expand = parse_expand(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Verificar que el usuario solo pueda ver sus propios pedidos (excepto admin/empleado)
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        if current_role() not in STAFF_ROLES and current_user_id != user_id:
+            return jsonify({'error': 'Permisos insuficientes'}), 403
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT rol FROM usuarios WHERE id = ?', (current_user_id,))
-        user_role = cursor.fetchone()
+        query = '''
+            SELECT p.*, u.nombre as cliente_nombre
+            FROM pedidos p
+            JOIN usuarios u ON p.cliente_id = u.id
+            WHERE p.cliente_id = ?
+        '''
+        params = [user_id]
         
-        if user_role and user_role['rol'] not in ['administrador', 'empleado'] and current_user_id != user_id:
-            conn.close()
-            return jsonify({'error': 'Permisos insuficientes'}), 403
+        if cursor_values:
+            query += ' AND (p.fecha_pedido, p.id) < (?, ?)'
+            params.extend(cursor_values)
+        
+        query += ' ORDER BY p.fecha_pedido DESC, p.id DESC'
+        
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit + 1)
+        
+        cursor.execute(query, params)
+        orders, next_cursor = next_page(cursor.fetchall(), limit, lambda row: (row['fecha_pedido'], row['id']))
+        
+        # Renglones y pagos de toda la página en una consulta por relación
+        payload = expand_orders(cursor, order_mapper.serialize(orders, fmt), [row['id'] for row in orders], expand, fmt)
+        
+        return json_response({
+            'orders': payload,
+            'next_cursor': next_cursor
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/orders', methods=['GET'])
+@require_role(*STAFF_ROLES)
+def get_orders():
+    """Todos los pedidos (empleados y administradores), con filtros por estado, cliente y fechas"""
+    try:
+        try:
+            cursor_values = decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        limit = page_limit(default=50)
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({'error': 'Formato inválido'}), 400
+        try:
+            expand = parse_expand(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            date_range = parse_date_range(request.args.get('desde'), request.args.get('hasta'))
+        except ValueError:
+            return jsonify({'error': 'Fecha inválida, use el formato AAAA-MM-DD'}), 400
+        estado = request.args.get('estado', '')
+        cliente_id = request.args.get('cliente_id', type=int)
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        # Cada filtro tiene su índice: (estado, fecha_pedido, id), (cliente_id, fecha_pedido, id)
+        # o (fecha_pedido, id) para el rango de fechas solo
+        conditions = []
+        params = []
+        if estado:
+            conditions.append('p.estado = ?')
+            params.append(estado)
+        if cliente_id:
+            conditions.append('p.cliente_id = ?')
+            params.append(cliente_id)
+        for op, value in date_range:
+            conditions.append(f'p.fecha_pedido {op} ?')
+            params.append(value)
+        if cursor_values:
+            conditions.append('(p.fecha_pedido, p.id) < (?, ?)')
+            params.extend(cursor_values)
+        
+        query = '''
+            SELECT p.*, u.nombre as cliente_nombre
+            FROM pedidos p
+            JOIN usuarios u ON p.cliente_id = u.id
+        '''
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY p.fecha_pedido DESC, p.id DESC'
+        
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit + 1)
+        
+        cursor.execute(query, params)
+        orders, next_cursor = next_page(cursor.fetchall(), limit, lambda row: (row['fecha_pedido'], row['id']))
+        payload = expand_orders(cursor, order_mapper.serialize(orders, fmt), [row['id'] for row in orders], expand, fmt)
+        
+        return json_response({
+            'orders': payload,
+            'next_cursor': next_cursor
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/orders/<int:order_id>', methods=['GET'])
+@jwt_required()
+def get_order(order_id):
+    """Un pedido con sus renglones y pagos"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        conn = get_db()
+        cursor = conn.cursor()
         
         cursor.execute('''
             SELECT p.*, u.nombre as cliente_nombre
             FROM pedidos p
             JOIN usuarios u ON p.cliente_id = u.id
-            WHERE p.cliente_id = ?
-            ORDER BY p.fecha_pedido DESC
-        ''')
+            WHERE p.id = ?
+        ''', (order_id,))
+        order = cursor.fetchone()
         
-        orders = cursor.fetchall()
-        conn.close()
+        if not order:
+            return jsonify({'error': 'Pedido no encontrado'}), 404
         
-        return jsonify({
-            'orders': [dict(row) for row in orders]
-        }), 200
+        if current_role() not in STAFF_ROLES and current_user_id != order['cliente_id']:
+            return jsonify({'error': 'Permisos insuficientes'}), 403
+        
+        payload = expand_orders(cursor, [order_mapper.one(order)], [order['id']], EXPANSIONS)
+        
+        return json_response({'order': payload[0]})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -893,9 +1661,13 @@ def create_payment():
     try:
         data = request.get_json()
         
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
+        cursor.execute('SELECT id FROM pedidos WHERE id = ?', (data.get('pedido_id'),))
+        if cursor.fetchone() is None:
+            return jsonify({'error': 'Pedido no encontrado'}), 404
+        
         # Generar código QR para pagos QR
         qr_code = None
         if data.get('metodo_pago') == 'qr':
@@ -914,15 +1686,11 @@ def create_payment():
         
         payment_id = cursor.lastrowid
         
-        # Actualizar estado del pedido
-        cursor.execute('''
-            UPDATE pedidos 
-            SET estado = 'pagado'
-            WHERE id = ?
-        ''', (data.get('pedido_id'),))
+        # El pedido pasa a 'pagado' desde la cola, en la misma transacción que el pago queda registrado
+        enqueue(cursor, 'pedido_pagado', {'pedido_id': data.get('pedido_id')}, clave=f'pago-{payment_id}')
         
         conn.commit()
-        conn.close()
+        job_workers.notify()
         
         response_data = {
             'message': 'Pago procesado exitosamente',
@@ -938,6 +1706,7 @@ def create_payment():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/payments/methods', methods=['GET'])
+@response_cache.cached('payments', ttl=3600)
 def get_payment_methods():
     return jsonify({
         'methods': [
@@ -948,27 +1717,175 @@ def get_payment_methods():
         ]
     }), 200
 
+# Exportación en streaming (CSV / NDJSON, opcionalmente gzip)
+@app.route('/api/export/<kind>', methods=['GET'])
+@require_role(*STAFF_ROLES)
+def export_data(kind):
+    try:
+        if kind not in EXPORTS:
+            return jsonify({'error': 'Exportación no encontrada'}), 404
+        
+        fmt = request.args.get('format', 'csv')
+        if fmt not in FORMATS:
+            return jsonify({'error': 'Formato inválido (csv o ndjson)'}), 400
+        
+        try:
+            date_range = parse_date_range(request.args.get('desde'), request.args.get('hasta'))
+        except ValueError:
+            return jsonify({'error': 'Fecha inválida, use el formato AAAA-MM-DD'}), 400
+        
+        compress = request.args.get('gzip', '').lower() in ('1', 'true')
+        
+        # El generador usa su propia conexión: la de la petición se devuelve al pool
+        # antes de que termine el streaming
+        def generate():
+            conn = pool.acquire()
+            export_cursor = conn.cursor()
+            try:
+                chunks = stream_export(export_cursor, kind, fmt, date_range)
+                if compress:
+                    yield from gzip_chunks(chunks)
+                else:
+                    for chunk in chunks:
+                        yield chunk.encode('utf-8')
+            finally:
+                export_cursor.close()
+                pool.release(conn)
+        
+        filename = f'{kind}.{fmt}.gz' if compress else f'{kind}.{fmt}'
+        return Response(
+            generate(),
+            mimetype='application/gzip' if compress else FORMATS[fmt],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Estadísticas del pool de conexiones
+@app.route('/api/system/db-pool', methods=['GET'])
+@require_role('administrador')
+def get_db_pool_stats():
+    return jsonify({'pool': pool.stats()}), 200
+
+# Métricas de la caché de respuestas
+@app.route('/api/system/cache', methods=['GET'])
+@require_role('administrador')
+def get_cache_stats():
+    return jsonify({'cache': response_cache.stats()}), 200
+
+# Pool de hash de contraseñas: operaciones en curso, completadas y rechazadas (503)
+@app.route('/api/system/passwords', methods=['GET'])
+@require_role('administrador')
+def get_password_stats():
+    return jsonify({'passwords': password_hasher.stats()}), 200
+
+@app.route('/api/system/jobs', methods=['GET'])
+@require_role('administrador')
+def get_job_stats():
+    try:
+        return jsonify({'queue': queue_stats(get_db().cursor()), 'workers': job_workers.stats()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Ruta de información de blockchain (simulada)
 @app.route('/api/blockchain/network-info', methods=['GET'])
 def get_blockchain_info():
-    return jsonify({
-        'network': {
-            'connected': False,
-            'chain_id': 'N/A',
-            'block_number': 0,
-            'gas_price': '0'
-        },
-        'contract_stats': {
-            'products_count': 0,
-            'transactions_count': 0,
-            'contract_address': 'N/A'
-        },
-        'message': 'Blockchain en modo simulado - Los datos se almacenan localmente'
-    }), 200
+    try:
+        status = chain_status(get_db().cursor())
+        
+        return jsonify({
+            'network': {
+                'connected': True,
+                'chain_id': CHAIN_ID,
+                'block_number': status['block_number'],
+                'gas_price': '0'
+            },
+            'contract_stats': {
+                'products_count': status['anchored_products'],
+                'transactions_count': status['confirmed_transactions'],
+                'pending_transactions': status['pending_transactions'],
+                'contract_address': 'N/A'
+            },
+            'message': 'Blockchain en modo simulado - Los bloques se anclan en la base de datos local'
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/blockchain/transactions/<int:transaction_id>', methods=['GET'])
+def get_transaction_blockchain(transaction_id):
+    try:
+        proof = transaction_proof(get_db().cursor(), transaction_id)
+        if proof is None:
+            return jsonify({'error': 'Transacción no encontrada'}), 404
+        
+        return jsonify({'transaction': proof}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/blockchain/products/<int:product_id>', methods=['GET'])
+def get_product_blockchain(product_id):
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT id, codigo, nombre, blockchain_hash FROM productos WHERE id = ?', (product_id,))
+        product = cursor.fetchone()
+        if not product:
+            return jsonify({'error': 'Producto no encontrado'}), 404
+        
+        # Verificar todos los movimientos anclados del producto contra sus bloques
+        result = verify_transactions(cursor, producto_id=product_id)
+        
+        return jsonify({
+            'product': dict(product),
+            'verification': {
+                'checked': result['checked'],
+                'verified': result['verified'],
+                'failed': result['failed'],
+                'pending': len(result['pending']),
+                'blocks': result['blocks'],
+                'truncated': result['truncated']
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/blockchain/verify', methods=['POST'])
+@jwt_required()
+def verify_blockchain_transactions():
+    try:
+        data = request.get_json(silent=True) or {}
+        transaction_ids = data.get('transaction_ids')
+        desde = data.get('desde')
+        hasta = data.get('hasta')
+        
+        if transaction_ids is not None:
+            if not isinstance(transaction_ids, list) or not all(
+                    isinstance(i, int) and not isinstance(i, bool) for i in transaction_ids):
+                return jsonify({'error': 'transaction_ids debe ser un arreglo de enteros'}), 400
+            if len(transaction_ids) > MAX_VERIFY:
+                return jsonify({'error': f'Se pueden verificar hasta {MAX_VERIFY} transacciones por llamada'}), 400
+        elif not desde and not hasta:
+            return jsonify({'error': 'Se requiere transaction_ids o un rango desde/hasta'}), 400
+        
+        result = verify_transactions(get_db().cursor(), transaction_ids, desde, hasta)
+        result['valid'] = not result['failed']
+        result['cache'] = block_cache.stats()
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
     print("🚀 Iniciando Sistema de Inventario Blockchain")
     print("📊 Dashboard disponible en: http://localhost:5000")
     print("🔗 Blockchain: Modo simulado")
+    # Los hilos de fondo arrancan con la primera petición del proceso que sirve (init_app),
+    # así que con el recargador de debug corren solo en el proceso hijo
     app.run(host='0.0.0.0', port=5000, debug=True)
 
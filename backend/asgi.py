@@ -0,0 +1,49 @@
+# Punto de entrada ASGI: uvicorn asgi:app --host 0.0.0.0 --port 5000 (desde backend/)
+#
+# Las rutas de Flask y sqlite3 son bloqueantes: el puente de shared/asgi.py las ejecuta
+# en un executor acotado (WSGI_WORKERS hilos; el pool tiene además conexiones para las
+# exportaciones y los hilos de fondo, ver DB_POOL_SIZE en app.py) y el bucle de eventos
+# solo espera.
+#
+# /api/system/health se atiende directamente en el bucle con AsyncPool: responde
+# aunque todos los hilos estén ocupados con peticiones lentas.
+#
+# En el arranque (lifespan) se inician el anclaje, las fotos de inventario y la cola de
+# trabajos sin esperar a la primera petición; son las mismas instancias que app.py
+# arranca con init_app, y start() no hace nada si ya corren en el proceso.
+
+import os
+import sys
+
+# El código común (shared/) está en la raíz del repositorio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import WSGI_WORKERS, anchorer, app as flask_app, inventory_snapshots, job_workers, pool
+from db import AsyncPool
+from shared.asgi import AsgiBridge
+
+async_pool = AsyncPool(pool)
+
+
+async def health():
+    try:
+        await async_pool.fetchone('SELECT 1')
+    except Exception as e:
+        return 503, {'status': 'error', 'error': str(e)}
+    return 200, {'status': 'ok', 'database': pool.stats(), 'jobs': job_workers.stats()}
+
+
+def start_background():
+    anchorer.start()
+    inventory_snapshots.start()
+    job_workers.start()
+
+
+def stop_background():
+    anchorer.stop(timeout=5)
+    inventory_snapshots.stop(timeout=5)
+    job_workers.stop(timeout=5)
+
+
+app = AsgiBridge(flask_app, workers=WSGI_WORKERS, routes={'/api/system/health': health},
+                 on_startup=start_background, on_shutdown=stop_background)
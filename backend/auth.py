@@ -0,0 +1,89 @@
+# Autorización sin consultas por petición: el login guarda el rol, el estado y la versión
+# de acceso del usuario como claims del JWT, y @require_role decide con el token.
+#
+# Cambiar el rol o desactivar un usuario registra una versión nueva en cambios_acceso;
+# los tokens emitidos con una versión anterior quedan revocados. Cada proceso guarda en
+# memoria las versiones de los cambios recientes (los de la vida de un token) y las
+# relee como mucho cada REVOCATION_TTL segundos: el proceso que hizo el cambio lo ve al
+# instante y los demás con ese retraso, sin tocar la base en el resto de las peticiones.
+
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+ROLES = ('administrador', 'empleado', 'cliente')
+STAFF_ROLES = ('administrador', 'empleado')
+
+# Segundos entre relecturas de cambios_acceso
+REVOCATION_TTL = 5
+
+
+def access_claims(rol, version):
+    """Claims adicionales del token de acceso"""
+    return {'rol': rol, 'activo': True, 'acceso': version or 0}
+
+
+def current_role():
+    """Rol del usuario autenticado, según su token"""
+    return get_jwt().get('rol')
+
+
+def require_role(*roles):
+    """Como jwt_required(), y además exige uno de `roles` en el token (403 si no)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            claims = get_jwt()
+            if not claims.get('activo') or claims.get('rol') not in roles:
+                return jsonify({'error': 'Permisos insuficientes'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RevokedUsers:
+    """Versiones de acceso de los usuarios con cambios recientes, releídas cada `ttl` segundos.
+
+    `load(desde)` devuelve pares (usuario_id, version) de los cambios posteriores a
+    `desde` (epoch); `lifetime` es la vida de un token en segundos: un cambio más viejo
+    ya no tiene tokens anteriores vigentes.
+    """
+
+    def __init__(self, load, lifetime, ttl=REVOCATION_TTL):
+        self.load = load
+        self.lifetime = lifetime
+        self.ttl = ttl
+        self._versions = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self.ttl:
+                return
+            self._versions = dict(self.load(time.time() - self.lifetime))
+            self._loaded_at = now
+            self.reloads += 1
+
+    def is_revoked(self, claims):
+        # Tokens emitidos antes de los claims de acceso: se pide un login nuevo
+        if 'acceso' not in claims:
+            return True
+        self._refresh()
+        return claims['acceso'] < self._versions.get(int(claims['sub']), 0)
+
+    def changed(self, user_id, version):
+        """Registrar un cambio hecho por este proceso, sin esperar la relectura"""
+        with self._lock:
+            self._versions[user_id] = max(version, self._versions.get(user_id, 0))
+
+    def stats(self):
+        return {'users': len(self._versions), 'reloads': self.reloads, 'ttl': self.ttl}
@@ -0,0 +1,179 @@
+import json
+from numbers import Number
+
+from costing import record_movements
+from ledger import extend_chain
+
+MAX_BATCH_SIZE = 50000
+# SQLite limita el número de parámetros por sentencia
+IN_CHUNK_SIZE = 900
+
+
+class BatchError(Exception):
+    pass
+
+
+def parse_batch_payload(request):
+    """Leer el lote como arreglo JSON, {"transactions": [...]} o NDJSON (una transacción por línea)"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise BatchError(f'Línea {number}: JSON inválido')
+    else:
+        data = request.get_json(silent=True)
+        rows = data.get('transactions') if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise BatchError('Se esperaba un arreglo de transacciones')
+
+    if not rows:
+        raise BatchError('El lote está vacío')
+    if len(rows) > MAX_BATCH_SIZE:
+        raise BatchError(f'El lote supera el máximo de {MAX_BATCH_SIZE} transacciones')
+    return rows
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+# Los campos opcionales pueden faltar o ser null; si vienen, deben poder guardarse tal cual
+def _is_number(value):
+    return value is None or (isinstance(value, Number) and not isinstance(value, bool))
+
+
+def _is_text(value):
+    return value is None or isinstance(value, str)
+
+
+def _existing_ids(cursor, table, ids):
+    found = set()
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        chunk = ids[start:start + IN_CHUNK_SIZE]
+        cursor.execute(f'SELECT id FROM {table} WHERE id IN ({",".join("?" * len(chunk))})', chunk)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+
+def ingest_transactions(conn, rows, user_id):
+    """Validar e insertar un lote de movimientos en una sola transacción.
+
+    Devuelve un resultado por fila, en el mismo orden: {'index', 'transaction_id'}
+    o {'index', 'error'}. Las filas inválidas se rechazan sin afectar al resto.
+    """
+    cursor = conn.cursor()
+    # Reservar el bloqueo de escritura desde el inicio: los ids AUTOINCREMENT del lote quedan contiguos
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('SELECT id, tipo FROM tipos_transaccion')
+        tipos = {row[0]: row[1] for row in cursor.fetchall()}
+
+        results = [None] * len(rows)
+        candidates = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                results[index] = {'index': index, 'error': 'Se esperaba un objeto'}
+                continue
+            cantidad = row.get('cantidad')
+            precio = row.get('precio_unitario')
+            if not all(_is_id(row.get(field)) for field in ('producto_id', 'ubicacion_id', 'tipo_transaccion_id')):
+                error = 'producto_id, ubicacion_id y tipo_transaccion_id son requeridos'
+            elif row['tipo_transaccion_id'] not in tipos:
+                error = 'Tipo de transacción no encontrado'
+            elif not _is_id(cantidad):
+                error = 'La cantidad debe ser un entero positivo'
+            elif not _is_number(precio):
+                error = 'precio_unitario inválido'
+            elif not _is_number(row.get('total')):
+                error = 'total inválido'
+            elif not all(_is_text(row.get(field)) for field in ('referencia', 'observaciones')):
+                error = 'referencia y observaciones deben ser texto'
+            else:
+                candidates.append((index, row))
+                continue
+            results[index] = {'index': index, 'error': error}
+
+        productos = _existing_ids(cursor, 'productos', {row['producto_id'] for _, row in candidates})
+        ubicaciones = _existing_ids(cursor, 'ubicaciones', {row['ubicacion_id'] for _, row in candidates})
+
+        valid = []
+        for index, row in candidates:
+            if row['producto_id'] not in productos:
+                results[index] = {'index': index, 'error': 'Producto no encontrado'}
+            elif row['ubicacion_id'] not in ubicaciones:
+                results[index] = {'index': index, 'error': 'Ubicación no encontrada'}
+            else:
+                valid.append((index, row))
+
+        if valid:
+            cursor.executemany('''
+                INSERT INTO transacciones (producto_id, ubicacion_id, tipo_transaccion_id, cantidad, precio_unitario, total, referencia, observaciones, usuario_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                row['producto_id'],
+                row['ubicacion_id'],
+                row['tipo_transaccion_id'],
+                row['cantidad'],
+                row.get('precio_unitario'),
+                row.get('total', (row.get('precio_unitario') or 0) * row['cantidad']),
+                row.get('referencia', ''),
+                row.get('observaciones', ''),
+                user_id
+            ) for _, row in valid])
+
+            cursor.execute('SELECT last_insert_rowid()')
+            first_id = cursor.fetchone()[0] - len(valid) + 1
+            for offset, (index, _) in enumerate(valid):
+                results[index] = {'index': index, 'transaction_id': first_id + offset}
+            extend_chain(cursor)
+
+            # Cambio de cada fila con la misma regla que POST /api/transactions, en el orden del
+            # lote: la fila que crea el inventario de un producto x ubicación no baja de cero y
+            # las siguientes suman su cambio tal cual
+            changes = []
+            exists = {}
+            for _, row in valid:
+                key = (row['producto_id'], row['ubicacion_id'])
+                change = row['cantidad'] if tipos[row['tipo_transaccion_id']] == 'entrada' else -row['cantidad']
+                if key not in exists:
+                    cursor.execute('SELECT 1 FROM inventario WHERE producto_id = ? AND ubicacion_id = ?', key)
+                    exists[key] = cursor.fetchone() is not None
+                if not exists[key]:
+                    change = max(0, change)
+                    exists[key] = True
+                changes.append(change)
+
+            # Un solo UPSERT por producto x ubicación con el cambio neto del lote
+            deltas = {}
+            for (_, row), change in zip(valid, changes):
+                key = (row['producto_id'], row['ubicacion_id'])
+                deltas[key] = deltas.get(key, 0) + change
+
+            cursor.executemany('''
+                INSERT INTO inventario (producto_id, ubicacion_id, cantidad)
+                VALUES (?, ?, ?)
+                ON CONFLICT(producto_id, ubicacion_id) DO UPDATE
+                SET cantidad = cantidad + ?, fecha_actualizacion = CURRENT_TIMESTAMP
+            ''', [(producto_id, ubicacion_id, delta, delta) for (producto_id, ubicacion_id), delta in deltas.items()])
+
+            # Capas de costo fila por fila, en el orden del lote
+            record_movements(cursor, [(
+                row['producto_id'],
+                row['ubicacion_id'],
+                change,
+                row.get('precio_unitario'),
+                'transaccion',
+                results[index]['transaction_id']
+            ) for (index, row), change in zip(valid, changes)])
+
+        conn.commit()
+        return results
+
+    except Exception:
+        conn.rollback()
+        raise
@@ -0,0 +1,230 @@
+# Costo del inventario por producto y ubicación: capas FIFO y costo promedio ponderado,
+# mantenidos al escribir.
+#
+# Cada entrada o salida con costo queda en movimientos_costo: las transacciones (entradas
+# al precio_unitario registrado, o al del producto si no lo trae), los pedidos, la carga
+# inicial y los ajustes. record_movements la aplica en la misma transacción que la
+# escritura que la origina:
+#   entrada  agrega una capa (movimiento_id, restante, costo) y recalcula el promedio
+#   salida   consume las capas más antiguas; su costo FIFO y su costo al promedio quedan
+#            en el movimiento, en el acumulado de costos_inventario y en costo_ventas_diario
+# Una salida sin capas suficientes (stock negativo) valora el faltante al promedio vigente;
+# la entrada siguiente cubre primero ese faltante.
+#
+# Valorización y costo de ventas leen costos_inventario y costo_ventas_diario, una fila por
+# producto y ubicación (y día), sin recorrer el historial. rebuild_cost_layers recalcula
+# todo desde movimientos_costo repartiendo los productos entre procesos; verify_cost_layers
+# compara las cantidades con inventario y los ajustes corrigen las diferencias.
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from shared.costing import STATE_FIELDS, CostState, replay_partition
+
+
+def _load_state(cursor, key):
+    """Estado guardado de un producto x ubicación; sus capas se leen desde la cabeza solo si una salida las consume"""
+    cursor.execute(f'''
+        SELECT {", ".join(STATE_FIELDS)} FROM costos_inventario WHERE producto_id = ? AND ubicacion_id = ?
+    ''', key)
+    row = cursor.fetchone()
+
+    def fetch_layers(after_id, limit):
+        cursor.execute('''
+            SELECT movimiento_id, restante, costo_unitario FROM capas_costo
+            WHERE producto_id = ? AND ubicacion_id = ? AND movimiento_id > ?
+            ORDER BY movimiento_id LIMIT ?
+        ''', (*key, after_id, limit))
+        return cursor.fetchall()
+
+    return CostState(tuple(row) if row else None, fetch_layers)
+
+
+def _save_state(cursor, key, state):
+    # FIFO solo cambia la cabeza y agrega al final: se borran las capas agotadas,
+    # se reescribe la primera leída y se insertan las nuevas
+    if state.consumed_upto:
+        cursor.execute('DELETE FROM capas_costo WHERE producto_id = ? AND ubicacion_id = ? AND movimiento_id <= ?',
+                       (*key, state.consumed_upto))
+    cursor.executemany('''
+        INSERT OR REPLACE INTO capas_costo (producto_id, ubicacion_id, movimiento_id, restante, costo_unitario)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(*key, *layer) for layer in state.changed_layers()])
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO costos_inventario (producto_id, ubicacion_id, {", ".join(STATE_FIELDS)})
+        VALUES (?, ?, {", ".join("?" * len(STATE_FIELDS))})
+    ''', (*key, *state.row()))
+
+
+def record_movements(cursor, movements):
+    """Registrar y aplicar movimientos (producto_id, ubicacion_id, cantidad, costo, origen, referencia_id).
+
+    `cantidad` es positiva para entradas y negativa para salidas; `costo` (unitario) solo
+    aplica a las entradas y sin él se usa productos.precio_unitario. Debe llamarse dentro
+    de la transacción de la escritura que los origina, en el orden en que ocurrieron.
+    """
+    states = {}
+    prices = {}
+    for producto_id, ubicacion_id, cantidad, costo, origen, referencia_id in movements:
+        if not cantidad:
+            continue
+        key = (producto_id, ubicacion_id)
+        state = states.get(key)
+        if state is None:
+            state = states[key] = _load_state(cursor, key)
+        if cantidad > 0 and costo is None:
+            if producto_id not in prices:
+                cursor.execute('SELECT precio_unitario FROM productos WHERE id = ?', (producto_id,))
+                row = cursor.fetchone()
+                prices[producto_id] = float(row[0] or 0) if row else 0.0
+            costo = prices[producto_id]
+        if cantidad > 0:
+            costo = float(costo)
+            cursor.execute('''
+                INSERT INTO movimientos_costo (producto_id, ubicacion_id, cantidad, costo_unitario, origen, referencia_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (producto_id, ubicacion_id, cantidad, costo, origen, referencia_id))
+            state.apply(cursor.lastrowid, cantidad, costo, origen)
+            continue
+        cost = state.apply(None, cantidad, None, origen)
+        cursor.execute('''
+            INSERT INTO movimientos_costo (producto_id, ubicacion_id, cantidad, origen, referencia_id, costo_fifo, costo_promedio)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (producto_id, ubicacion_id, cantidad, origen, referencia_id, *(cost or (None, None))))
+        if cost is not None:
+            cursor.execute('''
+                INSERT INTO costo_ventas_diario (fecha, producto_id, ubicacion_id, cantidad, costo_fifo, costo_promedio)
+                VALUES (date('now'), ?, ?, ?, ?, ?)
+                ON CONFLICT (fecha, producto_id, ubicacion_id) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad,
+                    costo_fifo = costo_fifo + excluded.costo_fifo,
+                    costo_promedio = costo_promedio + excluded.costo_promedio
+            ''', (producto_id, ubicacion_id, -cantidad, *cost))
+    for key, state in states.items():
+        _save_state(cursor, key, state)
+
+
+def rebuild_cost_layers(conn, database_path, workers=0):
+    """Recalcular capas, promedios y costo de ventas desde movimientos_costo.
+
+    Los productos son independientes: con workers > 1 se reparten entre procesos
+    (producto_id % workers). Devuelve la cantidad de productos x ubicación.
+    """
+    conn.commit()
+    cursor = conn.cursor()
+    # Con el bloqueo de escritura tomado no entran movimientos nuevos mientras se recalcula;
+    # los procesos leen la base confirmada
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = list(executor.map(replay_partition, [database_path] * workers, [workers] * workers,
+                                            range(workers)))
+        else:
+            results = [replay_partition(database_path, 1, 0)]
+
+        for table in ('costos_inventario', 'capas_costo', 'costo_ventas_diario'):
+            cursor.execute(f'DELETE FROM {table}')
+        # Los costos de cada venta se reescriben en orden de id, recorriendo la tabla una vez
+        cursor.executemany('UPDATE movimientos_costo SET costo_fifo = ?, costo_promedio = ? WHERE id = ?',
+                           sorted((cost for result in results for cost in result[2]), key=lambda cost: cost[2]))
+        series = 0
+        for states, layers, _, daily in results:
+            cursor.executemany(f'''
+                INSERT INTO costos_inventario (producto_id, ubicacion_id, {", ".join(STATE_FIELDS)})
+                VALUES (?, ?, {", ".join("?" * len(STATE_FIELDS))})
+            ''', states)
+            cursor.executemany('''
+                INSERT INTO capas_costo (producto_id, ubicacion_id, movimiento_id, restante, costo_unitario)
+                VALUES (?, ?, ?, ?, ?)
+            ''', layers)
+            cursor.executemany('''
+                INSERT INTO costo_ventas_diario (fecha, producto_id, ubicacion_id, cantidad, costo_fifo, costo_promedio)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', daily)
+            series += len(states)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return series
+
+
+def ensure_cost_layers(conn, database_path):
+    """Calcular el estado si hay movimientos de costo y todavía no se calculó (después de la migración)"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM movimientos_costo) AND NOT EXISTS (SELECT 1 FROM costos_inventario)')
+    if cursor.fetchone()[0]:
+        rebuild_cost_layers(conn, database_path)
+
+
+def verify_cost_layers(cursor):
+    """(producto_id, ubicacion_id, cantidad en inventario, cantidad con costo) de los que no coinciden"""
+    cursor.execute('''
+        SELECT producto_id, ubicacion_id, SUM(inventario) AS inventario, SUM(costeado) AS costeado
+        FROM (
+            SELECT producto_id, ubicacion_id, cantidad AS inventario, 0 AS costeado FROM inventario
+            UNION ALL
+            SELECT producto_id, ubicacion_id, 0, cantidad FROM costos_inventario
+        )
+        GROUP BY producto_id, ubicacion_id
+        HAVING SUM(inventario) != SUM(costeado)
+        ORDER BY producto_id, ubicacion_id
+    ''')
+    return cursor.fetchall()
+
+
+def adjust_cost_layers(cursor, drift):
+    """Ajustes que llevan la cantidad con costo a la de inventario (las entradas al precio del producto)"""
+    record_movements(cursor, [(producto_id, ubicacion_id, inventario - costeado, None, 'ajuste', None)
+                              for producto_id, ubicacion_id, inventario, costeado in drift])
+
+
+def inventory_valuation(cursor, ubicacion_id=None):
+    """Cantidad y valor (FIFO y promedio) por producto, sumando sus ubicaciones"""
+    where, params = '', []
+    if ubicacion_id:
+        where, params = 'AND c.ubicacion_id = ?', [ubicacion_id]
+    cursor.execute(f'''
+        SELECT c.producto_id, p.codigo, p.nombre, SUM(c.cantidad) AS cantidad,
+               SUM(c.valor_fifo) AS valor_fifo,
+               SUM(MAX(c.cantidad, 0) * c.costo_promedio) AS valor_promedio
+        FROM costos_inventario c
+        JOIN productos p ON p.id = c.producto_id
+        WHERE p.activo = 1 {where}
+        GROUP BY c.producto_id
+        ORDER BY c.producto_id
+    ''', params)
+    return cursor.fetchall()
+
+
+def cost_of_sales(cursor, date_range=(), ubicacion_id=None):
+    """Unidades vendidas y su costo (FIFO y promedio) por producto.
+
+    Sin fechas lee el acumulado de costos_inventario; con fechas, costo_ventas_diario.
+    `date_range` son pares (operador, fecha) como los de parse_date_range.
+    """
+    conditions, params = [], []
+    if ubicacion_id:
+        conditions.append('c.ubicacion_id = ?')
+        params.append(ubicacion_id)
+    if date_range:
+        source = 'SELECT fecha, producto_id, ubicacion_id, cantidad, costo_fifo, costo_promedio FROM costo_ventas_diario'
+        # Días completos: costo_ventas_diario guarda la fecha sin hora
+        for op, value in date_range:
+            conditions.append(f'c.fecha {op} ?')
+            params.append(value[:10])
+    else:
+        source = '''SELECT producto_id, ubicacion_id, salidas AS cantidad, costo_ventas_fifo AS costo_fifo,
+                           costo_ventas_promedio AS costo_promedio FROM costos_inventario'''
+    cursor.execute(f'''
+        SELECT c.producto_id, p.codigo, p.nombre, SUM(c.cantidad) AS cantidad,
+               SUM(c.costo_fifo) AS costo_fifo, SUM(c.costo_promedio) AS costo_promedio
+        FROM ({source}) c
+        JOIN productos p ON p.id = c.producto_id
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        GROUP BY c.producto_id
+        HAVING SUM(c.cantidad) != 0
+        ORDER BY c.producto_id
+    ''', params)
+    return cursor.fetchall()
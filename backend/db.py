@@ -0,0 +1,141 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Ajustes aplicados a cada conexión nueva del pool
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16000          # por conexión (PRAGMA cache_size negativo = KiB)
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Pool de conexiones SQLite reutilizables (modo WAL).
+
+    Cada conexión la usa un solo hilo a la vez: se toma con acquire() al
+    empezar la petición y vuelve al pool con release() al terminar. Así se
+    evita abrir el archivo, parsear el esquema y calentar la caché de páginas
+    en cada petición, y en WAL las lecturas no se bloquean por escrituras.
+    """
+
+    def __init__(self, path, max_size=8, timeout=10.0):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Condition()
+        self._size = 0
+        self._stats = {'created': 0, 'acquired': 0, 'reused': 0, 'waits': 0, 'rollbacks': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            while True:
+                if self._idle:
+                    self._stats['acquired'] += 1
+                    self._stats['reused'] += 1
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout('No hay conexiones disponibles en el pool')
+                self._stats['waits'] += 1
+                self._lock.wait(remaining)
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+        with self._lock:
+            self._stats['created'] += 1
+            self._stats['acquired'] += 1
+        return conn
+
+    def release(self, conn):
+        # Una petición que falló sin commit no debe dejar su transacción abierta al siguiente usuario
+        if conn.in_transaction:
+            conn.rollback()
+            with self._lock:
+                self._stats['rollbacks'] += 1
+        with self._lock:
+            self._idle.append(conn)
+            self._lock.notify()
+
+    def close_all(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+                self._size -= 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=self._size, idle=len(self._idle),
+                        in_use=self._size - len(self._idle), max_size=self.max_size)
+
+
+class AsyncPool:
+    """Acceso al pool desde asyncio sin bloquear el bucle de eventos.
+
+    sqlite3 no tiene API asíncrona: cada operación corre en un hilo propio
+    (tantos como conexiones tiene el pool, así nunca esperan una conexión
+    ocupada por otro hilo del mismo executor) y el bucle solo espera el
+    resultado.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.executor = ThreadPoolExecutor(max_workers=pool.max_size, thread_name_prefix='sqlite')
+
+    def _call(self, fn, args):
+        conn = self.pool.acquire()
+        try:
+            return fn(conn, *args)
+        finally:
+            self.pool.release(conn)
+
+    async def run(self, fn, *args):
+        """Ejecutar fn(conn, *args) en un hilo del pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, fn, args)
+
+    async def fetchall(self, query, params=()):
+        return await self.run(lambda conn: [dict(row) for row in conn.execute(query, params).fetchall()])
+
+    async def fetchone(self, query, params=()):
+        def fetch(conn):
+            row = conn.execute(query, params).fetchone()
+            return dict(row) if row is not None else None
+        return await self.run(fetch)
+
+    async def execute(self, query, params=()):
+        def execute(conn):
+            cursor = conn.execute(query, params)
+            conn.commit()
+            return cursor.rowcount
+        return await self.run(execute)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.close_all()
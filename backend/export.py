@@ -0,0 +1,11 @@
+# Exportación en streaming (CSV o NDJSON, opcionalmente gzip) desde un cursor de sqlite3;
+# las consultas y la escritura de bloques están en shared/export.py.
+
+from shared.export import export_chunks, export_query
+
+
+def stream_export(cursor, kind, fmt, date_range):
+    """Generador de texto con las filas del export"""
+    query, params = export_query(kind, date_range)
+    cursor.execute(query, params)
+    return export_chunks(fmt, [column[0] for column in cursor.description], cursor.fetchmany)
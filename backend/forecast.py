@@ -0,0 +1,59 @@
+# Demanda y punto de reorden por producto y ubicación, calculados en lote desde el historial.
+#
+# El cálculo (shared/forecast.py) lee las salidas de movimientos_inventario y transacciones
+# y devuelve las estadísticas de cada serie. El resultado se guarda en
+# pronosticos_reposicion (se reemplaza completo en cada cálculo); las consultas lo cruzan
+# con el inventario actual.
+
+from shared.forecast import HISTORY_DAYS, RESULT_FIELDS, forecast, load_demand
+
+
+def refresh_reorder_points(cursor, **params):
+    """Recalcular pronosticos_reposicion completa; devuelve la cantidad de series"""
+    history = params.get('history', HISTORY_DAYS)
+    # Tuplas simples aunque la conexión use sqlite3.Row
+    load = cursor.connection.cursor()
+    load.row_factory = None
+    result = forecast(*load_demand(load, history), **params)
+    cursor.execute('DELETE FROM pronosticos_reposicion')
+    cursor.executemany(f'''
+        INSERT INTO pronosticos_reposicion ({", ".join(RESULT_FIELDS)})
+        VALUES ({", ".join("?" * len(RESULT_FIELDS))})
+    ''', zip(*(result[field].tolist() for field in RESULT_FIELDS)))
+    return len(result['producto_id'])
+
+
+def reorder_points(cursor, after=None, limit=None, below=False, producto_id=None, ubicacion_id=None):
+    """Pronósticos con el stock actual, en orden de (producto_id, ubicacion_id).
+
+    `after` es la clave de la última fila de la página anterior; con `below` solo las
+    ubicaciones cuyo stock no supera el punto de reorden.
+    """
+    conditions, params = ['p.activo = 1'], []
+    if after:
+        conditions.append('(r.producto_id, r.ubicacion_id) > (?, ?)')
+        params.extend(after)
+    if below:
+        conditions.append('r.punto_reorden > 0 AND COALESCE(i.cantidad, 0) <= r.punto_reorden')
+    if producto_id:
+        conditions.append('r.producto_id = ?')
+        params.append(producto_id)
+    if ubicacion_id:
+        conditions.append('r.ubicacion_id = ?')
+        params.append(ubicacion_id)
+    query = f'''
+        SELECT r.producto_id, p.codigo, p.nombre, r.ubicacion_id, u.nombre AS ubicacion_nombre,
+               COALESCE(i.cantidad, 0) AS stock_actual, p.stock_minimo, r.demanda_media,
+               r.demanda_suavizada, r.desviacion, r.stock_seguridad, r.punto_reorden, r.fecha_calculo
+        FROM pronosticos_reposicion r
+        JOIN productos p ON p.id = r.producto_id
+        JOIN ubicaciones u ON u.id = r.ubicacion_id
+        LEFT JOIN inventario i ON i.producto_id = r.producto_id AND i.ubicacion_id = r.ubicacion_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY r.producto_id, r.ubicacion_id
+    '''
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    cursor.execute(query, params)
+    return cursor.fetchall()
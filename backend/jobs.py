@@ -0,0 +1,285 @@
+# Cola de trabajos durable para los efectos secundarios de pedidos y pagos.
+#
+# Las rutas solo encolan: el trabajo se inserta en `trabajos` dentro de la misma
+# transacción que la escritura que lo origina, así que existe si y solo si esa
+# escritura se confirmó. Un grupo de hilos (JobWorkers) o el comando `run-jobs`
+# desde otro proceso lo ejecuta después, cada uno con su propia conexión.
+#
+# Entrega al menos una vez: un trabajo se reclama por LEASE_SECONDS; si el proceso
+# muere a mitad, vuelve a estar disponible al vencer el plazo. Los manejadores
+# escriben en la misma transacción que marca el trabajo como completado, y la clave
+# única impide encolar dos veces el mismo efecto.
+
+import json
+import logging
+import os
+import threading
+
+from db import PoolTimeout
+from forecast import refresh_reorder_points
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 2        # se duplica en cada reintento
+MAX_BACKOFF_SECONDS = 300
+POLL_INTERVAL = 1.0
+WORKERS = 2
+
+JOBS_DDL = '''
+    CREATE TABLE IF NOT EXISTS trabajos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo VARCHAR(50) NOT NULL,
+        clave VARCHAR(100) UNIQUE,
+        payload TEXT NOT NULL,
+        estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+        intentos INTEGER NOT NULL DEFAULT 0,
+        max_intentos INTEGER NOT NULL DEFAULT 5,
+        disponible_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        ultimo_error TEXT,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Solo los trabajos por ejecutar (o con plazo vencido) entran en el índice
+    CREATE INDEX IF NOT EXISTS idx_trabajos_disponibles ON trabajos(disponible_en, id)
+        WHERE estado IN ('pendiente', 'en_proceso');
+
+    CREATE TABLE IF NOT EXISTS alertas_stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto_id INTEGER NOT NULL,
+        pedido_id INTEGER,
+        stock_total INTEGER NOT NULL,
+        stock_minimo INTEGER NOT NULL,
+        atendida BOOLEAN DEFAULT 0,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (pedido_id, producto_id),
+        FOREIGN KEY (producto_id) REFERENCES productos (id),
+        FOREIGN KEY (pedido_id) REFERENCES pedidos (id)
+    );
+'''
+
+
+def ensure_jobs_schema(cursor):
+    cursor.executescript(JOBS_DDL)
+
+
+def enqueue(cursor, tipo, payload, clave=None, max_intentos=MAX_ATTEMPTS):
+    """Encolar un trabajo en la transacción en curso; False si la clave ya existía"""
+    cursor.execute('''
+        INSERT INTO trabajos (tipo, clave, payload, max_intentos) VALUES (?, ?, ?, ?)
+        ON CONFLICT (clave) DO NOTHING
+    ''', (tipo, clave, json.dumps(payload, separators=(',', ':')), max_intentos))
+    return cursor.rowcount == 1
+
+
+def claim(conn):
+    """Reclamar el siguiente trabajo disponible, o None si no hay ninguno.
+
+    La búsqueda usa el índice parcial sin tomar el bloqueo de escritura, así una cola
+    vacía no compite con las escrituras de las peticiones. Con un candidato se abre la
+    transacción y el UPDATE solo lo reclama si sigue como se leyó; si otro trabajador
+    se adelantó se busca el siguiente.
+    """
+    cursor = conn.cursor()
+    while True:
+        cursor.execute('''
+            SELECT id, tipo, payload, intentos, max_intentos FROM trabajos
+            WHERE estado IN ('pendiente', 'en_proceso') AND disponible_en <= datetime('now')
+            ORDER BY disponible_en, id
+            LIMIT 1
+        ''')
+        job = cursor.fetchone()
+        if job is None:
+            return None
+        # Un trabajo que agotó sus intentos y cuyo plazo venció no se vuelve a ejecutar
+        expired = job['intentos'] >= job['max_intentos']
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            if expired:
+                cursor.execute('''
+                    UPDATE trabajos SET estado = 'fallido', ultimo_error = 'Plazo de ejecución vencido',
+                           fecha_actualizacion = CURRENT_TIMESTAMP
+                    WHERE id = ? AND intentos = ? AND estado IN ('pendiente', 'en_proceso')
+                      AND disponible_en <= datetime('now')
+                ''', (job['id'], job['intentos']))
+            else:
+                cursor.execute('''
+                    UPDATE trabajos SET estado = 'en_proceso', intentos = intentos + 1,
+                           disponible_en = datetime('now', ?), fecha_actualizacion = CURRENT_TIMESTAMP
+                    WHERE id = ? AND intentos = ? AND estado IN ('pendiente', 'en_proceso')
+                      AND disponible_en <= datetime('now')
+                ''', (f'+{LEASE_SECONDS} seconds', job['id'], job['intentos']))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if claimed and not expired:
+            return job
+
+
+def run_job(conn, job, handlers):
+    """Ejecutar un trabajo reclamado; True si terminó, False si queda para reintento o falló"""
+    cursor = conn.cursor()
+    try:
+        handler = handlers.get(job['tipo'])
+        if handler is None:
+            raise LookupError(f'Tipo de trabajo desconocido: {job["tipo"]}')
+        handler(cursor, json.loads(job['payload']))
+        cursor.execute('''
+            UPDATE trabajos SET estado = 'completado', ultimo_error = NULL, fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (job['id'],))
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        attempts = job['intentos'] + 1
+        retry = attempts < job['max_intentos']
+        delay = min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+        cursor.execute('''
+            UPDATE trabajos SET estado = ?, disponible_en = datetime('now', ?), ultimo_error = ?,
+                   fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', ('pendiente' if retry else 'fallido', f'+{delay} seconds', f'{type(e).__name__}: {e}', job['id']))
+        conn.commit()
+        logger.warning('Trabajo %s (%s) falló en el intento %s: %s', job['id'], job['tipo'], attempts, e)
+        return False
+
+
+def run_pending(conn, handlers, limit=None):
+    """Ejecutar los trabajos disponibles en este hilo; devuelve (completados, fallidos)"""
+    done = failed = 0
+    while limit is None or done + failed < limit:
+        job = claim(conn)
+        if job is None:
+            break
+        if run_job(conn, job, handlers):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def queue_stats(cursor):
+    cursor.execute('SELECT estado, COUNT(*) FROM trabajos GROUP BY estado')
+    stats = {'pendiente': 0, 'en_proceso': 0, 'completado': 0, 'fallido': 0}
+    stats.update({row[0]: row[1] for row in cursor.fetchall()})
+    cursor.execute('''
+        SELECT MIN(fecha_creacion) FROM trabajos WHERE estado IN ('pendiente', 'en_proceso')
+    ''')
+    stats['pendiente_mas_antiguo'] = cursor.fetchone()[0]
+    return stats
+
+
+class JobWorkers:
+    """Grupo de hilos que ejecuta la cola; notify() los despierta sin esperar al sondeo"""
+
+    def __init__(self, pool, handlers, workers=WORKERS, poll_interval=POLL_INTERVAL):
+        self.pool = pool
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def init_app(self, app):
+        """Arrancar los hilos con la primera petición de cada proceso que sirve.
+
+        Cubre flask run, cualquier servidor WSGI y cada proceso de gunicorn (un fork no
+        hereda los hilos); los comandos de la CLI no atienden peticiones y no los arrancan.
+        """
+        app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            self.start()
+
+    def start(self):
+        """Arrancar los hilos; una sola vez por proceso"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return self
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            job = conn = None
+            try:
+                conn = self.pool.acquire()
+                job = claim(conn)
+                if job is not None:
+                    ok = run_job(conn, job, self.handlers)
+                    with self._lock:
+                        if ok:
+                            self.completed += 1
+                        else:
+                            self.failed += 1
+            except PoolTimeout:
+                # Pool ocupado: el hilo sigue vivo y lo reintenta tras la espera normal
+                logger.warning('Trabajador de la cola sin conexión libre; se reintenta')
+            except Exception:
+                logger.exception('Error en el trabajador de la cola')
+            finally:
+                if conn is not None:
+                    self.pool.release(conn)
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'completed': self.completed, 'failed': self.failed}
+
+
+# Manejadores: reciben el cursor de la transacción del trabajo y el payload.
+# Deben poder repetirse sin efecto adicional (entrega al menos una vez).
+
+def mark_order_paid(cursor, payload):
+    cursor.execute("UPDATE pedidos SET estado = 'pagado' WHERE id = ? AND estado != 'pagado'",
+                   (payload['pedido_id'],))
+
+
+def record_stock_alerts(cursor, payload):
+    productos = payload['productos']
+    cursor.execute(f'''
+        INSERT INTO alertas_stock (producto_id, pedido_id, stock_total, stock_minimo)
+        SELECT p.id, ?, s.stock_total, p.stock_minimo
+        FROM stock_totals s
+        JOIN productos p ON p.id = s.producto_id
+        WHERE s.producto_id IN ({",".join("?" * len(productos))}) AND s.bajo_stock = 1
+        ON CONFLICT (pedido_id, producto_id) DO NOTHING
+    ''', [payload['pedido_id'], *productos])
+
+
+def refresh_forecast(cursor, payload):
+    refresh_reorder_points(cursor)
+
+
+HANDLERS = {
+    'pedido_pagado': mark_order_paid,
+    'alerta_stock': record_stock_alerts,
+    'pronostico_reposicion': refresh_forecast,
+}
@@ -0,0 +1,135 @@
+# Cadena de hashes del libro de transacciones.
+#
+# Cada fila guarda hash_cadena = sha256(hash_cadena anterior || fila canónica),
+# calculado en la misma transacción que la inserta. Editar o borrar una fila ya
+# encadenada rompe la cadena desde ese punto; los triggers impiden hacerlo desde
+# la aplicación y verify_chain lo detecta si se hace por fuera.
+
+from shared.canonical import GENESIS_HASH, TX_COLUMNS, canonical_transaction, chain_hash
+
+CHUNK_SIZE = 10000
+CHECKPOINT_INTERVAL = 250000
+
+_COLUMNS = ', '.join(TX_COLUMNS)
+
+LEDGER_DDL = f'''
+    CREATE TABLE IF NOT EXISTS auditoria_checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ultima_transaccion_id INTEGER NOT NULL,
+        hash_cadena VARCHAR(64) NOT NULL,
+        filas INTEGER NOT NULL,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_transacciones_sin_hash ON transacciones (id) WHERE hash_cadena IS NULL;
+
+    CREATE TRIGGER IF NOT EXISTS transacciones_solo_anexar_ad BEFORE DELETE ON transacciones BEGIN
+        SELECT RAISE(ABORT, 'transacciones es de solo anexado');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS transacciones_solo_anexar_au BEFORE UPDATE OF {_COLUMNS} ON transacciones BEGIN
+        SELECT RAISE(ABORT, 'transacciones es de solo anexado');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS transacciones_hash_cadena_au BEFORE UPDATE OF hash_cadena ON transacciones
+    WHEN old.hash_cadena IS NOT NULL BEGIN
+        SELECT RAISE(ABORT, 'hash_cadena no se puede modificar');
+    END;
+'''
+
+
+def ensure_ledger(cursor):
+    cursor.execute('PRAGMA table_info(transacciones)')
+    if 'hash_cadena' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute('ALTER TABLE transacciones ADD COLUMN hash_cadena VARCHAR(64)')
+    cursor.executescript(LEDGER_DDL)
+    # Encadenar las filas anteriores a la columna (o insertadas por fuera de la aplicación)
+    extend_chain(cursor)
+
+
+def extend_chain(cursor):
+    """Encadenar las filas sin hash_cadena, en orden de id.
+
+    Debe llamarse en la transacción que insertó las filas: el INSERT ya tomó el
+    bloqueo de escritura, así nadie más puede extender la cadena a la vez.
+    """
+    cursor.execute('SELECT hash_cadena FROM transacciones WHERE hash_cadena IS NOT NULL ORDER BY id DESC LIMIT 1')
+    last = cursor.fetchone()
+    prev_hash = last[0] if last else GENESIS_HASH
+
+    chained = 0
+    last_id = 0
+    while True:
+        cursor.execute(f'''
+            SELECT {_COLUMNS} FROM transacciones
+            WHERE hash_cadena IS NULL AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (last_id, CHUNK_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            return chained
+        updates = []
+        for row in rows:
+            prev_hash = chain_hash(prev_hash, canonical_transaction(row))
+            updates.append((prev_hash, row[0]))
+        cursor.executemany('UPDATE transacciones SET hash_cadena = ? WHERE id = ?', updates)
+        chained += len(rows)
+        last_id = rows[-1][0]
+
+
+def _save_checkpoint(conn, last_id, head, filas):
+    conn.execute('INSERT INTO auditoria_checkpoints (ultima_transaccion_id, hash_cadena, filas) VALUES (?, ?, ?)',
+                 (last_id, head, filas))
+    conn.commit()
+
+
+def verify_chain(conn, resume=False, progress=None):
+    """Recorrer la cadena desde el génesis por bloques de CHUNK_SIZE filas (memoria constante).
+
+    Guarda un checkpoint cada CHECKPOINT_INTERVAL filas; solo con `resume`
+    continúa desde el último, para retomar una auditoría interrumpida (las
+    filas anteriores no se vuelven a verificar).
+    Devuelve un resumen con la primera fila inválida, si la hay.
+    """
+    cursor = conn.cursor()
+    last_id, head, filas = 0, GENESIS_HASH, 0
+    if resume:
+        cursor.execute('SELECT ultima_transaccion_id, hash_cadena, filas FROM auditoria_checkpoints ORDER BY id DESC LIMIT 1')
+        checkpoint = cursor.fetchone()
+        if checkpoint:
+            last_id, head, filas = checkpoint
+            cursor.execute('SELECT hash_cadena FROM transacciones WHERE id = ?', (last_id,))
+            row = cursor.fetchone()
+            if row is None or row[0] != head:
+                return {'valid': False, 'first_invalid_id': last_id, 'reason': 'checkpoint',
+                        'checked': 0, 'resumed_from': last_id}
+    resumed_from = last_id
+
+    checked = 0
+    since_checkpoint = 0
+    while True:
+        cursor.execute(f'SELECT {_COLUMNS}, hash_cadena FROM transacciones WHERE id > ? ORDER BY id LIMIT ?',
+                       (last_id, CHUNK_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for row in rows:
+            stored = row[len(TX_COLUMNS)]
+            if stored is None or chain_hash(head, canonical_transaction(row)) != stored:
+                return {'valid': False, 'first_invalid_id': row[0],
+                        'reason': 'sin_encadenar' if stored is None else 'hash',
+                        'checked': checked, 'resumed_from': resumed_from}
+            head = stored
+            checked += 1
+        last_id = rows[-1][0]
+        since_checkpoint += len(rows)
+        if since_checkpoint >= CHECKPOINT_INTERVAL:
+            _save_checkpoint(conn, last_id, head, filas + checked)
+            since_checkpoint = 0
+        if progress:
+            progress(last_id, checked)
+
+    if since_checkpoint:
+        _save_checkpoint(conn, last_id, head, filas + checked)
+    return {'valid': True, 'checked': checked, 'resumed_from': resumed_from, 'last_id': last_id,
+            'head': head, 'total': filas + checked}
@@ -0,0 +1,181 @@
+# Prueba de carga HTTP (solo biblioteca estándar) para comparar el servidor WSGI y el ASGI.
+#
+#   python app.py                          # WSGI: servidor de Flask con hilos, puerto 5000
+#   uvicorn asgi:app --port 8000           # ASGI
+#   python loadtest.py http://127.0.0.1:5000/api/products http://127.0.0.1:8000/api/products \
+#       --concurrency 100,250,500,1000 --duration 10
+#
+# Con --login cada medición se repite con clientes que hacen login a la vez, para ver
+# los logins por segundo y cuánto empeoran las lecturas del catálogo durante una ráfaga:
+#
+#   python loadtest.py http://127.0.0.1:5000/api/products --concurrency 50 \
+#       --login http://127.0.0.1:5000/api/auth/login --login-concurrency 20
+#
+# Cada cliente virtual mantiene una conexión keep-alive y repite la petición hasta
+# agotar la duración. Se reportan peticiones por segundo, latencias (incluida la
+# conexión) y errores por código o excepción. El cliente corre en un solo proceso:
+# conviene ejecutarlo en otra máquina o con núcleos libres para no medirse a sí mismo.
+
+import argparse
+import asyncio
+import json
+import resource
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+TIMEOUT = 30.0
+
+
+async def fetch(reader, writer, request):
+    """Enviar una petición y leer la respuesta completa; devuelve (status, cerrar_conexión, retry_after)"""
+    writer.write(request)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Conexión cerrada por el servidor')
+    status = int(status_line.split()[1])
+    length, chunked, close = None, False, status_line.startswith(b'HTTP/1.0')
+    retry_after = None
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            close = value == 'close'
+        elif name == 'retry-after':
+            retry_after = float(value)
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+    return status, close, retry_after
+
+
+def build_request(url, headers, body=None):
+    """Petición HTTP/1.1 completa: GET, o POST con cuerpo JSON si hay `body`"""
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    headers = list(headers)
+    payload = b''
+    if body is not None:
+        payload = json.dumps(body).encode('utf-8')
+        headers += ['Content-Type: application/json', f'Content-Length: {len(payload)}']
+    return (f'{"GET" if body is None else "POST"} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+            + ''.join(f'{header}\r\n' for header in headers) + '\r\n').encode('latin-1') + payload
+
+
+async def client(url, request, deadline, latencies, errors):
+    parts = urlsplit(url)
+    connection = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.wait_for(
+                    asyncio.open_connection(parts.hostname, parts.port or 80), TIMEOUT)
+            status, close, retry_after = await asyncio.wait_for(fetch(*connection, request), TIMEOUT)
+        except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+            errors[type(e).__name__] += 1
+            if connection is not None:
+                connection[1].close()
+                connection = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors[status] += 1
+        if close:
+            connection[1].close()
+            connection = None
+        if retry_after:
+            # Como un cliente real ante un 503: esperar lo indicado antes de reintentar
+            await asyncio.sleep(retry_after)
+    if connection is not None:
+        connection[1].close()
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+async def run(url, concurrency, duration, headers, body=None):
+    latencies, errors = [], Counter()
+    request = build_request(url, headers, body)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(url, request, start + duration, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        # Respuestas sin error: con --login, los logins por segundo (sin contar los 503)
+        'ok_rps': (len(latencies) - sum(n for key, n in errors.items() if isinstance(key, int))) / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': (latencies[-1] if latencies else 0.0) * 1000,
+        'errors': dict(errors),
+    }
+
+
+async def with_logins(url, concurrency, args):
+    # Lecturas y logins en paralelo; las filas de login dan los logins por segundo
+    return await asyncio.gather(
+        run(url, concurrency, args.duration, args.header),
+        run(args.login, args.login_concurrency, args.duration, [], json.loads(args.login_body)),
+    )
+
+
+def report(result, label=''):
+    print(f'{result["url"] + label:<48} {result["concurrency"]:>8} {result["rps"]:>9.0f} {result["ok_rps"]:>9.1f} {result["p50"]:>8.1f} '
+          f'{result["p95"]:>8.1f} {result["p99"]:>8.1f} {result["max"]:>8.1f}  {result["errors"] or "-"}')
+
+
+def raise_file_limit():
+    # Cada cliente virtual es un socket abierto
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga: peticiones por segundo y latencias')
+    parser.add_argument('urls', nargs='+', help='URLs a comparar (por ejemplo la misma ruta en WSGI y ASGI)')
+    parser.add_argument('--concurrency', default='100,250,500,1000', help='Clientes simultáneos, separados por coma')
+    parser.add_argument('--duration', type=float, default=10.0, help='Segundos por medición')
+    parser.add_argument('--header', action='append', default=[], help="Cabecera extra, p. ej. 'Authorization: Bearer ...'")
+    parser.add_argument('--login', help='URL de login: repetir cada medición con logins simultáneos')
+    parser.add_argument('--login-body', default='{"username": "cliente", "password": "cliente123"}',
+                        help='Cuerpo JSON del login')
+    parser.add_argument('--login-concurrency', type=int, default=20, help='Clientes haciendo login a la vez')
+    args = parser.parse_args()
+
+    raise_file_limit()
+    print(f'{"url":<48} {"clientes":>8} {"req/s":>9} {"ok/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}  errores')
+    for concurrency in (int(value) for value in args.concurrency.split(',')):
+        for url in args.urls:
+            report(asyncio.run(run(url, concurrency, args.duration, args.header)))
+            if args.login:
+                reads, logins = asyncio.run(with_logins(url, concurrency, args))
+                report(reads, ' + logins')
+                report(logins)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Expansión de pedidos (?expand=items,payments): los renglones y pagos de toda la página
+# se leen con una consulta por relación (WHERE pedido_id IN (...)), en lugar de una
+# petición por pedido desde el cliente. Ambas consultas usan los índices por pedido_id.
+
+from shared.serializers import RowMapper
+
+EXPANSIONS = ('items', 'payments')
+
+# Ids por consulta, por debajo del límite de parámetros de SQLite
+IN_CHUNK = 500
+
+RELATIONS = {
+    'items': ('''
+        SELECT d.pedido_id, d.id, d.producto_id, pr.codigo, pr.nombre, d.cantidad, d.precio_unitario, d.subtotal
+        FROM detalle_pedidos d
+        JOIN productos pr ON pr.id = d.producto_id
+        WHERE d.pedido_id IN ({placeholders})
+        ORDER BY d.pedido_id, d.id
+    ''', RowMapper(('id', 'producto_id', 'codigo', 'nombre', 'cantidad', 'precio_unitario', 'subtotal'))),
+    'payments': ('''
+        SELECT pedido_id, id, metodo_pago, monto, estado, referencia_pago, qr_code, fecha_pago
+        FROM pagos
+        WHERE pedido_id IN ({placeholders})
+        ORDER BY pedido_id, id
+    ''', RowMapper(('id', 'metodo_pago', 'monto', 'estado', 'referencia_pago', 'qr_code', 'fecha_pago'))),
+}
+
+
+def parse_expand(args):
+    """Relaciones pedidas en ?expand=; lanza ValueError si alguna no existe"""
+    expand = [name.strip() for name in args.get('expand', '').split(',') if name.strip()]
+    unknown = [name for name in expand if name not in EXPANSIONS]
+    if unknown:
+        raise ValueError(f'Expansión desconocida: {", ".join(unknown)}')
+    return tuple(dict.fromkeys(expand))
+
+
+def load_related(cursor, name, order_ids):
+    """{pedido_id: [filas serializadas]} de una relación para todos los pedidos"""
+    query, mapper = RELATIONS[name]
+    related = {}
+    for start in range(0, len(order_ids), IN_CHUNK):
+        chunk = order_ids[start:start + IN_CHUNK]
+        cursor.execute(query.format(placeholders=','.join('?' * len(chunk))), chunk)
+        rows = cursor.fetchall()
+        for row, value in zip(rows, mapper.rows(rows)):
+            related.setdefault(row['pedido_id'], []).append(value)
+    return related
+
+
+def expand_orders(cursor, payload, order_ids, expand, fmt='rows'):
+    """Agregar las relaciones a los pedidos ya serializados.
+
+    En formato 'rows' cada pedido recibe su lista; en 'columns' cada relación es una
+    columna más, alineada con las demás.
+    """
+    for name in expand:
+        related = load_related(cursor, name, order_ids)
+        values = [related.get(order_id, []) for order_id in order_ids]
+        if fmt == 'columns':
+            payload[name] = values
+        else:
+            for order, value in zip(payload, values):
+                order[name] = value
+    return payload
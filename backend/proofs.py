@@ -0,0 +1,181 @@
+# Verificación de pruebas de inclusión Merkle contra las raíces de los bloques.
+#
+# Las pruebas se leen de pruebas_merkle (O(log n) hashes por transacción); la
+# hoja se recalcula siempre desde la fila actual, así cualquier cambio en una
+# transacción anclada hace fallar su prueba.
+
+import json
+import threading
+from collections import OrderedDict
+
+from anchoring import block_hash
+from shared.canonical import TX_COLUMNS, canonical_transaction
+from shared.merkle import build_tree, hash_leaves, verify_proof
+
+MAX_VERIFY = 50000
+# SQLite limita el número de parámetros por sentencia
+IN_CHUNK_SIZE = 900
+
+TX_PROOF_QUERY = f'''
+    SELECT {", ".join("t." + column for column in TX_COLUMNS)},
+           t.blockchain_tx_hash, t.blockchain_confirmado,
+           p.bloque_id, p.indice, p.hoja, p.prueba
+    FROM transacciones t
+    LEFT JOIN pruebas_merkle p ON p.transaccion_id = t.id
+'''
+
+
+class BlockCache:
+    """LRU de bloques por id. Un bloque no cambia una vez escrito, así que no expira."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, cursor, block_ids):
+        found, missing = {}, []
+        with self._lock:
+            for block_id in set(block_ids):
+                if block_id in self._blocks:
+                    self._blocks.move_to_end(block_id)
+                    found[block_id] = self._blocks[block_id]
+                    self.hits += 1
+                else:
+                    missing.append(block_id)
+                    self.misses += 1
+
+        for start in range(0, len(missing), IN_CHUNK_SIZE):
+            chunk = missing[start:start + IN_CHUNK_SIZE]
+            cursor.execute(f'SELECT * FROM bloques WHERE id IN ({",".join("?" * len(chunk))})', chunk)
+            for row in cursor.fetchall():
+                block = dict(row)
+                # El encabezado se comprueba una vez, al entrar en la caché
+                block['valido'] = block_hash(block['hash_anterior'], block['merkle_root'],
+                                             block['cantidad_transacciones'], block['primera_transaccion_id'],
+                                             block['ultima_transaccion_id'], block['fecha_creacion']) == block['hash']
+                found[block['id']] = block
+
+        with self._lock:
+            for block_id in missing:
+                if block_id in found:
+                    self._blocks[block_id] = found[block_id]
+            while len(self._blocks) > self.maxsize:
+                self._blocks.popitem(last=False)
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._blocks), 'max_size': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+block_cache = BlockCache()
+
+
+def public_block(block):
+    return {
+        'id': block['id'],
+        'hash': block['hash'],
+        'hash_anterior': block['hash_anterior'],
+        'merkle_root': block['merkle_root'],
+        'cantidad_transacciones': block['cantidad_transacciones'],
+        'fecha_creacion': block['fecha_creacion'],
+        'valido': block['valido']
+    }
+
+
+def transaction_proof(cursor, transaction_id):
+    """Prueba de inclusión de una transacción, o None si no existe"""
+    cursor.execute(TX_PROOF_QUERY + ' WHERE t.id = ?', (transaction_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    result = {
+        'transaction_id': row['id'],
+        'blockchain_tx_hash': row['blockchain_tx_hash'],
+        'blockchain_confirmado': bool(row['blockchain_confirmado']),
+        'anchored': row['bloque_id'] is not None
+    }
+    if not result['anchored']:
+        return result
+
+    block = block_cache.get_many(cursor, [row['bloque_id']])[row['bloque_id']]
+    leaf = hash_leaves([canonical_transaction(row)])[0]
+    path = json.loads(row['prueba'])
+    result.update({
+        'leaf': leaf,
+        'stored_leaf': row['hoja'],
+        'index': row['indice'],
+        'proof': [{'position': side, 'hash': sibling} for side, sibling in path],
+        'block': public_block(block),
+        'verified': leaf == row['hoja'] and block['valido'] and verify_proof(leaf, path, block['merkle_root'])
+    })
+    return result
+
+
+def verify_rows(cursor, rows):
+    """Verificar filas de TX_PROOF_QUERY en bloque: hojas en paralelo, raíces desde la caché"""
+    anchored = [row for row in rows if row['bloque_id'] is not None]
+    pending = [row['id'] for row in rows if row['bloque_id'] is None]
+    leaves = hash_leaves([canonical_transaction(row) for row in anchored])
+    blocks = block_cache.get_many(cursor, [row['bloque_id'] for row in anchored])
+
+    by_block = {}
+    for row, leaf in zip(anchored, leaves):
+        by_block.setdefault(row['bloque_id'], []).append((row, leaf))
+
+    failed = []
+    for block_id, members in by_block.items():
+        block = blocks.get(block_id)
+        if block is None or not block['valido']:
+            failed.extend(row['id'] for row, _ in members)
+            continue
+        # Bloque completo: reconstruir la raíz una vez (n hashes) en lugar de n pruebas (n log n)
+        if len(members) == block['cantidad_transacciones']:
+            members.sort(key=lambda member: member[0]['indice'])
+            if build_tree([leaf for _, leaf in members])[-1][0] == block['merkle_root']:
+                continue
+        # Bloque parcial o raíz distinta: una prueba por transacción para saber cuáles fallan
+        for row, leaf in members:
+            if leaf != row['hoja'] or not verify_proof(leaf, json.loads(row['prueba']), block['merkle_root']):
+                failed.append(row['id'])
+    return {'verified': len(anchored) - len(failed), 'failed': sorted(failed), 'pending': pending,
+            'blocks': sorted(blocks)}
+
+
+def verify_transactions(cursor, transaction_ids=None, desde=None, hasta=None, producto_id=None):
+    """Verificar un conjunto de transacciones (por ids, rango de fechas o producto)"""
+    conditions, params = [], []
+    if desde:
+        conditions.append('t.fecha_creacion >= ?')
+        params.append(desde)
+    if hasta:
+        conditions.append('t.fecha_creacion <= ?')
+        params.append(hasta)
+    if producto_id is not None:
+        conditions.append('t.producto_id = ?')
+        params.append(producto_id)
+
+    rows = []
+    if transaction_ids is not None:
+        ids = list(dict.fromkeys(transaction_ids))
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = ids[start:start + IN_CHUNK_SIZE]
+            where = ' AND '.join(conditions + [f't.id IN ({",".join("?" * len(chunk))})'])
+            cursor.execute(f'{TX_PROOF_QUERY} WHERE {where}', params + chunk)
+            rows.extend(cursor.fetchall())
+        missing = sorted(set(ids) - {row['id'] for row in rows})
+    else:
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        cursor.execute(f'{TX_PROOF_QUERY} {where} ORDER BY t.id LIMIT ?', params + [MAX_VERIFY + 1])
+        rows = cursor.fetchall()
+        missing = []
+
+    truncated = len(rows) > MAX_VERIFY
+    rows = rows[:MAX_VERIFY]
+    result = verify_rows(cursor, rows)
+    result.update({'checked': len(rows), 'not_found': missing, 'truncated': truncated})
+    return result
@@ -0,0 +1,11 @@
+from shared.search import SEARCH_INDEX_DDL
+
+
+def ensure_search_index(cursor):
+    """Crear el índice de búsqueda y poblarlo si todavía no existe"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'productos_fts'")
+    exists = cursor.fetchone() is not None
+    for statement in SEARCH_INDEX_DDL:
+        cursor.execute(statement)
+    if not exists:
+        cursor.execute("INSERT INTO productos_fts (productos_fts) VALUES ('rebuild')")
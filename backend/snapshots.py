@@ -0,0 +1,185 @@
+# Inventario a una fecha: fotos periódicas por producto y ubicación más el registro de
+# movimientos posteriores.
+#
+# transacciones no alcanza para reconstruir el stock: los pedidos descuentan inventario
+# sin transacción y los datos iniciales se cargan directo. Los triggers de
+# movimientos_inventario registran cada cambio de inventario.cantidad (delta) dentro de
+# la misma transacción que lo hace, venga de donde venga, igual que stock_totals.
+#
+# Una foto guarda las cantidades distintas de cero y el último movimiento que incluye.
+# El stock a la fecha D es la última foto anterior a D más los movimientos entre esa foto
+# y D: los ids de movimiento crecen con la fecha (SQLite serializa las escrituras), así
+# que el tramo a sumar es un rango de la clave primaria. InventorySnapshots toma una
+# foto cuando se acumulan SNAPSHOT_EVERY movimientos o la última tiene más de
+# SNAPSHOT_MAX_AGE, de modo que el tramo queda acotado aunque el registro crezca.
+
+import logging
+import os
+import threading
+
+from db import PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_EVERY = 10000  # movimientos desde la última foto
+SNAPSHOT_MAX_AGE = 24 * 3600  # segundos, si hubo movimientos
+SNAPSHOT_INTERVAL = 60  # segundos entre revisiones del hilo
+
+# Operador de la fecha pedida -> operador de "posterior a la fecha"
+_AFTER = {'<': '>=', '<=': '>'}
+
+
+class NoHistory(Exception):
+    """No hay foto de inventario anterior a la fecha pedida"""
+
+
+def take_snapshot(conn):
+    """Foto del inventario actual; devuelve su id, o None si no hubo movimientos desde la anterior"""
+    conn.commit()
+    cursor = conn.cursor()
+    # Bajo el bloqueo de escritura: ningún movimiento entra entre leer el último id y copiar inventario
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM movimientos_inventario')
+        last_movement = cursor.fetchone()[0]
+        cursor.execute('SELECT MAX(ultimo_movimiento_id) FROM snapshots_inventario')
+        if cursor.fetchone()[0] == last_movement:
+            conn.rollback()
+            return None
+        cursor.execute('INSERT INTO snapshots_inventario (ultimo_movimiento_id) VALUES (?)', (last_movement,))
+        snapshot_id = cursor.lastrowid
+        cursor.execute('''
+            INSERT INTO snapshot_lineas (snapshot_id, producto_id, ubicacion_id, cantidad)
+            SELECT ?, producto_id, ubicacion_id, cantidad FROM inventario WHERE cantidad != 0
+        ''', (snapshot_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return snapshot_id
+
+
+def snapshot_due(cursor, every=SNAPSHOT_EVERY, max_age=SNAPSHOT_MAX_AGE):
+    """¿Corresponde una foto nueva? Por cantidad de movimientos o por antigüedad de la última"""
+    cursor.execute('''
+        SELECT s.ultimo_movimiento_id, (julianday('now') - julianday(s.fecha)) * 86400
+        FROM snapshots_inventario s ORDER BY s.id DESC LIMIT 1
+    ''')
+    row = cursor.fetchone()
+    last_movement, age = (row[0], row[1]) if row else (0, None)
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM movimientos_inventario')
+    pending = cursor.fetchone()[0] - last_movement
+    return pending >= every or (pending > 0 and (age is None or age >= max_age))
+
+
+def stock_as_of(cursor, date_bound, producto_id=None, ubicacion_id=None):
+    """Stock por producto y ubicación a una fecha.
+
+    `date_bound` es (operador, fecha) como lo devuelve parse_date_range para `hasta`.
+    Devuelve (filas, foto, movimientos sumados); lanza NoHistory si no hay foto anterior.
+    """
+    op, value = date_bound
+    cursor.execute(f'''
+        SELECT id, fecha, ultimo_movimiento_id FROM snapshots_inventario
+        WHERE fecha {op} ? ORDER BY fecha DESC, id DESC LIMIT 1
+    ''', (value,))
+    snapshot = cursor.fetchone()
+    if snapshot is None:
+        raise NoHistory()
+
+    # Último movimiento hasta la fecha: el anterior al primero posterior a ella
+    cursor.execute(f'''
+        SELECT id FROM movimientos_inventario WHERE fecha {_AFTER[op]} ? ORDER BY fecha, id LIMIT 1
+    ''', (value,))
+    row = cursor.fetchone()
+    if row is not None:
+        until = row[0] - 1
+    else:
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM movimientos_inventario')
+        until = cursor.fetchone()[0]
+    since = snapshot['ultimo_movimiento_id']
+
+    filters, params = '', []
+    if producto_id:
+        filters += ' AND producto_id = ?'
+        params.append(producto_id)
+    if ubicacion_id:
+        filters += ' AND ubicacion_id = ?'
+        params.append(ubicacion_id)
+
+    cursor.execute(f'''
+        SELECT s.producto_id, p.codigo, p.nombre, s.ubicacion_id, u.nombre AS ubicacion_nombre, s.cantidad
+        FROM (
+            SELECT producto_id, ubicacion_id, SUM(cantidad) AS cantidad
+            FROM (
+                SELECT producto_id, ubicacion_id, cantidad FROM snapshot_lineas
+                WHERE snapshot_id = ?{filters}
+                UNION ALL
+                SELECT producto_id, ubicacion_id, delta FROM movimientos_inventario
+                WHERE id > ? AND id <= ?{filters}
+            )
+            GROUP BY producto_id, ubicacion_id
+            HAVING SUM(cantidad) != 0
+        ) s
+        JOIN productos p ON p.id = s.producto_id
+        JOIN ubicaciones u ON u.id = s.ubicacion_id
+        ORDER BY s.producto_id, s.ubicacion_id
+    ''', [snapshot['id']] + params + [since, until] + params)
+    return cursor.fetchall(), snapshot, max(0, until - since)
+
+
+class InventorySnapshots:
+    """Hilo que toma una foto cuando corresponde (snapshot_due), revisando cada `interval` segundos"""
+
+    def __init__(self, pool, interval=SNAPSHOT_INTERVAL, every=SNAPSHOT_EVERY, max_age=SNAPSHOT_MAX_AGE):
+        self.pool = pool
+        self.interval = interval
+        self.every = every
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """Arrancar el hilo con la primera petición de cada proceso que sirve (como JobWorkers)"""
+        app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            self.start()
+
+    def start(self):
+        """Arrancar el hilo; una sola vez por proceso"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return self
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='inventory-snapshots', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            conn = None
+            try:
+                conn = self.pool.acquire()
+                if snapshot_due(conn.cursor(), self.every, self.max_age):
+                    snapshot_id = take_snapshot(conn)
+                    if snapshot_id:
+                        logger.info('Foto de inventario %s tomada', snapshot_id)
+                conn.commit()
+            except PoolTimeout:
+                logger.warning('Sin conexión libre para la foto de inventario; se reintenta en %s s', self.interval)
+            except Exception:
+                if conn is not None:
+                    conn.rollback()
+                logger.exception('Error al tomar la foto de inventario')
+            finally:
+                if conn is not None:
+                    self.pool.release(conn)
@@ -0,0 +1,105 @@
+# Totales de stock materializados por producto.
+#
+# stock_totals guarda SUM(inventario.cantidad) por producto y la marca de
+# stock bajo. Los triggers sobre inventario y productos la actualizan dentro
+# de la misma transacción que modifica el inventario, así que cualquier
+# escritura (create_transaction, create_order, ajustes manuales) la mantiene
+# consistente sin código adicional en las rutas.
+
+# Recalcular la marca de stock bajo de un producto ({id} = expresión del trigger)
+_REFRESH_FLAG = '''
+        UPDATE stock_totals SET bajo_stock = COALESCE((
+            SELECT p.activo = 1 AND p.stock_minimo > 0 AND stock_totals.stock_total <= p.stock_minimo
+            FROM productos p WHERE p.id = stock_totals.producto_id
+        ), 0)
+        WHERE producto_id = {id};'''
+
+_ADD_STOCK = '''
+        INSERT INTO stock_totals (producto_id, stock_total) VALUES ({id}, {delta})
+        ON CONFLICT(producto_id) DO UPDATE SET stock_total = stock_total + excluded.stock_total;'''
+
+STOCK_TOTALS_DDL = [
+    '''
+    CREATE TABLE IF NOT EXISTS stock_totals (
+        producto_id INTEGER PRIMARY KEY,
+        stock_total INTEGER NOT NULL DEFAULT 0,
+        bajo_stock BOOLEAN NOT NULL DEFAULT 0,
+        FOREIGN KEY (producto_id) REFERENCES productos (id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_stock_totals_total ON stock_totals (stock_total)',
+    'CREATE INDEX IF NOT EXISTS idx_stock_totals_bajo_stock ON stock_totals (producto_id) WHERE bajo_stock = 1',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS stock_totals_inventario_ai AFTER INSERT ON inventario BEGIN
+        {_ADD_STOCK.format(id='new.producto_id', delta='new.cantidad')}
+        {_REFRESH_FLAG.format(id='new.producto_id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS stock_totals_inventario_au AFTER UPDATE OF producto_id, cantidad ON inventario BEGIN
+        {_ADD_STOCK.format(id='old.producto_id', delta='-old.cantidad')}
+        {_ADD_STOCK.format(id='new.producto_id', delta='new.cantidad')}
+        {_REFRESH_FLAG.format(id='old.producto_id')}
+        {_REFRESH_FLAG.format(id='new.producto_id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS stock_totals_inventario_ad AFTER DELETE ON inventario BEGIN
+        {_ADD_STOCK.format(id='old.producto_id', delta='-old.cantidad')}
+        {_REFRESH_FLAG.format(id='old.producto_id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS stock_totals_productos_ai AFTER INSERT ON productos BEGIN
+        INSERT OR IGNORE INTO stock_totals (producto_id) VALUES (new.id);
+        {_REFRESH_FLAG.format(id='new.id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS stock_totals_productos_au AFTER UPDATE OF stock_minimo, activo ON productos BEGIN
+        {_REFRESH_FLAG.format(id='new.id')}
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS stock_totals_productos_ad AFTER DELETE ON productos BEGIN
+        DELETE FROM stock_totals WHERE producto_id = old.id;
+    END
+    ''',
+]
+
+# Valores esperados, calculados desde cero a partir de inventario
+EXPECTED_STOCK_TOTALS = '''
+    SELECT p.id as producto_id,
+           COALESCE(SUM(i.cantidad), 0) as stock_total,
+           (p.activo = 1 AND p.stock_minimo > 0 AND COALESCE(SUM(i.cantidad), 0) <= p.stock_minimo) as bajo_stock
+    FROM productos p
+    LEFT JOIN inventario i ON i.producto_id = p.id
+    GROUP BY p.id
+'''
+
+
+def ensure_stock_totals(cursor):
+    """Crear la tabla y los triggers; poblarla la primera vez"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'stock_totals_inventario_ai'")
+    exists = cursor.fetchone() is not None
+    for statement in STOCK_TOTALS_DDL:
+        cursor.execute(statement)
+    if not exists:
+        rebuild_stock_totals(cursor)
+
+
+def rebuild_stock_totals(cursor):
+    cursor.execute('DELETE FROM stock_totals')
+    cursor.execute(f'INSERT INTO stock_totals (producto_id, stock_total, bajo_stock) {EXPECTED_STOCK_TOTALS}')
+
+
+def verify_stock_totals(cursor):
+    """Productos cuyo total materializado no coincide con inventario"""
+    cursor.execute(f'''
+        SELECT e.producto_id, e.stock_total as esperado, s.stock_total as actual,
+               e.bajo_stock as bajo_stock_esperado, s.bajo_stock as bajo_stock_actual
+        FROM ({EXPECTED_STOCK_TOTALS}) e
+        LEFT JOIN stock_totals s ON s.producto_id = e.producto_id
+        WHERE s.producto_id IS NULL OR s.stock_total != e.stock_total OR s.bajo_stock != e.bajo_stock
+    ''')
+    return cursor.fetchall()
@@ -0,0 +1,84 @@
+# Versiones por tabla para GET condicionales (ETag / Last-Modified).
+#
+# Los triggers incrementan versiones_tablas en cada escritura, sin importar qué
+# ruta, hilo o proceso escribe. Una ruta condicional solo lee las versiones de
+# las tablas de las que depende: si el cliente ya tiene esa combinación responde
+# 304 sin ejecutar la consulta ni serializar JSON.
+#
+# La migración 7 limita el trigger de UPDATE de productos a las columnas que se
+# sirven (el anclaje escribe blockchain_hash) y versiona costos_inventario, que se
+# crea en la migración 6 y por eso no está en VERSIONED_TABLES.
+
+import functools
+import hashlib
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from flask import Response, current_app, request
+
+VERSIONED_TABLES = ('productos', 'inventario', 'categorias', 'ubicaciones')
+
+
+def _bump(table):
+    return (f"UPDATE versiones_tablas SET version = version + 1, actualizado = CURRENT_TIMESTAMP "
+            f"WHERE tabla = '{table}';")
+
+
+def ensure_table_versions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS versiones_tablas (
+            tabla VARCHAR(50) PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for table in VERSIONED_TABLES:
+        cursor.execute('INSERT OR IGNORE INTO versiones_tablas (tabla) VALUES (?)', (table,))
+        for event, suffix in (('INSERT', 'ai'), ('UPDATE', 'au'), ('DELETE', 'ad')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS versiones_{table}_{suffix} AFTER {event} ON {table} BEGIN
+                    {_bump(table)}
+                END
+            ''')
+
+
+def table_versions(cursor, tables):
+    cursor.execute(f'SELECT tabla, version, actualizado FROM versiones_tablas '
+                   f'WHERE tabla IN ({",".join("?" * len(tables))})', tables)
+    return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+
+def make_conditional(get_db):
+    """Decorador de GET condicional ligado a la conexión de la petición"""
+    def conditional(*tables):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                versions = table_versions(get_db().cursor(), tables)
+                key = '|'.join(f'{table}:{versions[table][0]}' for table in tables)
+                query = urlencode(sorted(request.args.items(multi=True)))
+                etag = hashlib.sha1(f'{request.path}?{query}|{key}'.encode('utf-8')).hexdigest()
+                last_modified = max(datetime.strptime(updated, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+                                    for _, updated in versions.values())
+
+                # Con If-None-Match decide solo el ETag. If-Modified-Since tiene resolución de
+                # segundos: una escritura en el mismo segundo que la fecha del cliente no se
+                # distingue, así que ese segundo cuenta como modificado
+                if request.if_none_match:
+                    not_modified = request.if_none_match.contains(etag)
+                else:
+                    not_modified = request.if_modified_since is not None and last_modified < request.if_modified_since
+                if not_modified:
+                    response = Response(status=304)
+                else:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
+    return conditional
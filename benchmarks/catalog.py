@@ -0,0 +1,197 @@
+# Latencia del catálogo según su tamaño, en los dos árboles, y consultas base contra las actuales.
+#
+#   python benchmarks/catalog.py                          # 1k, 10k y 100k productos
+#   python benchmarks/catalog.py --sizes 1000,20000 --repeat 9
+#
+# Copia backend/, src/ y shared/ a un directorio temporal (como tests/) y llena las dos bases con el
+# mismo catálogo sintético, creciendo de un tamaño al siguiente. Para cada tamaño mide:
+#
+# - GET /api/products con el cliente de pruebas de Flask (sin red ni servidor): primera
+#   página de 50, listado completo y ?search= de 50 con un término frecuente y otro
+#   selectivo. La caché de respuestas se vacía antes de cada petición y no se manda
+#   If-None-Match, así se mide siempre la consulta.
+# - En la base de backend/, la consulta original del catálogo (JOIN con inventario y
+#   GROUP BY) contra la actual (stock_totals), y la búsqueda con LIKE '%término%' en las
+#   tres columnas contra MATCH sobre productos_fts.
+#
+# Se reporta la mediana en milisegundos. Todo corre en un proceso: los números sirven para
+# comparar entre sí, no como capacidad del servidor (para eso, backend/loadtest.py).
+
+import argparse
+import importlib
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+IGNORE = shutil.ignore_patterns("__pycache__", "*.db", "*.db-wal", "*.db-shm")
+
+BRANDS = ["Dell", "Lenovo", "HP", "Asus", "Acer", "Samsung", "LG", "Sony", "Logitech", "Kingston"]
+KINDS = ["Laptop", "Monitor", "Teclado", "Mouse", "Impresora", "Tablet", "Auriculares", "Disco", "Memoria", "Router"]
+WORDS = ["inalámbrico", "gamer", "oficina", "portátil", "negro", "blanco", "compacto", "profesional",
+         "ergonómico", "rápido", "silencioso", "resistente", "garantía", "USB", "HDMI", "bluetooth"]
+# Un término frecuente (~10% del catálogo) y uno selectivo (un número de producto)
+SEARCH_TERMS = ("lap", "4242")
+CHUNK = 10_000
+
+# Consultas de backend/app.py antes de stock_totals (user-001) y de productos_fts (user-004)
+BASELINE_CATALOG = """
+    SELECT p.*, c.nombre as categoria_nombre, COALESCE(SUM(i.cantidad), 0) as stock_total
+    FROM productos p
+    LEFT JOIN categorias c ON p.categoria_id = c.id
+    LEFT JOIN inventario i ON p.id = i.producto_id
+    WHERE p.activo = 1
+"""
+BASELINE_SEARCH = " AND (p.codigo LIKE ? OR p.nombre LIKE ? OR p.descripcion LIKE ?)"
+
+
+def load_backend(workdir):
+    shutil.copytree(ROOT / "shared", workdir / "shared", ignore=IGNORE)
+    root = workdir / "backend"
+    shutil.copytree(ROOT / "backend", root, ignore=IGNORE)
+    (root / "database").mkdir(exist_ok=True)
+    os.chdir(root)  # DATABASE_PATH es relativa al directorio de trabajo
+    sys.path.insert(0, str(root))
+    module = importlib.import_module("app")
+    return module, str(root / module.DATABASE_PATH)
+
+
+def load_src(workdir):
+    shutil.copytree(ROOT / "src", workdir / "src", ignore=IGNORE)
+    sys.path.insert(0, str(workdir))
+    module = importlib.import_module("src.main")
+    return module, str(workdir / "src" / "database" / "app.db")
+
+
+def ensure_reference_data(database):
+    connection = sqlite3.connect(database)
+    if connection.execute("SELECT COUNT(*) FROM categorias").fetchone()[0] == 0:
+        connection.execute("INSERT INTO categorias (nombre, activo, fecha_creacion) VALUES ('General', 1, CURRENT_TIMESTAMP)")
+    for ubicacion_id in (1, 2):
+        connection.execute("INSERT OR IGNORE INTO ubicaciones (id, nombre, activo, fecha_creacion) "
+                           "VALUES (?, ?, 1, CURRENT_TIMESTAMP)", (ubicacion_id, f"Ubicación {ubicacion_id}"))
+    connection.commit()
+    connection.close()
+
+
+def grow_catalog(database, size, seed):
+    # Agregar productos sintéticos hasta llegar a `size`, con stock en dos ubicaciones
+    connection = sqlite3.connect(database)
+    current = connection.execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+    categories = [row[0] for row in connection.execute("SELECT id FROM categorias")]
+    rnd = random.Random(seed + current)
+    # Transacciones de CHUNK filas: la base de src/ no usa WAL y una sola transacción
+    # larga dejaría a los hilos de la aplicación esperando el bloqueo
+    for start in range(current, size, CHUNK):
+        stock = []
+        for n in range(start, min(start + CHUNK, size)):
+            nombre = f"{rnd.choice(KINDS)} {rnd.choice(BRANDS)} {rnd.choice(WORDS)} {n}"
+            descripcion = " ".join(rnd.sample(WORDS, 6))
+            precio = round(rnd.uniform(5, 2000), 2)
+            producto_id = connection.execute(
+                "INSERT INTO productos (codigo, nombre, descripcion, categoria_id, precio_unitario, precio_venta, activo, "
+                "disponible_venta) VALUES (?, ?, ?, ?, ?, ?, 1, 1)",
+                (f"BM-{n:07d}", nombre, descripcion, rnd.choice(categories), precio, round(precio * 1.3, 2))).lastrowid
+            stock.extend([(producto_id, 1, rnd.randint(0, 50)), (producto_id, 2, rnd.randint(0, 10))])
+        connection.executemany("INSERT INTO inventario (producto_id, ubicacion_id, cantidad) VALUES (?, ?, ?)", stock)
+        connection.commit()
+    connection.execute("ANALYZE")
+    connection.close()
+
+
+def median_ms(fn, repeat):
+    fn()  # calentar caché de páginas de SQLite
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def http_timings(module, repeat):
+    client = module.app.test_client()
+
+    def get(url):
+        def request():
+            module.response_cache.invalidate("products")
+            response = client.get(url)
+            assert response.status_code == 200, response.get_json()
+        return request
+
+    timings = {
+        "página de 50": median_ms(get("/api/products?limit=50"), repeat),
+        "listado completo": median_ms(get("/api/products"), max(3, repeat // 3)),
+    }
+    for term in SEARCH_TERMS:
+        timings[f"búsqueda '{term}' (50)"] = median_ms(get(f"/api/products?search={term}&limit=50"), repeat)
+    return timings
+
+
+def sql_timings(module, database, repeat):
+    connection = sqlite3.connect(database)
+    catalog, catalog_params = module.catalog_query()
+
+    def run(query, params=()):
+        return lambda: connection.execute(query, params).fetchall()
+
+    timings = {
+        "catálogo: JOIN + GROUP BY": run(BASELINE_CATALOG + " GROUP BY p.id ORDER BY p.nombre"),
+        "catálogo: stock_totals": run(catalog + " ORDER BY p.nombre, p.id", catalog_params),
+    }
+    for term in SEARCH_TERMS:
+        like = (f"%{term}%",) * 3
+        search, search_params = module.catalog_query(match=module.fts_query(term))
+        like_query = BASELINE_CATALOG + BASELINE_SEARCH + " GROUP BY p.id ORDER BY p.nombre"
+        timings[f"búsqueda '{term}': LIKE"] = run(like_query, like)
+        timings[f"búsqueda '{term}': FTS5"] = run(search + " ORDER BY f.search_rank, p.id", search_params)
+        timings[f"búsqueda '{term}' (50): LIKE"] = run(like_query + " LIMIT 51", like)
+        timings[f"búsqueda '{term}' (50): FTS5"] = run(search + " ORDER BY f.search_rank, p.id LIMIT 51", search_params)
+    results = {name: median_ms(fn, repeat) for name, fn in timings.items()}
+    connection.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia del catálogo según su tamaño")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Tamaños de catálogo, separados por coma")
+    parser.add_argument("--repeat", type=int, default=7, help="Repeticiones por medición (se reporta la mediana)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    workdir = Path(tempfile.mkdtemp(prefix="catalog-bench-"))
+    try:
+        backend, backend_db = load_backend(workdir)
+        src, src_db = load_src(workdir)
+        # Leer el catálogo no encola trabajos: sin hilos de la cola sondeando mientras se carga
+        for module in (backend, src):
+            module.job_workers.stop()
+        for database in (backend_db, src_db):
+            ensure_reference_data(database)
+
+        for size in sizes:
+            for database in (backend_db, src_db):
+                grow_catalog(database, size, args.seed)
+            print(f"\n== {size} productos ==")
+            print(f"{'GET /api/products':<36} {'backend ms':>11} {'src ms':>11}")
+            backend_http = http_timings(backend, args.repeat)
+            src_http = http_timings(src, args.repeat)
+            for name in backend_http:
+                print(f"{name:<36} {backend_http[name]:>11.2f} {src_http[name]:>11.2f}")
+            print(f"{'SQL (base de backend/)':<36} {'ms':>11}")
+            for name, ms in sql_timings(backend, backend_db, args.repeat).items():
+                print(f"{name:<36} {ms:>11.2f}")
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ const OrdersScreen = ({ navigation }) => {
   const { user } = useAuth();
   const [orders, setOrders] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     loadOrders();
@@ -18,8 +20,9 @@ const OrdersScreen = ({ navigation }) => {
   const loadOrders = async () => {
     try {
       setLoading(true);
-      const response = await orderService.getOrders(user.id);
+      const response = await orderService.getOrders(user.id, { limit: 20 });
       setOrders(response.orders);
+      setNextCursor(response.next_cursor);
     } catch (error) {
       console.error('Error loading orders:', error);
     } finally {
@@ -27,6 +30,20 @@ const OrdersScreen = ({ navigation }) => {
     }
   };
 
+  const loadMoreOrders = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const response = await orderService.getOrders(user.id, { limit: 20, cursor: nextCursor });
+      setOrders(prev => [...prev, ...response.orders]);
+      setNextCursor(response.next_cursor);
+    } catch (error) {
+      console.error('Error loading more orders:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const getStatusColor = (status) => {
     const colors = {
       'pendiente': '#f39c12',
@@ -149,6 +166,8 @@ const OrdersScreen = ({ navigation }) => {
         contentContainerStyle={styles.ordersList}
         refreshing={loading}
         onRefresh={loadOrders}
+        onEndReached={loadMoreOrders}
+        onEndReachedThreshold={0.5}
         showsVerticalScrollIndicator={false}
       />
     </View>
@@ -11,6 +11,8 @@ const TransactionsScreen = ({ navigation }) => {
   const [searchQuery, setSearchQuery] = useState('');
   const [filterType, setFilterType] = useState('all');
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [modalVisible, setModalVisible] = useState(false);
   const [newTransaction, setNewTransaction] = useState({
     producto_id: '',
@@ -32,6 +34,7 @@ const TransactionsScreen = ({ navigation }) => {
         productService.getProducts(),
       ]);
       setTransactions(transactionsResponse.transactions);
+      setNextCursor(transactionsResponse.next_cursor);
       setProducts(productsResponse.products);
     } catch (error) {
       console.error('Error loading data:', error);
@@ -40,6 +43,20 @@ const TransactionsScreen = ({ navigation }) => {
     }
   };
 
+  const loadMoreTransactions = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const response = await transactionService.getTransactions({ cursor: nextCursor });
+      setTransactions(prev => [...prev, ...response.transactions]);
+      setNextCursor(response.next_cursor);
+    } catch (error) {
+      console.error('Error loading more transactions:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const transactionTypes = [
     { id: 1, name: 'Compra', type: 'entrada', icon: 'cart-plus', color: '#27ae60' },
     { id: 2, name: 'Venta', type: 'salida', icon: 'cart-minus', color: '#e74c3c' },
@@ -200,6 +217,8 @@ const TransactionsScreen = ({ navigation }) => {
         contentContainerStyle={styles.transactionsList}
         refreshing={loading}
         onRefresh={loadData}
+        onEndReached={loadMoreTransactions}
+        onEndReachedThreshold={0.5}
         ListEmptyComponent={
           <View style={styles.emptyContainer}>
             <MaterialCommunityIcons name="swap-horizontal" size={64} color="#bdc3c7" />
@@ -10,8 +10,13 @@ const api = axios.create({
   headers: {
     'Content-Type': 'application/json',
   },
+  // 304 es una respuesta válida: se resuelve con los datos guardados para ese ETag
+  validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
 });
 
+// Última respuesta GET por URL y su ETag, para revalidar con If-None-Match
+const etagCache = new Map();
+
 // Interceptor para añadir token de autenticación
 api.interceptors.request.use(
   async (config) => {
@@ -19,6 +24,12 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if (config.method === 'get') {
+      const cached = etagCache.get(api.getUri(config));
+      if (cached) {
+        config.headers['If-None-Match'] = cached.etag;
+      }
+    }
     return config;
   },
   (error) => {
@@ -28,12 +39,26 @@ api.interceptors.request.use(
 
 // Interceptor para manejar respuestas
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    if (response.config.method !== 'get') {
+      return response;
+    }
+    const key = api.getUri(response.config);
+    if (response.status === 304) {
+      const cached = etagCache.get(key);
+      return { ...response, status: 200, data: cached ? cached.data : response.data };
+    }
+    if (response.headers.etag) {
+      etagCache.set(key, { etag: response.headers.etag, data: response.data });
+    }
+    return response;
+  },
   async (error) => {
     if (error.response?.status === 401) {
       // Token expirado, limpiar storage
       await SecureStore.deleteItemAsync('authToken');
       await SecureStore.deleteItemAsync('userInfo');
+      etagCache.clear();
     }
     return Promise.reject(error);
   }
@@ -55,6 +80,12 @@ export const authService = {
     const response = await api.get('/auth/profile');
     return response.data;
   },
+
+  // Solo administradores; los tokens anteriores del usuario quedan revocados
+  updateUserAccess: async (userId, access) => {
+    const response = await api.put(`/auth/users/${userId}/access`, access);
+    return response.data;
+  },
 };
 
 // Servicios de productos
@@ -128,11 +159,16 @@ export const orderService = {
     return response.data;
   },
   
-  getOrders: async (userId) => {
-    const response = await api.get(`/orders/user/${userId}`);
+  getOrders: async (userId, params = {}) => {
+    const response = await api.get(`/orders/user/${userId}`, { params });
     return response.data;
   },
   
+  getAllOrders: async (params = {}) => {
+    const response = await api.get('/orders', { params });
+    return response.data;
+  },
+
   getOrder: async (orderId) => {
     const response = await api.get(`/orders/${orderId}`);
     return response.data;
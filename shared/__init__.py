@@ -0,0 +1,8 @@
+# Código común a backend/ (Flask + sqlite3) y src/ (Flask-SQLAlchemy) que no depende de
+# cómo cada árbol accede a la base: puente ASGI, caché de respuestas, hash de
+# contraseñas, serialización de filas, validación de pedidos, forma canónica de las
+# transacciones, árbol Merkle, capas de costo y pronóstico de demanda. Cada árbol
+# conserva su configuración y sus instancias.
+#
+# src/ se importa desde la raíz del repositorio; backend/ se ejecuta desde su carpeta
+# y agrega la raíz a sys.path en sus puntos de entrada (app.py y asgi.py).
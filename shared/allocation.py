@@ -0,0 +1,37 @@
+# Partes de la asignación de stock que no dependen de la base: cada árbol arma sus
+# estrategias y descuenta el stock con su propio acceso a datos (allocation.py en
+# backend/, services/allocation.py en src/).
+
+DEFAULT_LOCATION_ID = 1  # Almacén Principal
+
+
+class InsufficientStock(Exception):
+    def __init__(self, producto_id, solicitado, disponible):
+        super().__init__(f'Stock insuficiente para el producto {producto_id}: '
+                         f'solicitado {solicitado}, disponible {disponible}')
+        self.producto_id = producto_id
+        self.solicitado = solicitado
+        self.disponible = disponible
+
+
+def merge_items(items):
+    """Sumar las cantidades pedidas por producto (un pedido puede repetir líneas)"""
+    cantidades = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('Cada renglón del pedido debe ser un objeto')
+        producto_id = item.get('producto_id')
+        cantidad = item.get('cantidad')
+        if not isinstance(producto_id, int) or isinstance(producto_id, bool) or producto_id <= 0:
+            raise ValueError(f'Producto inválido: {producto_id!r}')
+        if not isinstance(cantidad, int) or isinstance(cantidad, bool) or cantidad <= 0:
+            raise ValueError(f'Cantidad inválida para el producto {producto_id}')
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return cantidades
+
+
+def preferred_location(value):
+    """Validar ubicacion_preferida del pedido: id positivo, o None para no preferir ninguna"""
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+        raise ValueError(f'Ubicación preferida inválida: {value!r}')
+    return value
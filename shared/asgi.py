@@ -0,0 +1,131 @@
+# Puente ASGI -> WSGI para servir la aplicación de Flask con uvicorn.
+#
+# Las rutas de Flask y el acceso a SQLite son bloqueantes, así que el puente las ejecuta
+# en un executor acotado y el bucle de eventos solo espera: las peticiones que exceden la
+# capacidad esperan en la cola del executor sin ocupar un hilo ni una conexión. Las
+# respuestas en streaming (exportaciones) se leen bloque a bloque, cada uno en el
+# executor, de modo que una exportación lenta no retiene el bucle ni un hilo entre bloques.
+#
+# `routes` son rutas GET que se atienden directamente en el bucle (p. ej. /health, que
+# debe responder aunque todos los hilos estén ocupados); `on_startup` y `on_shutdown`
+# corren en el lifespan de ASGI.
+
+import asyncio
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_environ(scope, body):
+    """Entorno WSGI (PEP 3333) a partir del scope HTTP de ASGI"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class AsgiBridge:
+    """Aplicación ASGI que sirve una aplicación WSGI desde un executor acotado"""
+
+    def __init__(self, wsgi_app, workers, routes=None, on_startup=None, on_shutdown=None):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wsgi')
+        self.routes = routes or {}
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            route = self.routes.get(scope['path'])
+            if route is not None and scope['method'] == 'GET':
+                status, payload = await route()
+                await self._send_json(send, status, payload)
+            else:
+                await self._handle(scope, receive, send)
+        else:
+            raise RuntimeError(f'Tipo de conexión no soportado: {scope["type"]}')
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.on_startup:
+                    self.on_startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.on_shutdown:
+                    self.on_shutdown()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _send_json(self, send, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _handle(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                break
+
+        loop = asyncio.get_running_loop()
+        status, headers, result, chunks, first = await loop.run_in_executor(
+            self.executor, self._start, build_environ(scope, bytes(body)))
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            chunk = first
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    def _start(self, environ):
+        # Llama a la aplicación y lee el primer bloque: con él ya se llamó a start_response
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        result = self.wsgi_app(environ, start_response)
+        chunks = iter(result)
+        first = next(chunks, None)
+        return response['status'], response['headers'], result, chunks, first
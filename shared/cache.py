@@ -0,0 +1,230 @@
+# Caché de respuestas para rutas de lectura (catálogo, categorías, ubicaciones).
+#
+# Las respuestas se guardan por ruta + parámetros de consulta y llevan etiquetas
+# ('products', 'inventory', 'categories', ...). Las rutas que escriben invalidan
+# sus etiquetas después del commit; el TTL acota lo que pueda quedar obsoleto por
+# escrituras hechas fuera de la aplicación.
+
+import functools
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import Response, current_app, request
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 512
+
+
+class MemoryBackend:
+    """LRU con TTL en memoria del proceso"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # clave -> (expira, etiquetas, valor)
+        self._tags = {}  # etiqueta -> claves
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key):
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, tags, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, tuple(tags), value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'size': len(self._entries), 'max_entries': self.max_entries,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class SQLiteBackend:
+    """Caché en un archivo SQLite local, compartida por varios procesos de la misma máquina.
+
+    Al llenarse se descartan primero las entradas más próximas a expirar.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES * 8):
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=OFF')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS cache_entradas (
+                clave TEXT PRIMARY KEY,
+                valor BLOB NOT NULL,
+                expira REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_entradas_expira ON cache_entradas (expira);
+            CREATE TABLE IF NOT EXISTS cache_etiquetas (
+                etiqueta TEXT NOT NULL,
+                clave TEXT NOT NULL,
+                PRIMARY KEY (etiqueta, clave)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_cache_etiquetas_clave ON cache_etiquetas (clave);
+        ''')
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT valor, expira FROM cache_entradas WHERE clave = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._delete_keys([key])
+                self.expirations += 1
+                return None
+            return json.loads(row[0])
+
+    def _delete_keys(self, keys):
+        self._conn.executemany('DELETE FROM cache_entradas WHERE clave = ?', [(key,) for key in keys])
+        self._conn.executemany('DELETE FROM cache_etiquetas WHERE clave = ?', [(key,) for key in keys])
+
+    def set(self, key, value, tags, ttl):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('DELETE FROM cache_etiquetas WHERE clave = ?', (key,))
+                self._conn.execute('INSERT OR REPLACE INTO cache_entradas (clave, valor, expira) VALUES (?, ?, ?)',
+                                   (key, json.dumps(value), time.time() + ttl))
+                self._conn.executemany('INSERT OR IGNORE INTO cache_etiquetas (etiqueta, clave) VALUES (?, ?)',
+                                       [(tag, key) for tag in tags])
+                overflow = self._conn.execute('SELECT COUNT(*) FROM cache_entradas').fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    victims = [row[0] for row in self._conn.execute(
+                        'SELECT clave FROM cache_entradas ORDER BY expira LIMIT ?', (overflow,))]
+                    self._delete_keys(victims)
+                    self.evictions += len(victims)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            keys = [row[0] for row in self._conn.execute(
+                f'SELECT DISTINCT clave FROM cache_etiquetas WHERE etiqueta IN ({",".join("?" * len(tags))})',
+                list(tags))]
+            self._delete_keys(keys)
+            self._conn.execute('COMMIT')
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._conn.executescript('DELETE FROM cache_entradas; DELETE FROM cache_etiquetas;')
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute('SELECT COUNT(*) FROM cache_entradas').fetchone()[0]
+            return {'backend': 'sqlite', 'size': size, 'max_entries': self.max_entries,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class ResponseCache:
+    """Decorador de caché para rutas GET; sin `backend` usa MemoryBackend"""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self._generations = {}  # etiqueta -> número de invalidaciones
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        """Configurar desde app.config: CACHE_BACKEND ('memory' o 'sqlite'), CACHE_PATH, CACHE_TTL"""
+        max_entries = app.config.get('CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+        if app.config.get('CACHE_BACKEND', 'memory') == 'sqlite':
+            self.backend = SQLiteBackend(app.config['CACHE_PATH'], max_entries)
+        else:
+            self.backend = MemoryBackend(max_entries)
+        self.ttl = app.config.get('CACHE_TTL', DEFAULT_TTL)
+
+    def _generation(self, tags):
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def cached(self, *tags, ttl=None):
+        """Cachear las respuestas 200 de una ruta GET bajo las etiquetas dadas"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                key = f'{request.path}?{urlencode(sorted(request.args.items(multi=True)))}'
+                value = self.backend.get(key)
+                if value is not None:
+                    self.hits += 1
+                    response = Response(value['body'], status=200, mimetype=value['mimetype'])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self.misses += 1
+                generation = self._generation(tags)
+                response = current_app.make_response(view(*args, **kwargs))
+                # Si una escritura invalidó las etiquetas mientras se armaba la respuesta, no guardarla
+                if response.status_code == 200 and self._generation(tags) == generation:
+                    self.backend.set(key, {'body': response.get_data(as_text=True), 'mimetype': response.mimetype},
+                                     tags, ttl or self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+        self.invalidations += 1
+        return self.backend.invalidate(tags)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return dict(self.backend.stats(), hits=self.hits, misses=self.misses, invalidations=self.invalidations,
+                    hit_ratio=round(self.hits / total, 4) if total else 0.0)
@@ -0,0 +1,27 @@
+# Forma canónica de una transacción, común a la cadena de hashes (ledger) y a las
+# hojas Merkle del anclaje. Cambiar TX_COLUMNS o la codificación invalida todos los
+# hashes ya guardados.
+
+import hashlib
+import json
+
+GENESIS_HASH = '0' * 64
+
+# Columnas de la fila canónica (en este orden), tal como están guardadas en SQLite
+TX_COLUMNS = ('id', 'producto_id', 'ubicacion_id', 'tipo_transaccion_id', 'cantidad', 'precio_unitario',
+              'total', 'referencia', 'observaciones', 'usuario_id', 'fecha_creacion')
+
+_ENCODER = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def canonical_transaction(row):
+    """Representación canónica (JSON compacto) de una transacción.
+
+    La fila debe empezar por las columnas de TX_COLUMNS, en ese orden.
+    """
+    return _ENCODER.encode(tuple(row[:len(TX_COLUMNS)])).encode('utf-8')
+
+
+def chain_hash(prev_hash, payload):
+    """hash_cadena = sha256(hash anterior || fila canónica)"""
+    return hashlib.sha256(prev_hash.encode('ascii') + payload).hexdigest()
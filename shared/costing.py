@@ -0,0 +1,145 @@
+# Cálculo de costos que no depende de la base: capas FIFO y costo promedio ponderado de
+# un producto en una ubicación (CostState) y el recálculo de una partición desde
+# movimientos_costo. Cada árbol lee y guarda el estado con su propio acceso a datos
+# (costing.py en backend/, services/costing.py en src/).
+#
+# Al escribir no se cargan todas las capas abiertas: la suma de `restante` de las capas
+# guardadas es siempre max(cantidad, 0), así que el estado sabe cuántas unidades quedan
+# sin leer. Una salida lee de la base solo las capas de la cabeza que consume (de a
+# LAYER_BATCH) y una entrada agrega su capa al final sin leer ninguna.
+
+import sqlite3
+from collections import defaultdict
+
+# Salidas que cuentan como costo de ventas; los ajustes mueven capas pero no son ventas
+COGS_ORIGINS = ('transaccion', 'pedido')
+ORIGINS = ('apertura', 'transaccion', 'pedido', 'ajuste')
+
+STATE_FIELDS = ('cantidad', 'costo_promedio', 'valor_fifo', 'salidas', 'costo_ventas_fifo', 'costo_ventas_promedio')
+
+# Capas leídas por consulta cuando una salida agota las que hay en memoria
+LAYER_BATCH = 16
+
+
+class CostState:
+    """Capas y costo promedio de un producto en una ubicación.
+
+    `fetch_layers(after_id, limit)` devuelve las capas guardadas con movimiento_id mayor
+    que `after_id`, la más antigua primero; sin él (recálculo) no hay capas guardadas.
+    """
+
+    __slots__ = ('layers', 'received', 'unloaded', 'loaded_upto', 'consumed_upto', 'new_ids', 'fetch_layers',
+                 'cantidad', 'costo_promedio', 'valor_fifo', 'salidas', 'costo_ventas_fifo', 'costo_ventas_promedio')
+
+    def __init__(self, row=None, fetch_layers=None):
+        (self.cantidad, self.costo_promedio, self.valor_fifo, self.salidas,
+         self.costo_ventas_fifo, self.costo_ventas_promedio) = row or (0, 0.0, 0.0, 0, 0.0, 0.0)
+        self.fetch_layers = fetch_layers
+        self.layers = []    # [movimiento_id, restante, costo] en memoria, la más antigua primero
+        self.received = []  # entradas nuevas que van detrás de capas guardadas sin leer
+        self.unloaded = max(self.cantidad, 0) if fetch_layers else 0  # unidades en capas sin leer
+        self.loaded_upto = 0    # última capa guardada leída
+        self.consumed_upto = 0  # última capa guardada agotada
+        self.new_ids = set()
+
+    def _head(self):
+        """Capa más antigua, leyendo de la base las que hagan falta; None si no quedan"""
+        if not self.layers and self.unloaded:
+            batch = [list(layer) for layer in self.fetch_layers(self.loaded_upto, LAYER_BATCH)]
+            if batch:
+                self.layers = batch
+                self.loaded_upto = batch[-1][0]
+                self.unloaded = max(self.unloaded - sum(layer[1] for layer in batch), 0)
+            else:
+                self.unloaded = 0
+        if not self.layers and not self.unloaded and self.received:
+            self.layers, self.received = self.received, []
+        return self.layers[0] if self.layers else None
+
+    def receive(self, movimiento_id, cantidad, costo):
+        # La parte que cubre un faltante anterior no forma capa
+        layered = cantidad - min(cantidad, max(-self.cantidad, 0))
+        if layered:
+            on_hand = max(self.cantidad, 0)
+            self.costo_promedio = (on_hand * self.costo_promedio + layered * costo) / (on_hand + layered)
+            (self.received if self.unloaded or self.received else self.layers).append([movimiento_id, layered, costo])
+            self.new_ids.add(movimiento_id)
+            self.valor_fifo += layered * costo
+        self.cantidad += cantidad
+
+    def issue(self, cantidad):
+        """Consumir `cantidad`; devuelve (costo FIFO, costo al promedio)"""
+        pending, costo_fifo = cantidad, 0.0
+        while pending:
+            layer = self._head()
+            if layer is None:
+                break
+            taken = min(pending, layer[1])
+            costo_fifo += taken * layer[2]
+            layer[1] -= taken
+            pending -= taken
+            if not layer[1]:
+                self.layers.pop(0)
+                if layer[0] not in self.new_ids:
+                    self.consumed_upto = layer[0]
+        self.valor_fifo = self.valor_fifo - costo_fifo if self.layers or self.unloaded or self.received else 0.0
+        self.cantidad -= cantidad
+        return costo_fifo + pending * self.costo_promedio, cantidad * self.costo_promedio
+
+    def apply(self, movimiento_id, cantidad, costo, origen):
+        """Aplicar un movimiento; devuelve (costo FIFO, costo al promedio) si es una venta"""
+        if cantidad > 0:
+            self.receive(movimiento_id, cantidad, costo)
+            return None
+        costo_fifo, costo_promedio = self.issue(-cantidad)
+        if origen not in COGS_ORIGINS:
+            return None
+        self.salidas -= cantidad
+        self.costo_ventas_fifo += costo_fifo
+        self.costo_ventas_promedio += costo_promedio
+        return costo_fifo, costo_promedio
+
+    def changed_layers(self):
+        """Capas a escribir al guardar: la cabeza leída (su restante pudo cambiar) y las nuevas"""
+        return [layer for index, layer in enumerate(self.layers + self.received)
+                if layer[0] in self.new_ids or (index == 0 and self.consumed_upto < layer[0] <= self.loaded_upto)]
+
+    def open_layers(self):
+        return self.layers + self.received
+
+    def row(self):
+        return (self.cantidad, self.costo_promedio, self.valor_fifo, self.salidas,
+                self.costo_ventas_fifo, self.costo_ventas_promedio)
+
+
+def replay_partition(database_path, partitions, part):
+    """Recalcular desde movimientos_costo los productos con producto_id % partitions == part"""
+    conn = sqlite3.connect(database_path)
+    try:
+        # En orden de id (lectura secuencial de la tabla): cada serie ve sus movimientos en orden
+        cursor = conn.execute('''
+            SELECT id, producto_id, ubicacion_id, cantidad, costo_unitario, origen, date(fecha)
+            FROM movimientos_costo WHERE producto_id % ? = ?
+        ''', (partitions, part))
+        states, costs = {}, []
+        daily = defaultdict(lambda: [0, 0.0, 0.0])
+        for movimiento_id, producto_id, ubicacion_id, cantidad, costo, origen, fecha in cursor:
+            key = (producto_id, ubicacion_id)
+            state = states.get(key)
+            if state is None:
+                state = states[key] = CostState()
+            cost = state.apply(movimiento_id, cantidad, costo, origen)
+            if cost is not None:
+                costs.append((*cost, movimiento_id))
+                totals = daily[(fecha, producto_id, ubicacion_id)]
+                totals[0] -= cantidad
+                totals[1] += cost[0]
+                totals[2] += cost[1]
+    finally:
+        conn.close()
+    return (
+        [(*key, *state.row()) for key, state in states.items()],
+        [(*key, *layer) for key, state in states.items() for layer in state.open_layers()],
+        costs,
+        [(*key, *totals) for key, totals in daily.items()],
+    )
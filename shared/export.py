@@ -0,0 +1,121 @@
+# Exportación en streaming (CSV o NDJSON, opcionalmente gzip): consultas, rango de fechas
+# y escritura de bloques, comunes a los dos árboles. Cada árbol ejecuta la consulta con su
+# propio acceso a datos y pasa las columnas y el fetchmany del resultado.
+#
+# Las filas se leen en bloques de FETCH_SIZE y se escriben en la respuesta a medida que
+# se leen: la memoria no crece con el tamaño del rango.
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+
+FETCH_SIZE = 1000
+
+EXPORTS = {
+    'transactions': {
+        'date_column': 't.fecha_creacion',
+        'query': '''
+            SELECT t.id, t.fecha_creacion, p.codigo AS producto_codigo, p.nombre AS producto_nombre,
+                   u.nombre AS ubicacion_nombre, tt.nombre AS tipo_nombre, tt.tipo AS movimiento,
+                   t.cantidad, t.precio_unitario, t.total, t.referencia, t.observaciones,
+                   us.username AS usuario, t.blockchain_confirmado, t.blockchain_tx_hash
+            FROM transacciones t
+            JOIN productos p ON t.producto_id = p.id
+            JOIN ubicaciones u ON t.ubicacion_id = u.id
+            JOIN tipos_transaccion tt ON t.tipo_transaccion_id = tt.id
+            JOIN usuarios us ON t.usuario_id = us.id
+            {where}
+            ORDER BY t.fecha_creacion, t.id
+        '''
+    },
+    'inventory': {
+        'date_column': 'i.fecha_actualizacion',
+        'query': '''
+            SELECT i.id, p.codigo AS producto_codigo, p.nombre AS producto_nombre,
+                   u.nombre AS ubicacion_nombre, i.cantidad, p.stock_minimo, i.fecha_actualizacion
+            FROM inventario i
+            JOIN productos p ON i.producto_id = p.id
+            JOIN ubicaciones u ON i.ubicacion_id = u.id
+            {where}
+            ORDER BY p.codigo, u.nombre
+        '''
+    },
+    'orders': {
+        'date_column': 'pe.fecha_pedido',
+        'query': '''
+            SELECT pe.id, pe.numero_pedido, pe.fecha_pedido, us.username AS cliente, pe.estado,
+                   pe.subtotal, pe.impuestos, pe.total, pe.direccion_entrega, pe.telefono_contacto,
+                   pe.fecha_entrega
+            FROM pedidos pe
+            JOIN usuarios us ON pe.cliente_id = us.id
+            {where}
+            ORDER BY pe.fecha_pedido, pe.id
+        '''
+    },
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def parse_date_range(desde, hasta):
+    """Normalizar desde/hasta al formato guardado; hasta con solo fecha incluye ese día completo.
+
+    Lanza ValueError si alguna fecha no es ISO 8601.
+    """
+    conditions = []
+    if desde:
+        conditions.append(('>=', datetime.fromisoformat(desde)))
+    if hasta:
+        value = datetime.fromisoformat(hasta)
+        conditions.append(('<', value + timedelta(days=1)) if len(hasta) == 10 else ('<=', value))
+    return [(op, value.strftime('%Y-%m-%d %H:%M:%S')) for op, value in conditions]
+
+
+def export_query(kind, date_range):
+    spec = EXPORTS[kind]
+    where = ' AND '.join(f'{spec["date_column"]} {op} ?' for op, _ in date_range)
+    return spec['query'].format(where=f'WHERE {where}' if where else ''), [value for _, value in date_range]
+
+
+def csv_chunks(columns, fetchmany):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    while True:
+        rows = fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(columns, fetchmany):
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+    while True:
+        rows = fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+def export_chunks(fmt, columns, fetchmany):
+    """Generador de texto con las filas del resultado, en el formato pedido"""
+    return csv_chunks(columns, fetchmany) if fmt == 'csv' else ndjson_chunks(columns, fetchmany)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: contenedor gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
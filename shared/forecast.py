@@ -0,0 +1,132 @@
+# Pronóstico de demanda y punto de reorden que no depende de la base: la consulta de
+# salidas, su carga en arreglos y el cálculo vectorizado. Cada árbol guarda y consulta
+# pronosticos_reposicion con su propio acceso a datos (forecast.py en backend/,
+# services/forecast.py en src/).
+#
+# La demanda diaria de una ubicación es lo que sale de ella: los movimientos negativos de
+# movimientos_inventario (pedidos, salidas, mermas, transferencias), y para los días
+# anteriores al inicio de ese registro las transacciones de tipo salida. Los pedidos no
+# escriben transacciones, así que solo con transacciones la demanda de la tienda no se ve.
+#
+# NumPy agrupa las salidas por (producto, ubicación, día) y calcula todo en una pasada
+# sobre los días con demanda, sin armar la matriz densa productos x días: cada estadística
+# es una suma ponderada por serie (np.bincount) y los días sin demanda cuentan como cero.
+#   demanda_media      promedio de los últimos AVERAGE_DAYS días
+#   demanda_suavizada  suavizado exponencial simple (alfa SMOOTHING) sobre todo el historial,
+#                      con el nivel inicial en cero corregido por el peso total
+#   desviacion         desvío de la demanda diaria en los últimos DEVIATION_DAYS días
+#   stock_seguridad    z(SERVICE_LEVEL) * desviacion * sqrt(LEAD_TIME_DAYS)
+#   punto_reorden      ceil(demanda_suavizada * LEAD_TIME_DAYS + stock_seguridad)
+#
+# NumPy es opcional: sin él la aplicación funciona y el cálculo lanza ForecastUnavailable.
+
+import math
+from statistics import NormalDist
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FORECAST_AVAILABLE = np is not None
+
+HISTORY_DAYS = 730
+AVERAGE_DAYS = 28
+DEVIATION_DAYS = 90
+SMOOTHING = 0.2
+LEAD_TIME_DAYS = 7
+SERVICE_LEVEL = 0.95
+
+# Filas por lectura al cargar la demanda
+FETCH_SIZE = 50000
+
+# (producto_id, ubicacion_id, día, cantidad) de los días completos de la ventana; el día 0
+# es el más antiguo y history - 1 es ayer. Sin GROUP BY: ordenar millones de filas en SQLite
+# cuesta más que agruparlas en forecast(). Los ids de movimiento crecen con la fecha, así
+# que la ventana es un rango de la clave primaria a partir del primer movimiento del día 0.
+DEMAND_QUERY = '''
+    SELECT producto_id, ubicacion_id,
+           CAST(julianday(fecha) - julianday(date('now', :desde)) AS INTEGER) AS dia, -delta AS cantidad
+    FROM movimientos_inventario
+    WHERE id >= (SELECT id FROM movimientos_inventario WHERE fecha >= date('now', :desde) ORDER BY fecha, id LIMIT 1)
+      AND fecha < date('now') AND delta < 0
+    UNION ALL
+    SELECT t.producto_id, t.ubicacion_id,
+           CAST(julianday(t.fecha_creacion) - julianday(date('now', :desde)) AS INTEGER), ABS(t.cantidad)
+    FROM transacciones t
+    JOIN tipos_transaccion tt ON tt.id = t.tipo_transaccion_id
+    WHERE t.fecha_creacion >= date('now', :desde) AND t.fecha_creacion < date('now')
+      AND t.fecha_creacion < COALESCE((SELECT MIN(fecha) FROM movimientos_inventario), '9999')
+      AND tt.tipo = 'salida'
+'''
+
+RESULT_FIELDS = ('producto_id', 'ubicacion_id', 'demanda_media', 'demanda_suavizada',
+                 'desviacion', 'stock_seguridad', 'punto_reorden')
+
+
+class ForecastUnavailable(Exception):
+    """NumPy no está instalado"""
+
+
+def load_demand(load, history=HISTORY_DAYS):
+    """Arreglos (producto_id, ubicacion_id, día, cantidad), una posición por salida.
+
+    `load` es un cursor DB-API que devuelve tuplas simples; cada árbol lo obtiene de su conexión.
+    """
+    if np is None:
+        raise ForecastUnavailable('El pronóstico de demanda requiere numpy')
+    load.execute(DEMAND_QUERY, {'desde': f'-{history} days'})
+    chunks = []
+    while True:
+        rows = load.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64))
+    data = np.concatenate(chunks) if chunks else np.empty((0, 4))
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2].astype(np.int64), data[:, 3]
+
+
+def forecast(producto, ubicacion, dia, cantidad, history=HISTORY_DAYS, average_days=AVERAGE_DAYS,
+             deviation_days=DEVIATION_DAYS, smoothing=SMOOTHING, lead_time=LEAD_TIME_DAYS,
+             service_level=SERVICE_LEVEL):
+    """Estadísticas por serie (producto, ubicación) en una pasada vectorizada.
+
+    Recibe un arreglo por columna como los de load_demand (varias posiciones pueden caer en
+    la misma serie y día). Devuelve un dict de arreglos alineados, uno por campo de RESULT_FIELDS.
+    """
+    if np is None:
+        raise ForecastUnavailable('El pronóstico de demanda requiere numpy')
+    series, index = np.unique((producto << 32) | ubicacion, return_inverse=True)
+    # Demanda del día por serie: una posición por (serie, día)
+    buckets, bucket_index = np.unique(index * history + dia, return_inverse=True)
+    cantidad = np.bincount(bucket_index, weights=cantidad)
+    index, dia = buckets // history, buckets % history
+
+    def per_series(weights):
+        return np.bincount(index, weights=weights, minlength=len(series))
+
+    recent = dia >= history - average_days
+    media = per_series(np.where(recent, cantidad, 0)) / average_days
+
+    window = dia >= history - deviation_days
+    mean = per_series(np.where(window, cantidad, 0)) / deviation_days
+    square = per_series(np.where(window, cantidad * cantidad, 0)) / deviation_days
+    desviacion = np.sqrt(np.maximum(square - mean * mean, 0))
+
+    # Nivel de SES con nivel inicial 0: sum(alfa * (1 - alfa)^(edad) * x), edad 0 = ayer
+    decay = smoothing * (1 - smoothing) ** (history - 1 - dia)
+    suavizada = per_series(cantidad * decay) / (1 - (1 - smoothing) ** history)
+
+    z = NormalDist().inv_cdf(service_level)
+    stock_seguridad = z * desviacion * math.sqrt(lead_time)
+    punto_reorden = np.ceil(suavizada * lead_time + stock_seguridad).astype(np.int64)
+
+    return {
+        'producto_id': series >> 32,
+        'ubicacion_id': series & 0xFFFFFFFF,
+        'demanda_media': media,
+        'demanda_suavizada': suavizada,
+        'desviacion': desviacion,
+        'stock_seguridad': stock_seguridad,
+        'punto_reorden': punto_reorden,
+    }
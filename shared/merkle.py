@@ -0,0 +1,77 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Prefijos distintos para hojas y nodos internos (como RFC 6962): una hoja no
+# puede hacerse pasar por un nodo interno para falsificar una prueba.
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+# A partir de este número de hojas el hashing se reparte en un pool de procesos
+PARALLEL_THRESHOLD = 4096
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def leaf_hash(payload):
+    return hashlib.sha256(LEAF_PREFIX + payload).hexdigest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def _hash_chunk(payloads):
+    return [leaf_hash(payload) for payload in payloads]
+
+
+def hash_leaves(payloads):
+    """Hash de cada hoja; los lotes grandes se reparten entre procesos"""
+    global _executor
+    if len(payloads) < PARALLEL_THRESHOLD or HASH_WORKERS < 2:
+        return _hash_chunk(payloads)
+    with _executor_lock:
+        if _executor is None:
+            # spawn: se llama desde el hilo del anclador, con el pool de conexiones y la cola de trabajos vivos
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    size = -(-len(payloads) // HASH_WORKERS)
+    chunks = [payloads[i:i + size] for i in range(0, len(payloads), size)]
+    return [digest for chunk in _executor.map(_hash_chunk, chunks) for digest in chunk]
+
+
+def build_tree(leaves):
+    """Niveles del árbol, de las hojas a la raíz. Un nodo sin pareja sube sin cambios."""
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def proof_path(levels, index):
+    """Hermanos desde la hoja hasta la raíz como [('L'|'R', hash), ...]"""
+    path = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append(('L' if sibling < index else 'R', level[sibling]))
+        index //= 2
+    return path
+
+
+def root_from_proof(leaf, path):
+    current = leaf
+    for side, sibling in path:
+        current = node_hash(sibling, current) if side == 'L' else node_hash(current, sibling)
+    return current
+
+
+def verify_proof(leaf, path, root):
+    return root_from_proof(leaf, path) == root
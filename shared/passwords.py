@@ -0,0 +1,111 @@
+# Hash de contraseñas fuera de los hilos de petición. Las KDF (scrypt, pbkdf2) son lentas
+# a propósito; una ráfaga de logins ejecutada en línea ocupa los hilos y la CPU que
+# necesitan el catálogo y los pedidos. PasswordHasher las manda a un pool de procesos
+# acotado y limita las operaciones en curso: por encima de `max_pending` (PASSWORD_MAX_PENDING) lanza
+# HasherBusy y la ruta responde 503 con Retry-After, en lugar de encolar sin límite.
+#
+# El método (y su costo) es configurable; un hash con parámetros distintos a los
+# actuales se recalcula en el login siguiente, en la misma tarea que lo verifica.
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Demasiadas operaciones de contraseña en curso"""
+
+
+@lru_cache(maxsize=None)
+def method_prefix(method):
+    """Parámetros completos del método como quedan al inicio del hash ('scrypt' -> 'scrypt:32768:8:1')"""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def needs_rehash(pwhash, method):
+    return pwhash.split('$', 1)[0] != method_prefix(method)
+
+
+def verify_and_rehash(pwhash, password, method):
+    """(válida, hash nuevo o None); el hash nuevo solo si la contraseña es válida y los parámetros cambiaron"""
+    if not check_password_hash(pwhash, password):
+        return False, None
+    if needs_rehash(pwhash, method):
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+class PasswordHasher:
+    """Pool de procesos para las KDF, con límite de operaciones en curso.
+
+    Con workers=0 el hash corre en el hilo que lo pide (CLI, pruebas), con el mismo límite.
+    El pool se crea en el primer uso, así importar la aplicación no arranca procesos.
+    """
+
+    def __init__(self, method='scrypt', workers=1, max_pending=4):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        '''Configurar desde app.config: PASSWORD_METHOD, PASSWORD_WORKERS, PASSWORD_MAX_PENDING'''
+        self.method = app.config.get('PASSWORD_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_MAX_PENDING', self.max_pending)
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy('Demasiadas operaciones de contraseña en curso')
+            self._pending += 1
+            if self.workers and self._executor is None:
+                # spawn: el proceso padre tiene hilos (pool de conexiones, cola de trabajos)
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            executor = self._executor
+        try:
+            if executor is None:
+                return fn(*args)
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # Un proceso murió: el siguiente uso crea un pool nuevo
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """(válida, hash nuevo o None), ver verify_and_rehash"""
+        return self._run(verify_and_rehash, pwhash, password, self.method)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def stats(self):
+        return {
+            'method': method_prefix(self.method),
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'pending': self._pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,46 @@
+# Búsqueda de productos con FTS5, común a los dos árboles: el índice, su ranking y la
+# conversión del texto del buscador. Cada árbol crea el índice con su propio acceso a datos.
+
+import re
+
+# Índice FTS5 de contenido externo sobre productos: el texto vive en la tabla
+# productos y los triggers mantienen el índice sincronizado en cada escritura.
+SEARCH_INDEX_DDL = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+        codigo, nombre, descripcion,
+        content='productos', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+        INSERT INTO productos_fts (rowid, codigo, nombre, descripcion)
+        VALUES (new.id, new.codigo, new.nombre, new.descripcion);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+        INSERT INTO productos_fts (productos_fts, rowid, codigo, nombre, descripcion)
+        VALUES ('delete', old.id, old.codigo, old.nombre, old.descripcion);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS productos_fts_au AFTER UPDATE OF codigo, nombre, descripcion ON productos BEGIN
+        INSERT INTO productos_fts (productos_fts, rowid, codigo, nombre, descripcion)
+        VALUES ('delete', old.id, old.codigo, old.nombre, old.descripcion);
+        INSERT INTO productos_fts (rowid, codigo, nombre, descripcion)
+        VALUES (new.id, new.codigo, new.nombre, new.descripcion);
+    END
+    ''',
+]
+
+# Pesos bm25 por columna: coincidir en el código pesa más que en la descripción
+SEARCH_RANK = 'bm25(productos_fts, 10.0, 5.0, 1.0)'
+
+
+def fts_query(term):
+    """Convertir el texto del buscador en una consulta MATCH de prefijos ('lap dell' -> "lap"* "dell"*)"""
+    tokens = re.findall(r'\w+', term or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
@@ -0,0 +1,61 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from shared.asgi import AsgiBridge
+from src.main import app as flask_app
+from src.models.models import db
+from src.services.jobs import job_workers
+
+# Punto de entrada ASGI: uvicorn src.asgi:app --host 0.0.0.0 --port 5000 (desde la raíz)
+#
+# Las rutas de Flask y SQLAlchemy sobre sqlite3 son bloqueantes: el puente de
+# shared/asgi.py las ejecuta en un executor acotado y el bucle de eventos solo espera.
+# /api/system/health se atiende en el bucle con AsyncDatabase y responde aunque todos
+# los hilos estén ocupados. Para comparar con el servidor WSGI: backend/loadtest.py
+flask_app.config.setdefault("ASGI_WORKERS", 8)
+
+
+class AsyncDatabase:
+    # Acceso al engine desde asyncio: cada operación corre en un hilo propio y el bucle solo espera
+    def __init__(self, engine, workers):
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sqlite")
+
+    def _call(self, fn, args):
+        with self.engine.connect() as connection:
+            return fn(connection, *args)
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, fn, args)
+
+    async def fetchall(self, query, params=()):
+        return await self.run(lambda connection: [dict(row) for row in connection.exec_driver_sql(query, params).mappings()])
+
+    async def fetchone(self, query, params=()):
+        def fetch(connection):
+            row = connection.exec_driver_sql(query, params).mappings().first()
+            return dict(row) if row is not None else None
+        return await self.run(fetch)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+with flask_app.app_context():
+    async_db = AsyncDatabase(db.engine, workers=2)
+
+
+async def health():
+    try:
+        await async_db.fetchone("SELECT 1")
+    except Exception as e:
+        return 503, {"status": "error", "error": str(e)}
+    return 200, {"status": "ok", "database": async_db.engine.pool.status(), "jobs": job_workers.stats()}
+
+
+def stop_background():
+    job_workers.stop(timeout=5)
+    async_db.close()
+
+
+app = AsgiBridge(flask_app, workers=flask_app.config["ASGI_WORKERS"], routes={"/api/system/health": health},
+                 on_startup=job_workers.start, on_shutdown=stop_background)
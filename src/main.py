@@ -1,10 +1,13 @@
 
 import os
 import sys
-from flask import Flask, send_from_directory
+import time
+import click
+from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from datetime import timedelta
+from shared.forecast import ForecastUnavailable
 from src.models.models import db, Usuario, Categoria, Producto, Ubicacion, Inventario, TipoTransaccion, Transaccion, Pedido, DetallePedido, Pago
 from src.routes.auth import auth_bp
 from src.routes.products import products_bp
@@ -12,6 +15,20 @@ from src.routes.inventory import inventory_bp
 from src.routes.categories import categories_bp
 from src.routes.orders import orders_bp
 from src.routes.payments import payments_bp
+from src.routes.export import export_bp
+from src.services.auth import require_role, revoked_users
+from src.services.cache import response_cache
+from src.services.costing import adjust_cost_layers, ensure_cost_layers, rebuild_cost_layers, verify_cost_layers
+from src.services.forecast import refresh_reorder_points
+from src.services.jobs import HANDLERS, ensure_jobs_schema, job_workers, queue_stats, run_pending
+from src.services.ledger import ensure_ledger, verify_chain
+from src.services.passwords import password_hasher
+from src.services.migrations import LATEST_VERSION, check_query_plans, migrate, optimize, schema_version
+from src.services.search import ensure_search_index
+from src.services.snapshots import inventory_snapshots, take_snapshot
+from src.services.stock import ensure_stock_totals, rebuild_stock_totals, verify_stock_totals
+from src.services.storage import benchmark, storage
+from src.services.versions import ensure_table_versions
 
 # DON\'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
@@ -22,6 +39,7 @@ CORS(app) # Permitir solicitudes CORS desde cualquier origen
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 app.config['JWT_SECRET_KEY'] = 'tu-clave-secreta-super-segura-blockchain-inventory'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+app.config['ALLOCATION_STRATEGY'] = 'nearest' # nearest (ubicación preferida y luego por id), largest o fifo
 jwt = JWTManager(app)
 
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -30,13 +48,191 @@ app.register_blueprint(inventory_bp, url_prefix='/api')
 app.register_blueprint(categories_bp, url_prefix='/api')
 app.register_blueprint(orders_bp, url_prefix='/api')
 app.register_blueprint(payments_bp, url_prefix='/api')
+app.register_blueprint(export_bp, url_prefix='/api')
 
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
+app.config['CACHE_BACKEND'] = 'memory' # memory o sqlite (compartida entre procesos)
+app.config['CACHE_PATH'] = os.path.join(os.path.dirname(__file__), 'database', 'cache.db')
+app.config['CACHE_TTL'] = 60
+response_cache.init_app(app)
+
+app.config['JOB_WORKERS'] = 2 # hilos de la cola de trabajos (efectos secundarios de pedidos y pagos)
+
+# Motor de almacenamiento: orm o sql, y excepciones por operación según `flask benchmark-storage`
+app.config['STORAGE_ENGINE'] = 'sql'
+app.config['STORAGE_OVERRIDES'] = {}
+storage.init_app(app)
+
+# Segundos que otro proceso tarda como mucho en ver un cambio de rol o estado
+app.config['REVOCATION_TTL'] = 5
+revoked_users.init_app(app, jwt)
+
+# Hash de contraseñas: método de werkzeug con su costo (p. ej. 'scrypt:32768:8:1' o
+# 'pbkdf2:sha256:600000'; los hashes anteriores se actualizan en el login), procesos
+# del pool y operaciones en curso antes de responder 503
+app.config['PASSWORD_METHOD'] = 'scrypt:32768:8:1'
+app.config['PASSWORD_WORKERS'] = max(1, (os.cpu_count() or 2) // 2)
+app.config['PASSWORD_MAX_PENDING'] = 4
+password_hasher.init_app(app)
+
+def create_schema(connection):
+    # Esquema base (anterior a las migraciones); todo es idempotente
+    db.metadata.create_all(connection)
+    # create_all no agrega índices nuevos a tablas existentes
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    ensure_search_index(connection)
+    ensure_stock_totals(connection)
+    ensure_ledger(connection)
+    ensure_table_versions(connection)
+    ensure_jobs_schema(connection)
+
+def init_database():
+    # Con la base al día es una sola lectura de PRAGMA user_version; el esquema base
+    # y las migraciones solo corren en una base nueva o con migraciones pendientes
+    with db.engine.connect() as connection:
+        if schema_version(connection) >= LATEST_VERSION:
+            return
+        # Un proceso a la vez: los que arrancan juntos esperan el bloqueo y encuentran el esquema creado
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        create_schema(connection)
+        connection.commit()
+    migrate(db.engine)
+    ensure_cost_layers(db.engine)
+
 with app.app_context():
-    db.create_all()
+    init_database()
+job_workers.init_app(app)
+inventory_snapshots.init_app(app)
+
+@app.cli.command("verify-stock-totals")
+@click.option("--fix", is_flag=True, help="Reconstruir la tabla si se detectan diferencias")
+def verify_stock_totals_command(fix):
+    with db.engine.begin() as connection:
+        drift = verify_stock_totals(connection)
+        for producto_id, esperado, actual, bajo_esperado, bajo_actual in drift:
+            click.echo(f"Producto {producto_id}: stock esperado {esperado}, materializado {actual} "
+                       f"(bajo_stock {bajo_esperado}/{bajo_actual})")
+        if not drift:
+            click.echo("stock_totals coincide con inventario")
+        elif fix:
+            rebuild_stock_totals(connection)
+            click.echo(f"stock_totals reconstruida ({len(drift)} productos corregidos)")
+    if drift and not fix:
+        raise SystemExit(1)
+
+@app.cli.command("rebuild-stock-totals")
+def rebuild_stock_totals_command():
+    with db.engine.begin() as connection:
+        rebuild_stock_totals(connection)
+    click.echo("stock_totals reconstruida")
+
+@app.cli.command("snapshot-inventory")
+def snapshot_inventory_command():
+    # Tomar ahora una foto del inventario (el hilo de fotos las toma solo cuando corresponde)
+    snapshot_id = take_snapshot(db.engine)
+    click.echo(f"Foto de inventario {snapshot_id} tomada" if snapshot_id else "Sin movimientos desde la última foto")
+
+@app.cli.command("verify-ledger")
+@click.option("--resume", is_flag=True, help="Continuar desde el último checkpoint en vez de recorrer desde el inicio")
+def verify_ledger_command(resume):
+    result = verify_chain(db.engine, resume=resume,
+                          progress=lambda last_id, checked: click.echo(f"... {checked} filas (id {last_id})"))
+    if not result["valid"]:
+        click.echo(f"Cadena rota en la transacción {result['first_invalid_id']} ({result['reason']})")
+        raise SystemExit(1)
+    click.echo(f"Cadena válida: {result['checked']} filas verificadas desde la transacción "
+               f"{result['resumed_from']}, {result['total']} en total")
+
+@app.cli.command("forecast-reorder")
+def forecast_reorder_command():
+    # Recalcular ahora la demanda y los puntos de reorden (sin pasar por la cola)
+    start = time.perf_counter()
+    try:
+        with db.engine.begin() as connection:
+            series = refresh_reorder_points(connection)
+    except ForecastUnavailable as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{series} series producto/ubicación calculadas en {time.perf_counter() - start:.2f} s")
+
+@app.cli.command("rebuild-cost-layers")
+@click.option("--workers", default=os.cpu_count() or 1, type=int, help="Procesos entre los que repartir los productos")
+def rebuild_cost_layers_command(workers):
+    # Recalcular capas FIFO, costo promedio y costo de ventas desde movimientos_costo
+    start = time.perf_counter()
+    series = rebuild_cost_layers(db.engine, workers)
+    click.echo(f"{series} series producto/ubicación recalculadas en {time.perf_counter() - start:.2f} s")
+
+@app.cli.command("verify-cost-layers")
+@click.option("--fix", is_flag=True, help="Registrar ajustes para las diferencias")
+def verify_cost_layers_command(fix):
+    with db.engine.begin() as connection:
+        drift = verify_cost_layers(connection)
+        for producto_id, ubicacion_id, inventario, costeado in drift:
+            click.echo(f"Producto {producto_id} en ubicación {ubicacion_id}: inventario {inventario}, con costo {costeado}")
+        if not drift:
+            click.echo("Las capas de costo coinciden con inventario")
+        elif fix:
+            adjust_cost_layers(connection, drift)
+            click.echo(f"{len(drift)} ajustes de costo registrados")
+    if drift and not fix:
+        raise SystemExit(1)
+
+@app.cli.command("run-jobs")
+@click.option("--limit", default=None, type=int, help="Máximo de trabajos a ejecutar")
+def run_jobs_command(limit):
+    done, failed = run_pending(db.engine, HANDLERS, limit)
+    click.echo(f"{done} trabajos completados, {failed} con error")
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    failures = check_query_plans(db.engine)
+    for name, index, plan in failures:
+        click.echo(f"{name}: no usa {index} ({' / '.join(plan)})")
+    if failures:
+        raise SystemExit(1)
+    click.echo("Todas las consultas calientes usan su índice")
+
+@app.cli.command("optimize-db")
+def optimize_db_command():
+    # ANALYZE y PRAGMA optimize, por ejemplo después de una carga masiva
+    optimize(db.engine, analyze=True)
+    click.echo("Estadísticas del planificador actualizadas")
+
+@app.cli.command("benchmark-storage")
+@click.option("--repeat", default=20, type=int, help="Repeticiones por operación (se reporta el mejor tiempo)")
+def benchmark_storage_command(repeat):
+    results = benchmark(repeat)
+    click.echo(f"{'operación':<28} {'orm ms':>9} {'sql ms':>9}  más rápido")
+    faster = {}
+    for operation, times in results.items():
+        winner = min(times, key=times.get)
+        faster.setdefault(operation.split(" ")[0], winner)
+        click.echo(f"{operation:<28} {times['orm']:>9.3f} {times['sql']:>9.3f}  {winner}")
+    overrides = {operation: engine for operation, engine in faster.items() if engine != app.config['STORAGE_ENGINE']}
+    click.echo(f"STORAGE_OVERRIDES sugerido: {overrides}")
+
+@app.route('/api/system/cache', methods=['GET'])
+@require_role("administrador")
+def get_cache_stats():
+    return jsonify({"cache": response_cache.stats()}), 200
+
+@app.route('/api/system/passwords', methods=['GET'])
+@require_role("administrador")
+def get_password_stats():
+    return jsonify({"passwords": password_hasher.stats()}), 200
+
+@app.route('/api/system/jobs', methods=['GET'])
+@require_role("administrador")
+def get_job_stats():
+    try:
+        return jsonify({"queue": queue_stats(), "workers": job_workers.stats()}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -56,6 +252,8 @@ def serve(path):
 
 
 if __name__ == '__main__':
+    # Los hilos de fondo arrancan con la primera petición del proceso que sirve (init_app),
+    # así que con el recargador de debug corren solo en el proceso hijo
     app.run(host='0.0.0.0', port=5000, debug=True)
 
 
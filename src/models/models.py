@@ -17,6 +17,16 @@ class Usuario(db.Model):
     activo = db.Column(db.Boolean, default=True)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
 
+class CambioAcceso(db.Model):
+    # Último cambio de rol o estado de un usuario; los tokens con una versión anterior
+    # quedan revocados (services/auth.py)
+    __tablename__ = 'cambios_acceso'
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    version = db.Column(db.Float, nullable=False)  # epoch del cambio
+    __table_args__ = (
+        db.Index('ix_cambios_acceso_version', 'version'),
+    )
+
 class Categoria(db.Model):
     __tablename__ = 'categorias'
     id = db.Column(db.Integer, primary_key=True)
@@ -42,6 +52,10 @@ class Producto(db.Model):
     blockchain_hash = db.Column(db.String(255))
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     categoria = db.relationship('Categoria', backref='productos')
+    __table_args__ = (
+        db.Index('ix_productos_nombre_id', 'nombre', 'id'),
+        db.Index('ix_productos_categoria_activos', 'categoria_id', 'nombre', 'id', sqlite_where=db.text('activo = 1')),
+    )
 
 class Ubicacion(db.Model):
     __tablename__ = 'ubicaciones'
@@ -63,6 +77,16 @@ class Inventario(db.Model):
     ubicacion = db.relationship('Ubicacion', backref='inventarios')
     __table_args__ = (db.UniqueConstraint('producto_id', 'ubicacion_id', name='_producto_ubicacion_uc'),)
 
+class StockTotal(db.Model):
+    __tablename__ = 'stock_totals'
+    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id'), primary_key=True, autoincrement=False)
+    stock_total = db.Column(db.Integer, nullable=False, default=0)
+    bajo_stock = db.Column(db.Boolean, nullable=False, default=False)
+    __table_args__ = (
+        db.Index('ix_stock_totals_stock_total', 'stock_total'),
+        db.Index('ix_stock_totals_bajo_stock', 'producto_id', sqlite_where=db.text('bajo_stock = 1')),
+    )
+
 class TipoTransaccion(db.Model):
     __tablename__ = 'tipos_transaccion'
     id = db.Column(db.Integer, primary_key=True)
@@ -86,10 +110,12 @@ class Transaccion(db.Model):
     blockchain_tx_hash = db.Column(db.String(255))
     blockchain_confirmado = db.Column(db.Boolean, default=False)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    hash_cadena = db.Column(db.String(64))  # lo calcula services/ledger.extend_chain
     producto = db.relationship('Producto', backref='transacciones')
     ubicacion = db.relationship('Ubicacion', backref='transacciones')
     tipo_transaccion = db.relationship('TipoTransaccion', backref='transacciones')
     usuario = db.relationship('Usuario', backref='transacciones')
+    __table_args__ = (db.Index('ix_transacciones_fecha_id', 'fecha_creacion', 'id'),)
 
 class Pedido(db.Model):
     __tablename__ = 'pedidos'
@@ -106,6 +132,11 @@ class Pedido(db.Model):
     fecha_pedido = db.Column(db.DateTime, default=datetime.utcnow)
     fecha_entrega = db.Column(db.DateTime)
     cliente = db.relationship('Usuario', backref='pedidos')
+    __table_args__ = (
+        db.Index('ix_pedidos_cliente_fecha_id', 'cliente_id', 'fecha_pedido', 'id'),
+        db.Index('ix_pedidos_fecha_id', 'fecha_pedido', 'id'),
+        db.Index('ix_pedidos_estado_fecha_id', 'estado', 'fecha_pedido', 'id'),
+    )
 
 class DetallePedido(db.Model):
     __tablename__ = 'detalle_pedidos'
@@ -117,6 +148,9 @@ class DetallePedido(db.Model):
     subtotal = db.Column(db.Numeric(10, 2), nullable=False)
     pedido = db.relationship('Pedido', backref='detalles')
     producto = db.relationship('Producto', backref='detalles_pedido')
+    __table_args__ = (
+        db.Index('ix_detalle_pedidos_pedido', 'pedido_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal'),
+    )
 
 class Pago(db.Model):
     __tablename__ = 'pagos'
@@ -129,5 +163,6 @@ class Pago(db.Model):
     qr_code = db.Column(db.Text)
     fecha_pago = db.Column(db.DateTime, default=datetime.utcnow)
     pedido = db.relationship('Pedido', backref='pagos')
+    __table_args__ = (db.Index('ix_pagos_pedido', 'pedido_id', 'estado'),)
 
 
@@ -1,9 +1,12 @@
 
 from flask import Blueprint, jsonify, request
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from datetime import timedelta
-from src.models.models import db, Usuario
+from shared.passwords import HasherBusy
+from src.models.models import db, CambioAcceso, Usuario
+from src.services.auth import ROLES, access_claims, require_role, revoked_users
+from src.services.passwords import password_hasher
+import time
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -17,10 +20,23 @@ def login():
         if not username or not password:
             return jsonify({"error": "Username y password son requeridos"}), 400
 
-        user = Usuario.query.filter_by(username=username, activo=True).first()
+        user = db.session.query(Usuario.id, Usuario.username, Usuario.email, Usuario.password_hash, Usuario.rol,
+                                Usuario.nombre, CambioAcceso.version.label("version_acceso")).\
+            outerjoin(CambioAcceso, CambioAcceso.usuario_id == Usuario.id).\
+            filter(Usuario.username == username, Usuario.activo == True).first()
+        # La conexión vuelve al pool mientras se verifica la contraseña
+        db.session.commit()
 
-        if user and check_password_hash(user.password_hash, password):
-            access_token = create_access_token(identity=user.id)
+        valid, new_hash = password_hasher.verify(user.password_hash, password) if user else (False, None)
+
+        if valid:
+            if new_hash:
+                # Parámetros del hash desactualizados: se guarda el recalculado con los actuales
+                Usuario.query.filter_by(id=user.id).update({"password_hash": new_hash})
+                db.session.commit()
+
+            # Rol y versión de acceso en el token: las rutas autorizan sin consultar usuarios
+            access_token = create_access_token(identity=user.id, additional_claims=access_claims(user.rol, user.version_acceso))
 
             return jsonify({
                 "message": "Login exitoso",
@@ -36,6 +52,8 @@ def login():
         else:
             return jsonify({"error": "Credenciales inválidas"}), 401
 
+    except HasherBusy:
+        return jsonify({"error": "Servicio ocupado, reintente en unos segundos"}), 503, {"Retry-After": "1"}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -46,7 +64,6 @@ def register():
         username = data.get("username")
         email = data.get("email")
         password = data.get("password")
-        rol = data.get("rol", "cliente")
         nombre = data.get("nombre", "")
         telefono = data.get("telefono", "")
         direccion = data.get("direccion", "")
@@ -54,7 +71,13 @@ def register():
         if not username or not email or not password:
             return jsonify({"error": "Username, email y password son requeridos"}), 400
 
-        password_hash = generate_password_hash(password)
+        # El rol viaja en el token y @require_role confía en él: el registro abierto solo crea
+        # clientes, los demás roles los asigna un administrador con /users/<id>/access
+        rol = data.get("rol") or "cliente"
+        if rol != "cliente":
+            return jsonify({"error": "Solo un administrador puede asignar otro rol"}), 403
+
+        password_hash = password_hasher.hash(password)
 
         try:
             new_user = Usuario(
@@ -80,6 +103,8 @@ def register():
             else:
                 return jsonify({"error": "Error al registrar usuario: " + str(e)}), 400
 
+    except HasherBusy:
+        return jsonify({"error": "Servicio ocupado, reintente en unos segundos"}), 503, {"Retry-After": "1"}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -110,4 +135,39 @@ def get_profile():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@auth_bp.route("/users/<int:user_id>/access", methods=["PUT"])
+@require_role("administrador")
+def update_user_access(user_id):
+    # Cambia el rol o el estado de un usuario; sus tokens anteriores quedan revocados
+    try:
+        data = request.get_json() or {}
+        rol = data.get("rol")
+        activo = data.get("activo")
+
+        if rol is None and activo is None:
+            return jsonify({"error": "Se requiere rol o activo"}), 400
+        if rol is not None and rol not in ROLES:
+            return jsonify({"error": f"Rol inválido: {rol}"}), 400
 
+        user = db.session.get(Usuario, user_id)
+        if not user:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+
+        if rol is not None:
+            user.rol = rol
+        if activo is not None:
+            user.activo = bool(activo)
+        # El cambio y su versión de acceso en la misma transacción
+        version = time.time()
+        db.session.merge(CambioAcceso(usuario_id=user_id, version=version))
+        db.session.commit()
+        revoked_users.changed(user_id, version)
+
+        return jsonify({
+            "message": "Acceso actualizado",
+            "user": {"id": user.id, "rol": user.rol, "activo": user.activo}
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
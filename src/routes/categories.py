@@ -1,10 +1,14 @@
 
 from flask import Blueprint, jsonify
 from src.models.models import Categoria
+from src.services.cache import response_cache
+from src.services.versions import conditional
 
 categories_bp = Blueprint("categories", __name__)
 
 @categories_bp.route("/categories", methods=["GET"])
+@conditional("categorias")
+@response_cache.cached("categories")
 def get_categories():
     try:
         categories = Categoria.query.filter_by(activo=True).order_by(Categoria.nombre).all()
@@ -0,0 +1,35 @@
+from flask import Blueprint, Response, jsonify, request
+from shared.export import EXPORTS, FORMATS, gzip_chunks, parse_date_range
+from src.models.models import db
+from src.services.auth import STAFF_ROLES, require_role
+from src.services.export import stream_export
+
+export_bp = Blueprint("export", __name__)
+
+@export_bp.route("/export/<kind>", methods=["GET"])
+@require_role(*STAFF_ROLES)
+def export_data(kind):
+    try:
+        if kind not in EXPORTS:
+            return jsonify({"error": "Exportación no encontrada"}), 404
+
+        fmt = request.args.get("format", "csv")
+        if fmt not in FORMATS:
+            return jsonify({"error": "Formato inválido (csv o ndjson)"}), 400
+
+        try:
+            date_range = parse_date_range(request.args.get("desde"), request.args.get("hasta"))
+        except ValueError:
+            return jsonify({"error": "Fecha inválida, use el formato AAAA-MM-DD"}), 400
+
+        compress = request.args.get("gzip", "").lower() in ("1", "true")
+
+        chunks = stream_export(db.engine, kind, fmt, date_range)
+        body = gzip_chunks(chunks) if compress else (chunk.encode("utf-8") for chunk in chunks)
+        filename = f"{kind}.{fmt}.gz" if compress else f"{kind}.{fmt}"
+
+        return Response(body, mimetype="application/gzip" if compress else FORMATS[fmt],
+                        headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,53 +1,60 @@
 
+import time
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.models.models import db, Inventario, Producto, Ubicacion, TipoTransaccion, Transaccion, Usuario
+from shared.export import parse_date_range
+from shared.forecast import FORECAST_AVAILABLE
+from shared.serializers import RowMapper, isoformat, json_response, response_format
+from src.models.models import db, Ubicacion
+from src.services.catalog import low_stock_products
+from src.services.auth import STAFF_ROLES, require_role
+from src.services.batch import BatchError, ingest_transactions, parse_batch_payload
+from src.services.cache import response_cache
+from src.services.costing import cost_of_sales, inventory_valuation
+from src.services.forecast import reorder_points
+from src.services.jobs import enqueue, job_workers
+from src.services.pagination import decode_cursor, page_limit
+from src.services.snapshots import NoHistory, stock_as_of
+from src.services.storage import TRANSACTION_FIELDS, storage
+from src.services.versions import conditional
 
 inventory_bp = Blueprint("inventory", __name__)
 
+transaction_mapper = RowMapper(TRANSACTION_FIELDS, {"precio_unitario": float, "total": float, "fecha_creacion": isoformat})
+stock_mapper = RowMapper(("producto_id", "codigo", "nombre", "ubicacion_id", "ubicacion_nombre", "cantidad"))
+reorder_mapper = RowMapper(("producto_id", "codigo", "nombre", "ubicacion_id", "ubicacion_nombre", "stock_actual",
+                            "stock_minimo", "demanda_media", "demanda_suavizada", "desviacion", "stock_seguridad",
+                            "punto_reorden", "fecha_calculo"))
+valuation_mapper = RowMapper(("producto_id", "codigo", "nombre", "cantidad", "valor_fifo", "valor_promedio"))
+cost_mapper = RowMapper(("producto_id", "codigo", "nombre", "cantidad", "costo_fifo", "costo_promedio"))
+
 @inventory_bp.route("/inventory/summary", methods=["GET"])
+@conditional("productos", "inventario", "ubicaciones", "costos_inventario")
 def get_inventory_summary():
     try:
-        total_productos = Producto.query.filter_by(activo=True).count()
-        total_ubicaciones = Ubicacion.query.filter_by(activo=True).count()
-
-        valor_total = db.session.query(db.func.sum(Producto.precio_venta * Inventario.cantidad)).\
-            join(Inventario, Producto.id == Inventario.producto_id).\
-            filter(Producto.activo == True).scalar() or 0
-
-        productos_bajo_stock = db.session.query(Producto).\
-            join(Inventario, Producto.id == Inventario.producto_id).\
-            group_by(Producto.id).\
-            having(db.func.sum(Inventario.cantidad) <= Producto.stock_minimo, Producto.stock_minimo > 0).count()
-
-        top_productos = db.session.query(Producto.id, Producto.codigo, Producto.nombre, Producto.precio_venta, db.func.sum(Inventario.cantidad).label("stock_total")).\
-            outerjoin(Inventario, Producto.id == Inventario.producto_id).\
-            filter(Producto.activo == True).\
-            group_by(Producto.id).\
-            order_by(db.func.sum(Inventario.cantidad).desc()).\
-            limit(5).all()
+        summary = storage.inventory_summary()
+        top_productos = summary.pop("top_productos")
 
         return jsonify({
-            "summary": {
-                "total_productos": total_productos,
-                "total_ubicaciones": total_ubicaciones,
-                "valor_total": float(valor_total),
-                "productos_bajo_stock": productos_bajo_stock,
-                "alertas_stock": []
-            },
-            "top_productos": [{
-                "id": p.id,
-                "codigo": p.codigo,
-                "nombre": p.nombre,
-                "precio_venta": float(p.precio_venta) if p.precio_venta else None,
-                "stock_total": p.stock_total
-            } for p in top_productos]
+            "summary": summary,
+            "top_productos": top_productos
         }), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@inventory_bp.route("/inventory/low-stock", methods=["GET"])
+@conditional("productos", "inventario")
+def get_low_stock():
+    try:
+        return jsonify({"products": low_stock_products()}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @inventory_bp.route("/inventory/locations", methods=["GET"])
+@conditional("ubicaciones")
+@response_cache.cached("locations")
 def get_locations():
     try:
         locations = Ubicacion.query.filter_by(activo=True).order_by(Ubicacion.nombre).all()
@@ -62,40 +69,153 @@ def get_locations():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@inventory_bp.route("/inventory/as-of", methods=["GET"])
+@require_role(*STAFF_ROLES)
+@conditional("productos", "inventario", "ubicaciones")
+def get_inventory_as_of():
+    # Stock por producto y ubicación a una fecha: la foto anterior más los movimientos hasta esa fecha
+    try:
+        date = request.args.get("date")
+        if not date:
+            return jsonify({"error": "El parámetro date es requerido"}), 400
+        try:
+            date_bound = parse_date_range(None, date)[0]
+        except ValueError:
+            return jsonify({"error": "Fecha inválida, use el formato AAAA-MM-DD"}), 400
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({"error": "Formato inválido"}), 400
+
+        try:
+            rows, snapshot, replayed = stock_as_of(date_bound,
+                                                   request.args.get("producto_id", type=int),
+                                                   request.args.get("ubicacion_id", type=int))
+        except NoHistory:
+            return jsonify({"error": f"No hay historial de inventario anterior a {date}"}), 404
+
+        return json_response({
+            "date": date,
+            "snapshot": {"id": snapshot.id, "fecha": snapshot.fecha},
+            "movimientos": replayed,
+            "inventory": stock_mapper.serialize(rows, fmt)
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@inventory_bp.route("/inventory/reorder-points", methods=["GET"])
+@require_role(*STAFF_ROLES)
+def get_reorder_points():
+    # Demanda pronosticada y punto de reorden por producto y ubicación, con el stock actual
+    try:
+        try:
+            after = decode_cursor(request.args.get("cursor"))
+        except ValueError:
+            return jsonify({"error": "Cursor inválido"}), 400
+        limit = page_limit(request.args, default=100)
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({"error": "Formato inválido"}), 400
+
+        try:
+            rows, next_cursor = reorder_points(after, limit,
+                                               below=request.args.get("below") in ("1", "true"),
+                                               producto_id=request.args.get("producto_id", type=int),
+                                               ubicacion_id=request.args.get("ubicacion_id", type=int))
+        except ValueError:
+            return jsonify({"error": "Cursor inválido"}), 400
+
+        return json_response({"reorder_points": reorder_mapper.serialize(rows, fmt), "next_cursor": next_cursor})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@inventory_bp.route("/inventory/reorder-points/refresh", methods=["POST"])
+@require_role("administrador")
+def refresh_reorder_points():
+    # Encolar el recálculo; la demanda se agrupa por días completos, así que basta uno por día
+    try:
+        if not FORECAST_AVAILABLE:
+            return jsonify({"error": "El pronóstico de demanda requiere numpy"}), 503
+        queued = enqueue(db.session.connection(), "pronostico_reposicion", {},
+                         clave=f"pronostico_reposicion-{time.strftime('%Y-%m-%d', time.gmtime())}")
+        db.session.commit()
+        job_workers.notify()
+
+        return jsonify({
+            "message": "Recálculo encolado" if queued else "El recálculo de hoy ya estaba encolado",
+            "queued": queued
+        }), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@inventory_bp.route("/inventory/valuation", methods=["GET"])
+@require_role(*STAFF_ROLES)
+def get_inventory_valuation():
+    # Valor del inventario al costo por producto, FIFO y promedio ponderado
+    try:
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({"error": "Formato inválido"}), 400
+
+        rows = inventory_valuation(request.args.get("ubicacion_id", type=int))
+
+        return json_response({
+            "valor_fifo": sum(row.valor_fifo for row in rows),
+            "valor_promedio": sum(row.valor_promedio for row in rows),
+            "products": valuation_mapper.serialize(rows, fmt)
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@inventory_bp.route("/inventory/cost-of-sales", methods=["GET"])
+@require_role(*STAFF_ROLES)
+def get_cost_of_sales():
+    # Costo de ventas por producto (FIFO y promedio), acumulado o entre desde/hasta (días completos)
+    try:
+        try:
+            date_range = parse_date_range(request.args.get("desde"), request.args.get("hasta"))
+        except ValueError:
+            return jsonify({"error": "Fecha inválida, use el formato AAAA-MM-DD"}), 400
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({"error": "Formato inválido"}), 400
+
+        rows = cost_of_sales(date_range, request.args.get("ubicacion_id", type=int))
+
+        return json_response({
+            "costo_fifo": sum(row.costo_fifo for row in rows),
+            "costo_promedio": sum(row.costo_promedio for row in rows),
+            "products": cost_mapper.serialize(rows, fmt)
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @inventory_bp.route("/transactions", methods=["GET"])
 @jwt_required()
 def get_transactions():
     try:
-        transactions = db.session.query(Transaccion, Producto.codigo.label("producto_codigo"), Producto.nombre.label("producto_nombre"),
-                                        Ubicacion.nombre.label("ubicacion_nombre"), TipoTransaccion.nombre.label("tipo_nombre"),
-                                        Usuario.username.label("usuario_nombre")).\
-            join(Producto, Transaccion.producto_id == Producto.id).\
-            join(Ubicacion, Transaccion.ubicacion_id == Ubicacion.id).\
-            join(TipoTransaccion, Transaccion.tipo_transaccion_id == TipoTransaccion.id).\
-            join(Usuario, Transaccion.usuario_id == Usuario.id).\
-            order_by(Transaccion.fecha_creacion.desc()).\
-            limit(50).all()
-
-        return jsonify({"transactions": [{
-            "id": t.Transaccion.id,
-            "producto_id": t.Transaccion.producto_id,
-            "ubicacion_id": t.Transaccion.ubicacion_id,
-            "tipo_transaccion_id": t.Transaccion.tipo_transaccion_id,
-            "cantidad": t.Transaccion.cantidad,
-            "precio_unitario": float(t.Transaccion.precio_unitario) if t.Transaccion.precio_unitario else None,
-            "total": float(t.Transaccion.total) if t.Transaccion.total else None,
-            "referencia": t.Transaccion.referencia,
-            "observaciones": t.Transaccion.observaciones,
-            "usuario_id": t.Transaccion.usuario_id,
-            "blockchain_tx_hash": t.Transaccion.blockchain_tx_hash,
-            "blockchain_confirmado": t.Transaccion.blockchain_confirmado,
-            "fecha_creacion": t.Transaccion.fecha_creacion.isoformat(),
-            "producto_codigo": t.producto_codigo,
-            "producto_nombre": t.producto_nombre,
-            "ubicacion_nombre": t.ubicacion_nombre,
-            "tipo_nombre": t.tipo_nombre,
-            "usuario_nombre": t.usuario_nombre
-        } for t in transactions]}), 200
+        try:
+            cursor = decode_cursor(request.args.get("cursor"))
+        except ValueError:
+            return jsonify({"error": "Cursor inválido"}), 400
+        limit = page_limit(request.args, default=50)
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({"error": "Formato inválido"}), 400
+
+        transactions, next_cursor = storage.list_transactions(cursor, limit)
+
+        return json_response({"transactions": transaction_mapper.serialize(transactions, fmt), "next_cursor": next_cursor})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -107,50 +227,45 @@ def create_transaction():
         user_id = get_jwt_identity()
         data = request.get_json()
 
-        new_transaction = Transaccion(
-            producto_id=data.get("producto_id"),
-            ubicacion_id=data.get("ubicacion_id"),
-            tipo_transaccion_id=data.get("tipo_transaccion_id"),
-            cantidad=data.get("cantidad"),
-            precio_unitario=data.get("precio_unitario"),
-            total=data.get("total", data.get("precio_unitario", 0) * data.get("cantidad", 0)),
-            referencia=data.get("referencia", ""),
-            observaciones=data.get("observaciones", ""),
-            usuario_id=user_id
-        )
-        db.session.add(new_transaction)
-        db.session.flush()  # Para obtener el ID de la transacción antes del commit
-
-        # Actualizar inventario
-        tipo_transaccion = TipoTransaccion.query.get(data.get("tipo_transaccion_id"))
-
-        if tipo_transaccion:
-            cantidad_cambio = data.get("cantidad") if tipo_transaccion.tipo == "entrada" else -data.get("cantidad")
-
-            inventario_item = Inventario.query.filter_by(
-                producto_id=data.get("producto_id"),
-                ubicacion_id=data.get("ubicacion_id")
-            ).first()
-
-            if inventario_item:
-                inventario_item.cantidad += cantidad_cambio
-                inventario_item.fecha_actualizacion = datetime.utcnow()
-            else:
-                new_inventario_item = Inventario(
-                    producto_id=data.get("producto_id"),
-                    ubicacion_id=data.get("ubicacion_id"),
-                    cantidad=max(0, cantidad_cambio) # Asegura que la cantidad no sea negativa al inicio
-                )
-                db.session.add(new_inventario_item)
+        transaction_id = storage.create_transaction(data, user_id)
         db.session.commit()
+        response_cache.invalidate("inventory")
 
         return jsonify({
             "message": "Transacción registrada exitosamente",
-            "transaction_id": new_transaction.id
+            "transaction_id": transaction_id
         }), 201
 
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@inventory_bp.route("/transactions/batch", methods=["POST"])
+@jwt_required()
+def create_transactions_batch():
+    try:
+        user_id = get_jwt_identity()
+
+        try:
+            rows = parse_batch_payload(request)
+        except BatchError as e:
+            return jsonify({"error": str(e)}), 400
+
+        results = ingest_transactions(rows, user_id)
+        db.session.commit()
+        created = sum(1 for result in results if "transaction_id" in result)
+        if created:
+            response_cache.invalidate("inventory")
+
+        return jsonify({
+            "message": f"{created} de {len(results)} transacciones registradas",
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        }), 201 if created else 400
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
 
@@ -1,18 +1,55 @@
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.models.models import db, Pedido, DetallePedido, Producto, Inventario, Usuario
+from shared.allocation import DEFAULT_LOCATION_ID, InsufficientStock, merge_items, preferred_location
+from shared.export import parse_date_range
+from shared.serializers import RowMapper, isoformat, json_response, response_format
+from src.models.models import db, Pedido, DetallePedido
+from src.services.allocation import STRATEGIES, allocate_stock, begin_write_transaction
+from src.services.auth import STAFF_ROLES, current_role, require_role
+from src.services.cache import response_cache
+from src.services.costing import record_movements
+from src.services.jobs import enqueue, job_workers
+from src.services.orders import EXPANSIONS, expand_orders, parse_expand
+from src.services.pagination import decode_cursor, page_limit
+from src.services.storage import ORDER_FIELDS, ORDER_LIST_FIELDS, storage
 from datetime import datetime
 import uuid
 
 orders_bp = Blueprint("orders", __name__)
 
+order_mapper = RowMapper(ORDER_FIELDS, {"subtotal": float, "impuestos": float, "total": float,
+                                        "fecha_pedido": isoformat, "fecha_entrega": isoformat})
+order_list_mapper = RowMapper(ORDER_LIST_FIELDS, order_mapper.converters)
+
 @orders_bp.route("/orders", methods=["POST"])
 @jwt_required()
 def create_order():
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
+        items = data.get("items", [])
+
+        strategy = data.get("estrategia_asignacion", current_app.config.get("ALLOCATION_STRATEGY", "nearest"))
+        if strategy not in STRATEGIES:
+            return jsonify({"error": f"Estrategia de asignación inválida: {strategy}"}), 400
+        try:
+            cantidades = merge_items(items)
+            ubicacion_preferida = preferred_location(data.get("ubicacion_preferida", DEFAULT_LOCATION_ID))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        begin_write_transaction()
+        try:
+            asignaciones = allocate_stock(cantidades, strategy, ubicacion_preferida)
+        except InsufficientStock as e:
+            db.session.rollback()
+            return jsonify({
+                "error": str(e),
+                "producto_id": e.producto_id,
+                "solicitado": e.solicitado,
+                "disponible": e.disponible
+            }), 409
 
         numero_pedido = f"PED-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
 
@@ -29,35 +66,30 @@ def create_order():
         db.session.add(new_order)
         db.session.flush() # Get the ID before commit
 
-        for item in data.get("items", []):
-            new_detail = DetallePedido(
+        for item in items:
+            db.session.add(DetallePedido(
                 pedido_id=new_order.id,
                 producto_id=item.get("producto_id"),
                 cantidad=item.get("cantidad"),
                 precio_unitario=item.get("precio_unitario"),
                 subtotal=item.get("subtotal")
-            )
-            db.session.add(new_detail)
+            ))
 
-            # Update inventory (reduce stock)
-            inventario_item = Inventario.query.filter_by(
-                producto_id=item.get("producto_id"),
-                ubicacion_id=1 # Assuming main warehouse for now
-            ).first()
+        record_movements(db.session.connection(), [(a["producto_id"], a["ubicacion_id"], -a["cantidad"], None, "pedido", new_order.id)
+                                                    for a in asignaciones])
 
-            if inventario_item:
-                inventario_item.cantidad -= item.get("cantidad")
-                inventario_item.fecha_actualizacion = datetime.utcnow()
-            else:
-                # Handle case where product is not in inventory (e.g., error or add to inventory with negative stock)
-                pass # For now, just pass. Could raise an error or log.
+        enqueue(db.session.connection(), "alerta_stock", {"pedido_id": new_order.id, "productos": list(cantidades)},
+                clave=f"pedido-{new_order.id}-alerta_stock")
 
         db.session.commit()
+        response_cache.invalidate("inventory")
+        job_workers.notify()
 
         return jsonify({
             "message": "Pedido creado exitosamente",
             "pedido_id": new_order.id,
-            "numero_pedido": numero_pedido
+            "numero_pedido": numero_pedido,
+            "asignaciones": asignaciones
         }), 201
 
     except Exception as e:
@@ -69,27 +101,79 @@ def create_order():
 def get_user_orders(user_id):
     try:
         current_user_id = get_jwt_identity()
-        user_role = db.session.query(Usuario.rol).filter(Usuario.id == current_user_id).scalar()
+        if current_role() not in STAFF_ROLES and current_user_id != user_id:
+            return jsonify({"error": "Permisos insuficientes"}), 403
+
+        try:
+            cursor = decode_cursor(request.args.get("cursor"))
+        except ValueError:
+            return jsonify({"error": "Cursor inválido"}), 400
+        limit = page_limit(request.args)
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({"error": "Formato inválido"}), 400
+        try:
+            expand = parse_expand(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        orders, next_cursor = storage.list_orders(user_id, cursor, limit)
+        payload = expand_orders(order_mapper.serialize(orders, fmt), [row.id for row in orders], expand, fmt)
+
+        return json_response({"orders": payload, "next_cursor": next_cursor})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@orders_bp.route("/orders", methods=["GET"])
+@require_role(*STAFF_ROLES)
+def get_orders():
+    # Todos los pedidos (empleados y administradores), con filtros por estado, cliente y fechas
+    try:
+        try:
+            cursor = decode_cursor(request.args.get("cursor"))
+        except ValueError:
+            return jsonify({"error": "Cursor inválido"}), 400
+        limit = page_limit(request.args, default=50)
+        try:
+            fmt = response_format(request.args)
+        except ValueError:
+            return jsonify({"error": "Formato inválido"}), 400
+        try:
+            expand = parse_expand(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            date_range = parse_date_range(request.args.get("desde"), request.args.get("hasta"))
+        except ValueError:
+            return jsonify({"error": "Fecha inválida, use el formato AAAA-MM-DD"}), 400
+
+        orders, next_cursor = storage.list_all_orders(request.args.get("estado", ""), request.args.get("cliente_id", type=int),
+                                                      date_range, cursor, limit)
+        payload = expand_orders(order_list_mapper.serialize(orders, fmt), [row.id for row in orders], expand, fmt)
+
+        return json_response({"orders": payload, "next_cursor": next_cursor})
 
-        if user_role not in ["administrador", "empleado"] and current_user_id != user_id:
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@orders_bp.route("/orders/<int:order_id>", methods=["GET"])
+@jwt_required()
+def get_order(order_id):
+    # Un pedido con sus renglones y pagos
+    try:
+        current_user_id = get_jwt_identity()
+        order = storage.get_order(order_id)
+        if not order:
+            return jsonify({"error": "Pedido no encontrado"}), 404
+
+        if current_role() not in STAFF_ROLES and current_user_id != order.cliente_id:
             return jsonify({"error": "Permisos insuficientes"}), 403
 
-        orders = Pedido.query.filter_by(cliente_id=user_id).order_by(Pedido.fecha_pedido.desc()).all()
-
-        return jsonify({"orders": [{
-            "id": o.id,
-            "numero_pedido": o.numero_pedido,
-            "cliente_id": o.cliente_id,
-            "estado": o.estado,
-            "subtotal": float(o.subtotal),
-            "impuestos": float(o.impuestos),
-            "total": float(o.total),
-            "direccion_entrega": o.direccion_entrega,
-            "telefono_contacto": o.telefono_contacto,
-            "observaciones": o.observaciones,
-            "fecha_pedido": o.fecha_pedido.isoformat(),
-            "fecha_entrega": o.fecha_entrega.isoformat() if o.fecha_entrega else None
-        } for o in orders]}), 200
+        payload = expand_orders([order_list_mapper.one(order)], [order.id], EXPANSIONS)
+
+        return json_response({"order": payload[0]})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
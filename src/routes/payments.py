@@ -1,8 +1,10 @@
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
-from src.models.models import db, Pago, Pedido
-from datetime import datetime
+from src.services.cache import response_cache
+from src.services.jobs import enqueue, job_workers
+from src.services.storage import storage
+from src.models.models import db, Pedido
 import uuid
 
 payments_bp = Blueprint("payments", __name__)
@@ -13,28 +15,25 @@ def create_payment():
     try:
         data = request.get_json()
 
+        if db.session.query(Pedido.id).filter_by(id=data.get("pedido_id")).first() is None:
+            return jsonify({"error": "Pedido no encontrado"}), 404
+
         qr_code = None
         if data.get("metodo_pago") == "qr":
             qr_code = f"QR-{str(uuid.uuid4())[:12].upper()}"
 
-        new_payment = Pago(
-            pedido_id=data.get("pedido_id"),
-            metodo_pago=data.get("metodo_pago"),
-            monto=data.get("monto"),
-            referencia_pago=data.get("referencia_pago", ""),
-            qr_code=qr_code
-        )
-        db.session.add(new_payment)
+        payment_id = storage.create_payment(data, qr_code)
 
-        pedido = Pedido.query.get(data.get("pedido_id"))
-        if pedido:
-            pedido.estado = "pagado"
+        # El pedido pasa a 'pagado' desde la cola, en la misma transacción que registra el pago
+        enqueue(db.session.connection(), "pedido_pagado", {"pedido_id": data.get("pedido_id")},
+                clave=f"pago-{payment_id}")
 
         db.session.commit()
+        job_workers.notify()
 
         response_data = {
             "message": "Pago procesado exitosamente",
-            "payment_id": new_payment.id
+            "payment_id": payment_id
         }
 
         if qr_code:
@@ -47,6 +46,7 @@ def create_payment():
         return jsonify({"error": str(e)}), 500
 
 @payments_bp.route("/payments/methods", methods=["GET"])
+@response_cache.cached("payments", ttl=3600)
 def get_payment_methods():
     return jsonify({
         "methods": [
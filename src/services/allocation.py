@@ -0,0 +1,59 @@
+from datetime import datetime
+from shared.allocation import DEFAULT_LOCATION_ID, InsufficientStock
+from src.models.models import db, Inventario
+
+# Orden en que se toman las ubicaciones de un producto
+STRATEGIES = {
+    # La ubicación preferida primero y después las demás por id. No hay coordenadas:
+    # el nombre es histórico y el id no mide distancia a nada
+    "nearest": lambda preferred: [db.case((Inventario.ubicacion_id == preferred, 0), else_=1), Inventario.ubicacion_id],
+    # Menos divisiones: primero la ubicación con más stock
+    "largest": lambda preferred: [Inventario.cantidad.desc(), Inventario.ubicacion_id],
+    # Primero el stock que lleva más tiempo sin moverse
+    "fifo": lambda preferred: [Inventario.fecha_actualizacion, Inventario.id],
+}
+
+
+def begin_write_transaction():
+    # pysqlite abre transacciones DEFERRED; BEGIN IMMEDIATE toma el bloqueo de escritura
+    # antes de leer el stock, así dos pedidos no pueden planificar sobre las mismas unidades
+    connection = db.session.connection()
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def allocate_stock(cantidades, strategy="nearest", preferred_location=DEFAULT_LOCATION_ID):
+    order_by = STRATEGIES[strategy](preferred_location)
+
+    plan = []
+    for producto_id, solicitado in cantidades.items():
+        rows = db.session.execute(
+            db.select(Inventario.ubicacion_id, Inventario.cantidad)
+            .where(Inventario.producto_id == producto_id, Inventario.cantidad > 0)
+            .order_by(*order_by)
+        ).all()
+
+        pendiente = solicitado
+        for ubicacion_id, cantidad in rows:
+            tomar = min(pendiente, cantidad)
+            plan.append((producto_id, ubicacion_id, tomar))
+            pendiente -= tomar
+            if pendiente == 0:
+                break
+        if pendiente > 0:
+            raise InsufficientStock(producto_id, solicitado, solicitado - pendiente)
+
+    for producto_id, ubicacion_id, tomar in plan:
+        result = db.session.execute(
+            db.update(Inventario)
+            .where(Inventario.producto_id == producto_id, Inventario.ubicacion_id == ubicacion_id,
+                   Inventario.cantidad >= tomar)
+            .values(cantidad=Inventario.cantidad - tomar, fecha_actualizacion=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            disponible = db.session.query(db.func.coalesce(db.func.sum(Inventario.cantidad), 0))\
+                .filter(Inventario.producto_id == producto_id).scalar()
+            raise InsufficientStock(producto_id, cantidades[producto_id], disponible)
+
+    return [{"producto_id": p, "ubicacion_id": u, "cantidad": c} for p, u, c in plan]
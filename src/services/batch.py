@@ -0,0 +1,176 @@
+import json
+from datetime import datetime
+from numbers import Number
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.models import db, Inventario, Producto, TipoTransaccion, Transaccion, Ubicacion
+from src.services.costing import record_movements
+from src.services.ledger import extend_chain
+
+MAX_BATCH_SIZE = 50000
+IN_CHUNK_SIZE = 900
+
+
+class BatchError(Exception):
+    pass
+
+
+def parse_batch_payload(request):
+    # Arreglo JSON, {"transactions": [...]} o NDJSON (una transacción por línea)
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        rows = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise BatchError(f"Línea {number}: JSON inválido")
+    else:
+        data = request.get_json(silent=True)
+        rows = data.get("transactions") if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise BatchError("Se esperaba un arreglo de transacciones")
+
+    if not rows:
+        raise BatchError("El lote está vacío")
+    if len(rows) > MAX_BATCH_SIZE:
+        raise BatchError(f"El lote supera el máximo de {MAX_BATCH_SIZE} transacciones")
+    return rows
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+# Los campos opcionales pueden faltar o ser null; si vienen, deben poder guardarse tal cual
+def _is_number(value):
+    return value is None or (isinstance(value, Number) and not isinstance(value, bool))
+
+
+def _is_text(value):
+    return value is None or isinstance(value, str)
+
+
+def _existing_ids(column, ids):
+    found = set()
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        found.update(db.session.scalars(db.select(column).where(column.in_(ids[start:start + IN_CHUNK_SIZE]))))
+    return found
+
+
+def ingest_transactions(rows, user_id):
+    # Un resultado por fila ({"index", "transaction_id"} o {"index", "error"}); las filas inválidas no afectan al resto
+    tipos = dict(db.session.execute(db.select(TipoTransaccion.id, TipoTransaccion.tipo)).all())
+
+    results = [None] * len(rows)
+    candidates = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[index] = {"index": index, "error": "Se esperaba un objeto"}
+            continue
+        cantidad = row.get("cantidad")
+        precio = row.get("precio_unitario")
+        if not all(_is_id(row.get(field)) for field in ("producto_id", "ubicacion_id", "tipo_transaccion_id")):
+            error = "producto_id, ubicacion_id y tipo_transaccion_id son requeridos"
+        elif row["tipo_transaccion_id"] not in tipos:
+            error = "Tipo de transacción no encontrado"
+        elif not _is_id(cantidad):
+            error = "La cantidad debe ser un entero positivo"
+        elif not _is_number(precio):
+            error = "precio_unitario inválido"
+        elif not _is_number(row.get("total")):
+            error = "total inválido"
+        elif not all(_is_text(row.get(field)) for field in ("referencia", "observaciones")):
+            error = "referencia y observaciones deben ser texto"
+        else:
+            candidates.append((index, row))
+            continue
+        results[index] = {"index": index, "error": error}
+
+    productos = _existing_ids(Producto.id, {row["producto_id"] for _, row in candidates})
+    ubicaciones = _existing_ids(Ubicacion.id, {row["ubicacion_id"] for _, row in candidates})
+
+    valid = []
+    for index, row in candidates:
+        if row["producto_id"] not in productos:
+            results[index] = {"index": index, "error": "Producto no encontrado"}
+        elif row["ubicacion_id"] not in ubicaciones:
+            results[index] = {"index": index, "error": "Ubicación no encontrada"}
+        else:
+            valid.append((index, row))
+
+    if not valid:
+        return results
+
+    now = datetime.utcnow()
+    # executemany con RETURNING: los ids vuelven en el orden de las filas
+    transaction_ids = db.session.scalars(
+        db.insert(Transaccion).returning(Transaccion.id, sort_by_parameter_order=True),
+        [{
+            "producto_id": row["producto_id"],
+            "ubicacion_id": row["ubicacion_id"],
+            "tipo_transaccion_id": row["tipo_transaccion_id"],
+            "cantidad": row["cantidad"],
+            "precio_unitario": row.get("precio_unitario"),
+            "total": row.get("total", (row.get("precio_unitario") or 0) * row["cantidad"]),
+            "referencia": row.get("referencia", ""),
+            "observaciones": row.get("observaciones", ""),
+            "usuario_id": user_id,
+            "blockchain_confirmado": False,
+            "fecha_creacion": now
+        } for _, row in valid]
+    ).all()
+    for (index, _), transaction_id in zip(valid, transaction_ids):
+        results[index] = {"index": index, "transaction_id": transaction_id}
+    extend_chain(db.session.connection())
+
+    # Cambio de cada fila con la misma regla que create_transaction, en el orden del lote:
+    # la fila que crea el inventario de un producto x ubicación no baja de cero y las
+    # siguientes suman su cambio tal cual
+    connection = db.session.connection()
+    changes = []
+    exists = {}
+    for _, row in valid:
+        key = (row["producto_id"], row["ubicacion_id"])
+        change = row["cantidad"] if tipos[row["tipo_transaccion_id"]] == "entrada" else -row["cantidad"]
+        if key not in exists:
+            exists[key] = connection.exec_driver_sql(
+                "SELECT 1 FROM inventario WHERE producto_id = ? AND ubicacion_id = ?", key).first() is not None
+        if not exists[key]:
+            change = max(0, change)
+            exists[key] = True
+        changes.append(change)
+
+    # Un solo UPSERT por producto x ubicación con el cambio neto del lote
+    deltas = {}
+    for (_, row), change in zip(valid, changes):
+        key = (row["producto_id"], row["ubicacion_id"])
+        deltas[key] = deltas.get(key, 0) + change
+
+    upsert = sqlite_insert(Inventario).values(
+        producto_id=db.bindparam("p_producto_id"),
+        ubicacion_id=db.bindparam("p_ubicacion_id"),
+        cantidad=db.bindparam("p_delta"),
+        fecha_actualizacion=now
+    ).on_conflict_do_update(
+        index_elements=[Inventario.producto_id, Inventario.ubicacion_id],
+        set_={"cantidad": Inventario.cantidad + db.bindparam("p_delta"), "fecha_actualizacion": now}
+    )
+    db.session.execute(upsert, [{
+        "p_producto_id": producto_id,
+        "p_ubicacion_id": ubicacion_id,
+        "p_delta": delta
+    } for (producto_id, ubicacion_id), delta in deltas.items()])
+
+    # Capas de costo fila por fila, en el orden del lote
+    record_movements(connection, [(
+        row["producto_id"],
+        row["ubicacion_id"],
+        change,
+        row.get("precio_unitario"),
+        "transaccion",
+        results[index]["transaction_id"]
+    ) for (index, row), change in zip(valid, changes)])
+
+    return results
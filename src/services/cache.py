@@ -0,0 +1,5 @@
+from shared.cache import ResponseCache
+
+# Caché de respuestas de la aplicación (ver shared/cache.py); init_app toma CACHE_BACKEND,
+# CACHE_PATH y CACHE_TTL de la configuración
+response_cache = ResponseCache()
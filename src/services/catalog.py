@@ -0,0 +1,61 @@
+from shared.serializers import RowMapper, isoformat
+from src.models.models import db, Producto, Categoria, StockTotal
+
+
+PRODUCT_FIELDS = ("id", "codigo", "nombre", "descripcion", "categoria_id", "categoria_nombre", "precio_unitario",
+                  "precio_venta", "unidad_medida", "stock_minimo", "stock_total", "imagen_url", "disponible_venta",
+                  "fecha_creacion")
+
+product_mapper = RowMapper(PRODUCT_FIELDS, {"precio_unitario": float, "precio_venta": float, "fecha_creacion": isoformat})
+
+
+def catalog_query(product_id=None):
+    # Columnas planas (sin cargar entidades) en el orden de PRODUCT_FIELDS.
+    # stock_total sale de stock_totals, mantenida por triggers (ver services/stock.py)
+    query = db.session.query(
+        Producto.id, Producto.codigo, Producto.nombre, Producto.descripcion, Producto.categoria_id,
+        Categoria.nombre.label("categoria_nombre"), Producto.precio_unitario, Producto.precio_venta,
+        Producto.unidad_medida, Producto.stock_minimo,
+        db.func.coalesce(StockTotal.stock_total, 0).label("stock_total"),
+        Producto.imagen_url, Producto.disponible_venta, Producto.fecha_creacion
+    ).join(Categoria, Producto.categoria_id == Categoria.id)\
+        .outerjoin(StockTotal, StockTotal.producto_id == Producto.id)\
+        .filter(Producto.activo == True)
+
+    if product_id is not None:
+        query = query.filter(Producto.id == product_id)
+    return query
+
+
+def low_stock_count():
+    return StockTotal.query.filter(StockTotal.bajo_stock == True).count()
+
+
+def low_stock_products(limit=None):
+    query = db.session.query(Producto.id, Producto.codigo, Producto.nombre, Producto.stock_minimo, StockTotal.stock_total)\
+        .join(StockTotal, StockTotal.producto_id == Producto.id)\
+        .filter(StockTotal.bajo_stock == True)\
+        .order_by(StockTotal.stock_total - Producto.stock_minimo, Producto.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return [{
+        "id": p.id,
+        "codigo": p.codigo,
+        "nombre": p.nombre,
+        "stock_minimo": p.stock_minimo,
+        "stock_total": p.stock_total
+    } for p in query.all()]
+
+
+def top_stock_products(limit=5):
+    return db.session.query(Producto.id, Producto.codigo, Producto.nombre, Producto.precio_venta, StockTotal.stock_total)\
+        .join(StockTotal, StockTotal.producto_id == Producto.id)\
+        .filter(Producto.activo == True)\
+        .order_by(StockTotal.stock_total.desc())\
+        .limit(limit).all()
+
+
+def inventory_value():
+    return db.session.query(db.func.sum(Producto.precio_venta * StockTotal.stock_total))\
+        .join(StockTotal, StockTotal.producto_id == Producto.id)\
+        .filter(Producto.activo == True).scalar() or 0
@@ -0,0 +1,12 @@
+from shared.export import export_chunks, export_query
+
+# Exportación en streaming (CSV o NDJSON, opcionalmente gzip) con una conexión del engine;
+# las consultas y la escritura de bloques están en shared/export.py.
+
+
+def stream_export(engine, kind, fmt, date_range):
+    # Conexión propia: el streaming continúa después de que termina la petición
+    query, params = export_query(kind, date_range)
+    with engine.connect() as connection:
+        result = connection.exec_driver_sql(query, tuple(params))
+        yield from export_chunks(fmt, list(result.keys()), result.fetchmany)
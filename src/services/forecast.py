@@ -0,0 +1,68 @@
+from shared.forecast import HISTORY_DAYS, RESULT_FIELDS, forecast, load_demand
+from src.models.models import db
+from src.services.pagination import encode_cursor
+
+# Demanda y punto de reorden por producto y ubicación, calculados en lote desde el historial.
+#
+# El cálculo (shared/forecast.py) lee las salidas de movimientos_inventario y transacciones
+# y devuelve las estadísticas de cada serie. El resultado se guarda en
+# pronosticos_reposicion (se reemplaza completo en cada cálculo); las consultas lo cruzan
+# con el inventario actual.
+
+
+def refresh_reorder_points(connection, **params):
+    # Recalcular pronosticos_reposicion completa; devuelve la cantidad de series
+    history = params.get("history", HISTORY_DAYS)
+    # Cursor del driver: tuplas simples, sin construir un Row por fila
+    load = connection.connection.cursor()
+    try:
+        result = forecast(*load_demand(load, history), **params)
+    finally:
+        load.close()
+    connection.exec_driver_sql("DELETE FROM pronosticos_reposicion")
+    rows = list(zip(*(result[field].tolist() for field in RESULT_FIELDS)))
+    if rows:
+        connection.exec_driver_sql(f"""
+            INSERT INTO pronosticos_reposicion ({", ".join(RESULT_FIELDS)})
+            VALUES ({", ".join("?" * len(RESULT_FIELDS))})
+        """, rows)
+    return len(result["producto_id"])
+
+
+def reorder_points(after=None, limit=None, below=False, producto_id=None, ubicacion_id=None):
+    # Pronósticos con el stock actual en orden de (producto_id, ubicacion_id), paginados por
+    # esa clave: `after` es la clave de la última fila de la página anterior; con `below`
+    # solo las ubicaciones cuyo stock no supera el punto de reorden
+    conditions, params = ["p.activo = 1"], []
+    if after:
+        if len(after) != 2:
+            raise ValueError("Cursor inválido")
+        conditions.append("(r.producto_id, r.ubicacion_id) > (?, ?)")
+        params.extend(after)
+    if below:
+        conditions.append("r.punto_reorden > 0 AND COALESCE(i.cantidad, 0) <= r.punto_reorden")
+    if producto_id:
+        conditions.append("r.producto_id = ?")
+        params.append(producto_id)
+    if ubicacion_id:
+        conditions.append("r.ubicacion_id = ?")
+        params.append(ubicacion_id)
+    query = f"""
+        SELECT r.producto_id, p.codigo, p.nombre, r.ubicacion_id, u.nombre AS ubicacion_nombre,
+               COALESCE(i.cantidad, 0) AS stock_actual, p.stock_minimo, r.demanda_media,
+               r.demanda_suavizada, r.desviacion, r.stock_seguridad, r.punto_reorden, r.fecha_calculo
+        FROM pronosticos_reposicion r
+        JOIN productos p ON p.id = r.producto_id
+        JOIN ubicaciones u ON u.id = r.ubicacion_id
+        LEFT JOIN inventario i ON i.producto_id = r.producto_id AND i.ubicacion_id = r.ubicacion_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY r.producto_id, r.ubicacion_id
+    """
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit + 1)
+    rows = db.session.connection().exec_driver_sql(query, tuple(params)).all()
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].producto_id, rows[-1].ubicacion_id)
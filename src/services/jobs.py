@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import threading
+from src.models.models import db
+from src.services.forecast import refresh_reorder_points
+
+logger = logging.getLogger(__name__)
+
+# Cola de trabajos durable para los efectos secundarios de pedidos y pagos. Las rutas
+# encolan en la misma transacción que su escritura y JobWorkers (o `flask run-jobs`
+# desde otro proceso) los ejecuta después. Entrega al menos una vez: un trabajo se
+# reclama por LEASE_SECONDS y vuelve a estar disponible si el proceso muere a mitad;
+# el manejador escribe en la misma transacción que lo marca como completado.
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 2  # se duplica en cada reintento
+MAX_BACKOFF_SECONDS = 300
+POLL_INTERVAL = 1.0
+
+JOBS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS trabajos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo VARCHAR(50) NOT NULL,
+        clave VARCHAR(100) UNIQUE,
+        payload TEXT NOT NULL,
+        estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+        intentos INTEGER NOT NULL DEFAULT 0,
+        max_intentos INTEGER NOT NULL DEFAULT 5,
+        disponible_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        ultimo_error TEXT,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Solo los trabajos por ejecutar (o con plazo vencido) entran en el índice
+    """
+    CREATE INDEX IF NOT EXISTS idx_trabajos_disponibles ON trabajos(disponible_en, id)
+        WHERE estado IN ('pendiente', 'en_proceso')
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS alertas_stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto_id INTEGER NOT NULL,
+        pedido_id INTEGER,
+        stock_total INTEGER NOT NULL,
+        stock_minimo INTEGER NOT NULL,
+        atendida BOOLEAN DEFAULT 0,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (pedido_id, producto_id),
+        FOREIGN KEY (producto_id) REFERENCES productos (id),
+        FOREIGN KEY (pedido_id) REFERENCES pedidos (id)
+    )
+    """,
+]
+
+
+def ensure_jobs_schema(connection):
+    for statement in JOBS_DDL:
+        connection.exec_driver_sql(statement)
+
+
+def enqueue(connection, tipo, payload, clave=None, max_intentos=MAX_ATTEMPTS):
+    # Encola en la transacción en curso; False si la clave ya existía
+    result = connection.exec_driver_sql("""
+        INSERT INTO trabajos (tipo, clave, payload, max_intentos) VALUES (?, ?, ?, ?)
+        ON CONFLICT (clave) DO NOTHING
+    """, (tipo, clave, json.dumps(payload, separators=(",", ":")), max_intentos))
+    return result.rowcount == 1
+
+
+def claim(engine):
+    # Reclama el siguiente trabajo disponible, o None. La búsqueda usa el índice parcial sin
+    # tomar el bloqueo de escritura (una cola vacía no compite con las peticiones); con un
+    # candidato se abre la transacción y el UPDATE solo lo reclama si sigue como se leyó.
+    # Si otro trabajador se adelantó se busca el siguiente
+    with engine.connect() as connection:
+        while True:
+            job = connection.exec_driver_sql("""
+                SELECT id, tipo, payload, intentos, max_intentos FROM trabajos
+                WHERE estado IN ('pendiente', 'en_proceso') AND disponible_en <= datetime('now')
+                ORDER BY disponible_en, id
+                LIMIT 1
+            """).mappings().first()
+            connection.rollback()
+            if job is None:
+                return None
+            # Agotó sus intentos y su plazo venció: no se vuelve a ejecutar
+            expired = job["intentos"] >= job["max_intentos"]
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            if expired:
+                result = connection.exec_driver_sql("""
+                    UPDATE trabajos SET estado = 'fallido', ultimo_error = 'Plazo de ejecución vencido',
+                           fecha_actualizacion = CURRENT_TIMESTAMP
+                    WHERE id = ? AND intentos = ? AND estado IN ('pendiente', 'en_proceso')
+                      AND disponible_en <= datetime('now')
+                """, (job["id"], job["intentos"]))
+            else:
+                result = connection.exec_driver_sql("""
+                    UPDATE trabajos SET estado = 'en_proceso', intentos = intentos + 1,
+                           disponible_en = datetime('now', ?), fecha_actualizacion = CURRENT_TIMESTAMP
+                    WHERE id = ? AND intentos = ? AND estado IN ('pendiente', 'en_proceso')
+                      AND disponible_en <= datetime('now')
+                """, (f"+{LEASE_SECONDS} seconds", job["id"], job["intentos"]))
+            claimed = result.rowcount == 1
+            connection.commit()
+            if claimed and not expired:
+                return dict(job)
+
+
+def run_job(engine, job, handlers):
+    # True si terminó; False si queda para reintento (con espera exponencial) o falló
+    try:
+        handler = handlers.get(job["tipo"])
+        if handler is None:
+            raise LookupError(f"Tipo de trabajo desconocido: {job['tipo']}")
+        with engine.begin() as connection:
+            handler(connection, json.loads(job["payload"]))
+            connection.exec_driver_sql("""
+                UPDATE trabajos SET estado = 'completado', ultimo_error = NULL, fecha_actualizacion = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (job["id"],))
+        return True
+    except Exception as e:
+        attempts = job["intentos"] + 1
+        retry = attempts < job["max_intentos"]
+        delay = min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+        with engine.begin() as connection:
+            connection.exec_driver_sql("""
+                UPDATE trabajos SET estado = ?, disponible_en = datetime('now', ?), ultimo_error = ?,
+                       fecha_actualizacion = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, ("pendiente" if retry else "fallido", f"+{delay} seconds", f"{type(e).__name__}: {e}", job["id"]))
+        logger.warning("Trabajo %s (%s) falló en el intento %s: %s", job["id"], job["tipo"], attempts, e)
+        return False
+
+
+def run_pending(engine, handlers, limit=None):
+    done = failed = 0
+    while limit is None or done + failed < limit:
+        job = claim(engine)
+        if job is None:
+            break
+        if run_job(engine, job, handlers):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def queue_stats():
+    rows = db.session.execute(db.text("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado")).all()
+    stats = {"pendiente": 0, "en_proceso": 0, "completado": 0, "fallido": 0}
+    stats.update({estado: count for estado, count in rows})
+    stats["pendiente_mas_antiguo"] = db.session.execute(
+        db.text("SELECT MIN(fecha_creacion) FROM trabajos WHERE estado IN ('pendiente', 'en_proceso')")
+    ).scalar()
+    return stats
+
+
+# Manejadores: reciben la conexión de la transacción del trabajo y el payload.
+# Deben poder repetirse sin efecto adicional (entrega al menos una vez).
+
+def mark_order_paid(connection, payload):
+    connection.exec_driver_sql("UPDATE pedidos SET estado = 'pagado' WHERE id = ? AND estado != 'pagado'",
+                               (payload["pedido_id"],))
+
+
+def record_stock_alerts(connection, payload):
+    productos = payload["productos"]
+    connection.exec_driver_sql(f"""
+        INSERT INTO alertas_stock (producto_id, pedido_id, stock_total, stock_minimo)
+        SELECT p.id, ?, s.stock_total, p.stock_minimo
+        FROM stock_totals s
+        JOIN productos p ON p.id = s.producto_id
+        WHERE s.producto_id IN ({",".join("?" * len(productos))}) AND s.bajo_stock = 1
+        ON CONFLICT (pedido_id, producto_id) DO NOTHING
+    """, (payload["pedido_id"], *productos))
+
+
+def refresh_forecast(connection, payload):
+    refresh_reorder_points(connection)
+
+
+HANDLERS = {
+    "pedido_pagado": mark_order_paid,
+    "alerta_stock": record_stock_alerts,
+    "pronostico_reposicion": refresh_forecast,
+}
+
+
+class JobWorkers:
+    # Grupo de hilos que ejecuta la cola; notify() los despierta sin esperar al sondeo
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.engine = None
+        self.workers = 2
+        self.poll_interval = POLL_INTERVAL
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def init_app(self, app):
+        self.workers = app.config.get("JOB_WORKERS", self.workers)
+        with app.app_context():
+            self.engine = db.engine
+        # Los hilos arrancan con la primera petición de cada proceso que sirve: flask run,
+        # cualquier servidor WSGI y cada proceso de gunicorn (un fork no hereda los hilos).
+        # Los comandos de la CLI no atienden peticiones y no los arrancan
+        app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            self.start()
+
+    def start(self):
+        # Una sola vez por proceso
+        with self._lock:
+            if self._pid == os.getpid():
+                return self
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            job = None
+            try:
+                job = claim(self.engine)
+                if job is not None:
+                    ok = run_job(self.engine, job, self.handlers)
+                    with self._lock:
+                        if ok:
+                            self.completed += 1
+                        else:
+                            self.failed += 1
+            except Exception:
+                logger.exception("Error en el trabajador de la cola")
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "completed": self.completed, "failed": self.failed}
+
+
+job_workers = JobWorkers(HANDLERS)
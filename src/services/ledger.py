@@ -0,0 +1,130 @@
+from shared.canonical import GENESIS_HASH, TX_COLUMNS, canonical_transaction, chain_hash
+
+# Cadena de hashes de transacciones: hash_cadena = sha256(hash anterior || fila canónica).
+# Se calcula en la misma transacción que inserta las filas; los triggers impiden
+# editar o borrar filas ya escritas y verify_chain detecta cambios hechos por fuera.
+CHUNK_SIZE = 10000
+CHECKPOINT_INTERVAL = 250000
+
+_COLUMNS = ", ".join(TX_COLUMNS)
+
+LEDGER_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS auditoria_checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ultima_transaccion_id INTEGER NOT NULL,
+        hash_cadena VARCHAR(64) NOT NULL,
+        filas INTEGER NOT NULL,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_transacciones_sin_hash ON transacciones (id) WHERE hash_cadena IS NULL",
+    """
+    CREATE TRIGGER IF NOT EXISTS transacciones_solo_anexar_ad BEFORE DELETE ON transacciones BEGIN
+        SELECT RAISE(ABORT, 'transacciones es de solo anexado');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transacciones_solo_anexar_au BEFORE UPDATE OF {_COLUMNS} ON transacciones BEGIN
+        SELECT RAISE(ABORT, 'transacciones es de solo anexado');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS transacciones_hash_cadena_au BEFORE UPDATE OF hash_cadena ON transacciones
+    WHEN old.hash_cadena IS NOT NULL BEGIN
+        SELECT RAISE(ABORT, 'hash_cadena no se puede modificar');
+    END
+    """,
+]
+
+
+def ensure_ledger(connection):
+    columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(transacciones)")}
+    if "hash_cadena" not in columns:
+        connection.exec_driver_sql("ALTER TABLE transacciones ADD COLUMN hash_cadena VARCHAR(64)")
+    for statement in LEDGER_DDL:
+        connection.exec_driver_sql(statement)
+    # Filas anteriores a la columna o insertadas por fuera de la aplicación
+    extend_chain(connection)
+
+
+def extend_chain(connection):
+    # Llamar después del INSERT: la transacción ya tiene el bloqueo de escritura
+    last = connection.exec_driver_sql(
+        "SELECT hash_cadena FROM transacciones WHERE hash_cadena IS NOT NULL ORDER BY id DESC LIMIT 1"
+    ).first()
+    prev_hash = last[0] if last else GENESIS_HASH
+
+    chained = 0
+    last_id = 0
+    while True:
+        rows = connection.exec_driver_sql(
+            f"SELECT {_COLUMNS} FROM transacciones WHERE hash_cadena IS NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return chained
+        updates = []
+        for row in rows:
+            prev_hash = chain_hash(prev_hash, canonical_transaction(row))
+            updates.append((prev_hash, row[0]))
+        connection.exec_driver_sql("UPDATE transacciones SET hash_cadena = ? WHERE id = ?", updates)
+        chained += len(rows)
+        last_id = rows[-1][0]
+
+
+def verify_chain(engine, resume=False, progress=None):
+    # Recorre la cadena desde el génesis por bloques (memoria constante); solo con resume
+    # continúa desde el último checkpoint, para retomar una auditoría interrumpida
+    last_id, head, filas = 0, GENESIS_HASH, 0
+    with engine.connect() as connection:
+        if resume:
+            checkpoint = connection.exec_driver_sql(
+                "SELECT ultima_transaccion_id, hash_cadena, filas FROM auditoria_checkpoints ORDER BY id DESC LIMIT 1"
+            ).first()
+            if checkpoint:
+                last_id, head, filas = checkpoint
+                row = connection.exec_driver_sql("SELECT hash_cadena FROM transacciones WHERE id = ?", (last_id,)).first()
+                if row is None or row[0] != head:
+                    return {"valid": False, "first_invalid_id": last_id, "reason": "checkpoint",
+                            "checked": 0, "resumed_from": last_id}
+        resumed_from = last_id
+
+        checked = 0
+        since_checkpoint = 0
+        while True:
+            rows = connection.exec_driver_sql(
+                f"SELECT {_COLUMNS}, hash_cadena FROM transacciones WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, CHUNK_SIZE)
+            ).all()
+            connection.rollback()  # no mantener abierta la instantánea de lectura entre bloques
+            if not rows:
+                break
+            for row in rows:
+                stored = row[len(TX_COLUMNS)]
+                if stored is None or chain_hash(head, canonical_transaction(row)) != stored:
+                    return {"valid": False, "first_invalid_id": row[0],
+                            "reason": "sin_encadenar" if stored is None else "hash",
+                            "checked": checked, "resumed_from": resumed_from}
+                head = stored
+                checked += 1
+            last_id = rows[-1][0]
+            since_checkpoint += len(rows)
+            if since_checkpoint >= CHECKPOINT_INTERVAL:
+                _save_checkpoint(engine, last_id, head, filas + checked)
+                since_checkpoint = 0
+            if progress:
+                progress(last_id, checked)
+
+    if since_checkpoint:
+        _save_checkpoint(engine, last_id, head, filas + checked)
+    return {"valid": True, "checked": checked, "resumed_from": resumed_from, "last_id": last_id,
+            "head": head, "total": filas + checked}
+
+
+def _save_checkpoint(engine, last_id, head, filas):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO auditoria_checkpoints (ultima_transaccion_id, hash_cadena, filas) VALUES (?, ?, ?)",
+            (last_id, head, filas)
+        )
@@ -0,0 +1,328 @@
+# Migraciones versionadas del esquema. La versión aplicada se guarda en PRAGMA user_version
+# del archivo de base de datos; cada migración corre en su transacción (BEGIN IMMEDIATE),
+# así dos procesos que arrancan a la vez no la aplican dos veces. Los índices también
+# están declarados en models.py; la migración los crea en bases existentes y deja
+# registrada la versión.
+#
+# La versión 0 es el esquema base (create_schema en main.py). Con la base al día el
+# arranque solo lee user_version y no vuelve a ejecutar create_schema, así que todo
+# cambio de esquema va en una migración nueva; una ya publicada no se edita.
+MIGRATIONS = [
+    (1, "Índices para las consultas más frecuentes", [
+        # Catálogo por categoría, ordenado por nombre; solo productos activos
+        "CREATE INDEX IF NOT EXISTS ix_productos_categoria_activos ON productos (categoria_id, nombre, id) WHERE activo = 1",
+        # Renglones de un pedido sin leer la tabla (índice cubriente)
+        "CREATE INDEX IF NOT EXISTS ix_detalle_pedidos_pedido "
+        "ON detalle_pedidos (pedido_id, producto_id, cantidad, precio_unitario, subtotal)",
+        # Pagos de un pedido y su estado
+        "CREATE INDEX IF NOT EXISTS ix_pagos_pedido ON pagos (pedido_id, estado)",
+    ]),
+    (2, "Índice del listado de pedidos por estado", [
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_estado_fecha_id ON pedidos (estado, fecha_pedido, id)",
+    ]),
+    (3, "Versiones de acceso para revocar tokens al cambiar rol o estado", [
+        # version: epoch del último cambio; los tokens con una versión anterior quedan revocados
+        """
+        CREATE TABLE IF NOT EXISTS cambios_acceso (
+            usuario_id INTEGER NOT NULL PRIMARY KEY,
+            version FLOAT NOT NULL,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_cambios_acceso_version ON cambios_acceso (version)",
+    ]),
+    (4, "Movimientos y fotos de inventario para consultar el stock a una fecha", [
+        """
+        CREATE TABLE IF NOT EXISTS movimientos_inventario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            producto_id INTEGER NOT NULL,
+            ubicacion_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_movimientos_inventario_fecha ON movimientos_inventario (fecha, id)",
+        """
+        CREATE TABLE IF NOT EXISTS snapshots_inventario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            ultimo_movimiento_id INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_snapshots_inventario_fecha ON snapshots_inventario (fecha, id)",
+        # Solo cantidades distintas de cero
+        """
+        CREATE TABLE IF NOT EXISTS snapshot_lineas (
+            snapshot_id INTEGER NOT NULL,
+            producto_id INTEGER NOT NULL,
+            ubicacion_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            PRIMARY KEY (snapshot_id, producto_id, ubicacion_id)
+        ) WITHOUT ROWID
+        """,
+        # Cada cambio de cantidad queda registrado en la misma transacción que lo hace
+        """
+        CREATE TRIGGER IF NOT EXISTS movimientos_inventario_ai AFTER INSERT ON inventario
+        WHEN new.cantidad != 0 BEGIN
+            INSERT INTO movimientos_inventario (producto_id, ubicacion_id, delta)
+            VALUES (new.producto_id, new.ubicacion_id, new.cantidad);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS movimientos_inventario_au AFTER UPDATE OF producto_id, ubicacion_id, cantidad ON inventario
+        WHEN new.cantidad != old.cantidad OR new.producto_id != old.producto_id OR new.ubicacion_id != old.ubicacion_id BEGIN
+            INSERT INTO movimientos_inventario (producto_id, ubicacion_id, delta)
+            SELECT old.producto_id, old.ubicacion_id, -old.cantidad
+            WHERE new.producto_id != old.producto_id OR new.ubicacion_id != old.ubicacion_id;
+            INSERT INTO movimientos_inventario (producto_id, ubicacion_id, delta)
+            SELECT new.producto_id, new.ubicacion_id,
+                   CASE WHEN new.producto_id = old.producto_id AND new.ubicacion_id = old.ubicacion_id
+                        THEN new.cantidad - old.cantidad ELSE new.cantidad END;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS movimientos_inventario_ad AFTER DELETE ON inventario
+        WHEN old.cantidad != 0 BEGIN
+            INSERT INTO movimientos_inventario (producto_id, ubicacion_id, delta)
+            VALUES (old.producto_id, old.ubicacion_id, -old.cantidad);
+        END
+        """,
+        # Foto inicial con el inventario actual: el historial empieza aquí
+        "INSERT INTO snapshots_inventario (ultimo_movimiento_id) VALUES (0)",
+        """
+        INSERT INTO snapshot_lineas (snapshot_id, producto_id, ubicacion_id, cantidad)
+        SELECT (SELECT MAX(id) FROM snapshots_inventario), producto_id, ubicacion_id, cantidad FROM inventario WHERE cantidad != 0
+        """,
+    ]),
+    (5, "Pronóstico de demanda y punto de reorden por producto y ubicación", [
+        # Se reemplaza completa en cada cálculo (forecast.refresh_reorder_points)
+        """
+        CREATE TABLE IF NOT EXISTS pronosticos_reposicion (
+            producto_id INTEGER NOT NULL,
+            ubicacion_id INTEGER NOT NULL,
+            demanda_media REAL NOT NULL,
+            demanda_suavizada REAL NOT NULL,
+            desviacion REAL NOT NULL,
+            stock_seguridad REAL NOT NULL,
+            punto_reorden INTEGER NOT NULL,
+            fecha_calculo TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (producto_id, ubicacion_id)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (6, "Capas de costo FIFO y costo promedio por producto y ubicación", [
+        # Entradas con costo_unitario; las salidas guardan su costo FIFO y al promedio si son ventas
+        """
+        CREATE TABLE IF NOT EXISTS movimientos_costo (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            producto_id INTEGER NOT NULL,
+            ubicacion_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            costo_unitario REAL,
+            costo_fifo REAL,
+            costo_promedio REAL,
+            origen VARCHAR(20) NOT NULL,
+            referencia_id INTEGER,
+            fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_movimientos_costo_producto ON movimientos_costo (producto_id, ubicacion_id, id)",
+        """
+        CREATE TABLE IF NOT EXISTS capas_costo (
+            producto_id INTEGER NOT NULL,
+            ubicacion_id INTEGER NOT NULL,
+            movimiento_id INTEGER NOT NULL,
+            restante INTEGER NOT NULL,
+            costo_unitario REAL NOT NULL,
+            PRIMARY KEY (producto_id, ubicacion_id, movimiento_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS costos_inventario (
+            producto_id INTEGER NOT NULL,
+            ubicacion_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            costo_promedio REAL NOT NULL,
+            valor_fifo REAL NOT NULL,
+            salidas INTEGER NOT NULL,
+            costo_ventas_fifo REAL NOT NULL,
+            costo_ventas_promedio REAL NOT NULL,
+            PRIMARY KEY (producto_id, ubicacion_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS costo_ventas_diario (
+            fecha DATE NOT NULL,
+            producto_id INTEGER NOT NULL,
+            ubicacion_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            costo_fifo REAL NOT NULL,
+            costo_promedio REAL NOT NULL,
+            PRIMARY KEY (fecha, producto_id, ubicacion_id)
+        ) WITHOUT ROWID
+        """,
+        # Historial desde las transacciones. Lo que inventario tiene de más entra como
+        # apertura antes del historial (carga inicial), al precio del producto; lo que tiene
+        # de menos (pedidos anteriores a este registro) sale como ajuste al final.
+        # costing.ensure_cost_layers calcula capas y costos al arrancar
+        """
+        INSERT INTO movimientos_costo (producto_id, ubicacion_id, cantidad, costo_unitario, origen, fecha)
+        SELECT d.producto_id, d.ubicacion_id, d.cantidad, COALESCE(p.precio_unitario, 0), 'apertura',
+               COALESCE((SELECT MIN(t.fecha_creacion) FROM transacciones t
+                         WHERE t.producto_id = d.producto_id AND t.ubicacion_id = d.ubicacion_id), CURRENT_TIMESTAMP)
+        FROM (
+            SELECT producto_id, ubicacion_id, SUM(cantidad) AS cantidad
+            FROM (
+                SELECT producto_id, ubicacion_id, cantidad FROM inventario
+                UNION ALL
+                SELECT t.producto_id, t.ubicacion_id, CASE tt.tipo WHEN 'entrada' THEN -t.cantidad ELSE t.cantidad END
+                FROM transacciones t JOIN tipos_transaccion tt ON tt.id = t.tipo_transaccion_id
+            )
+            GROUP BY producto_id, ubicacion_id
+            HAVING SUM(cantidad) > 0
+        ) d
+        LEFT JOIN productos p ON p.id = d.producto_id
+        ORDER BY d.producto_id, d.ubicacion_id
+        """,
+        """
+        INSERT INTO movimientos_costo (producto_id, ubicacion_id, cantidad, costo_unitario, origen, referencia_id, fecha)
+        SELECT t.producto_id, t.ubicacion_id,
+               CASE tt.tipo WHEN 'entrada' THEN t.cantidad ELSE -t.cantidad END,
+               CASE tt.tipo WHEN 'entrada' THEN COALESCE(t.precio_unitario, p.precio_unitario, 0) END,
+               'transaccion', t.id, t.fecha_creacion
+        FROM transacciones t
+        JOIN tipos_transaccion tt ON tt.id = t.tipo_transaccion_id
+        LEFT JOIN productos p ON p.id = t.producto_id
+        WHERE t.cantidad != 0
+        ORDER BY t.id
+        """,
+        """
+        INSERT INTO movimientos_costo (producto_id, ubicacion_id, cantidad, costo_unitario, origen)
+        SELECT d.producto_id, d.ubicacion_id, d.cantidad,
+               CASE WHEN d.cantidad > 0 THEN COALESCE(p.precio_unitario, 0) END, 'ajuste'
+        FROM (
+            SELECT producto_id, ubicacion_id, SUM(cantidad) AS cantidad
+            FROM (
+                SELECT producto_id, ubicacion_id, cantidad FROM inventario
+                UNION ALL
+                SELECT producto_id, ubicacion_id, -cantidad FROM movimientos_costo
+            )
+            GROUP BY producto_id, ubicacion_id
+            HAVING SUM(cantidad) != 0
+        ) d
+        LEFT JOIN productos p ON p.id = d.producto_id
+        ORDER BY d.producto_id, d.ubicacion_id
+        """,
+    ]),
+    (7, "Versiones solo por columnas servidas de productos y versiones de costos_inventario", [
+        # El anclaje escribe productos.blockchain_hash, que ninguna ruta sirve: no debe invalidar ETags
+        "DROP TRIGGER IF EXISTS versiones_productos_au",
+        """
+        CREATE TRIGGER IF NOT EXISTS versiones_productos_au AFTER UPDATE OF
+            codigo, nombre, descripcion, categoria_id, precio_unitario, precio_venta,
+            unidad_medida, stock_minimo, imagen_url, activo, disponible_venta, fecha_creacion
+        ON productos BEGIN
+            UPDATE versiones_tablas SET version = version + 1, actualizado = CURRENT_TIMESTAMP WHERE tabla = 'productos';
+        END
+        """,
+        # El resumen de inventario sirve la valorización de costos_inventario
+        "INSERT OR IGNORE INTO versiones_tablas (tabla) VALUES ('costos_inventario')",
+        """
+        CREATE TRIGGER IF NOT EXISTS versiones_costos_inventario_ai AFTER INSERT ON costos_inventario BEGIN
+            UPDATE versiones_tablas SET version = version + 1, actualizado = CURRENT_TIMESTAMP WHERE tabla = 'costos_inventario';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS versiones_costos_inventario_au AFTER UPDATE ON costos_inventario BEGIN
+            UPDATE versiones_tablas SET version = version + 1, actualizado = CURRENT_TIMESTAMP WHERE tabla = 'costos_inventario';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS versiones_costos_inventario_ad AFTER DELETE ON costos_inventario BEGIN
+            UPDATE versiones_tablas SET version = version + 1, actualizado = CURRENT_TIMESTAMP WHERE tabla = 'costos_inventario';
+        END
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Consultas calientes y el índice que deben usar: (nombre, sql, parámetros, índice)
+HOT_QUERIES = [
+    ("productos por categoría",
+     "SELECT id FROM productos WHERE activo = 1 AND categoria_id = ? ORDER BY nombre, id LIMIT 50",
+     (1,), "ix_productos_categoria_activos"),
+    ("transacciones recientes",
+     "SELECT id FROM transacciones ORDER BY fecha_creacion DESC, id DESC LIMIT 50",
+     (), "ix_transacciones_fecha_id"),
+    ("pedidos de un cliente",
+     "SELECT id FROM pedidos WHERE cliente_id = ? ORDER BY fecha_pedido DESC, id DESC LIMIT 50",
+     (1,), "ix_pedidos_cliente_fecha_id"),
+    ("pedidos por estado",
+     "SELECT id FROM pedidos WHERE estado = ? ORDER BY fecha_pedido DESC, id DESC LIMIT 50",
+     ("pendiente",), "ix_pedidos_estado_fecha_id"),
+    ("renglones de un pedido",
+     "SELECT producto_id, cantidad, precio_unitario, subtotal FROM detalle_pedidos WHERE pedido_id = ?",
+     (1,), "ix_detalle_pedidos_pedido"),
+    ("pagos de un pedido",
+     "SELECT id, estado FROM pagos WHERE pedido_id = ?",
+     (1,), "ix_pagos_pedido"),
+    ("foto de inventario a una fecha",
+     "SELECT id FROM snapshots_inventario WHERE fecha <= ? ORDER BY fecha DESC, id DESC LIMIT 1",
+     ("2024-01-01 00:00:00",), "ix_snapshots_inventario_fecha"),
+    ("movimientos posteriores a una fecha",
+     "SELECT id FROM movimientos_inventario WHERE fecha > ? ORDER BY fecha, id LIMIT 1",
+     ("2024-01-01 00:00:00",), "ix_movimientos_inventario_fecha"),
+    ("movimientos de costo de un producto",
+     "SELECT id, cantidad FROM movimientos_costo WHERE producto_id = ? AND ubicacion_id = ? ORDER BY id",
+     (1, 1), "ix_movimientos_costo_producto"),
+]
+
+
+def schema_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine):
+    # Aplica las migraciones pendientes; devuelve las versiones aplicadas
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        with engine.connect() as connection:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            # Releer dentro de la transacción: otro proceso pudo aplicarla mientras esperábamos
+            if schema_version(connection) >= version:
+                connection.rollback()
+                continue
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+            connection.commit()
+        applied.append(version)
+
+    if applied:
+        optimize(engine, analyze=True)
+    return applied
+
+
+def optimize(engine, analyze=False):
+    # Estadísticas del planificador: ANALYZE completo o PRAGMA optimize incremental
+    with engine.connect() as connection:
+        if analyze:
+            connection.exec_driver_sql("ANALYZE")
+        connection.exec_driver_sql("PRAGMA optimize")
+        connection.commit()
+
+
+def explain(connection, query, params=()):
+    return [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {query}", params).all()]
+
+
+def check_query_plans(engine):
+    # Consultas calientes que dejaron de usar su índice: [(nombre, índice, plan)]
+    failures = []
+    with engine.connect() as connection:
+        for name, query, params, index in HOT_QUERIES:
+            plan = explain(connection, query, params)
+            if not any(index in step for step in plan):
+                failures.append((name, index, plan))
+    return failures
@@ -0,0 +1,53 @@
+from shared.serializers import RowMapper, isoformat
+from src.services.storage import ORDER_ITEM_FIELDS, PAYMENT_FIELDS, storage
+
+# Expansión de pedidos (?expand=items,payments): los renglones y pagos de toda la página
+# se leen con una consulta por relación (WHERE pedido_id IN (...)), en lugar de una
+# petición por pedido desde el cliente. Ambas consultas usan los índices por pedido_id.
+EXPANSIONS = ("items", "payments")
+
+# Ids por consulta, por debajo del límite de parámetros de SQLite
+IN_CHUNK = 500
+
+item_mapper = RowMapper(ORDER_ITEM_FIELDS[1:], {"precio_unitario": float, "subtotal": float})
+payment_mapper = RowMapper(PAYMENT_FIELDS[1:], {"monto": float, "fecha_pago": isoformat})
+
+# Relación -> (operación de almacenamiento, serializador)
+RELATIONS = {
+    "items": ("order_items", item_mapper),
+    "payments": ("order_payments", payment_mapper),
+}
+
+
+def parse_expand(args):
+    # Relaciones pedidas en ?expand=; ValueError si alguna no existe
+    expand = [name.strip() for name in args.get("expand", "").split(",") if name.strip()]
+    unknown = [name for name in expand if name not in EXPANSIONS]
+    if unknown:
+        raise ValueError(f"Expansión desconocida: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(expand))
+
+
+def load_related(name, order_ids):
+    # {pedido_id: [filas serializadas]} de una relación para todos los pedidos
+    operation, mapper = RELATIONS[name]
+    related = {}
+    for start in range(0, len(order_ids), IN_CHUNK):
+        rows = getattr(storage, operation)(order_ids[start:start + IN_CHUNK])
+        for row, value in zip(rows, mapper.rows(rows)):
+            related.setdefault(row.pedido_id, []).append(value)
+    return related
+
+
+def expand_orders(payload, order_ids, expand, fmt="rows"):
+    # Agrega las relaciones a los pedidos ya serializados: en formato "rows" cada pedido
+    # recibe su lista; en "columns" cada relación es una columna más, alineada con las demás
+    for name in expand:
+        related = load_related(name, order_ids)
+        values = [related.get(order_id, []) for order_id in order_ids]
+        if fmt == "columns":
+            payload[name] = values
+        else:
+            for order, value in zip(payload, values):
+                order[name] = value
+    return payload
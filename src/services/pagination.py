@@ -0,0 +1,51 @@
+import base64
+import json
+from datetime import datetime
+from src.models.models import db
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(*values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    # ValueError (incluye binascii.Error y JSONDecodeError) si el cursor no es válido
+    if not cursor:
+        return None
+    values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    # [clave de orden, id]: una lista u objeto dentro del cursor llegaría a la consulta y daría 500
+    if (not isinstance(values, list) or len(values) != 2
+            or not isinstance(values[0], (str, int, float)) or isinstance(values[0], bool)
+            or not isinstance(values[1], int) or isinstance(values[1], bool)):
+        raise ValueError("Cursor inválido")
+    return values
+
+
+def page_limit(args, default=None):
+    limit = args.get("limit", default, type=int)
+    if limit is None:
+        return None
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, columns, cursor, limit, descending=False):
+    # Paginación por clave (columna de orden + id): cada página es un rango del índice, sin OFFSET
+    if cursor is not None:
+        if len(cursor) != len(columns):
+            raise ValueError("Cursor inválido")
+        values = tuple(
+            datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) and value is not None else value
+            for column, value in zip(columns, cursor)
+        )
+        key = db.tuple_(*columns)
+        query = query.filter(key < values if descending else key > values)
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    if limit is None:
+        return query.all(), False
+
+    rows = query.limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,5 @@
+from shared.passwords import PasswordHasher
+
+# Hash de contraseñas de la aplicación (ver shared/passwords.py); init_app toma PASSWORD_METHOD,
+# PASSWORD_WORKERS y PASSWORD_MAX_PENDING de la configuración
+password_hasher = PasswordHasher()
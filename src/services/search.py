@@ -0,0 +1,18 @@
+from shared.search import SEARCH_INDEX_DDL, SEARCH_RANK
+from src.models.models import db
+
+
+def ensure_search_index(connection):
+    exists = connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'productos_fts'").first() is not None
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql("INSERT INTO productos_fts (productos_fts) VALUES ('rebuild')")
+
+
+def search_subquery(match):
+    # Productos que coinciden con `match` y su ranking bm25 (shared/search.py)
+    return db.text(
+        f"SELECT rowid AS producto_id, {SEARCH_RANK} AS search_rank "
+        "FROM productos_fts WHERE productos_fts MATCH :match"
+    ).bindparams(match=match).columns(producto_id=db.Integer, search_rank=db.Float).subquery("productos_fts_match")
@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+from src.models.models import db
+
+logger = logging.getLogger(__name__)
+
+# Inventario a una fecha: fotos periódicas por producto y ubicación más el registro de
+# movimientos posteriores.
+#
+# transacciones no alcanza para reconstruir el stock: los pedidos descuentan inventario
+# sin transacción y los datos iniciales se cargan directo. Los triggers de
+# movimientos_inventario (migración 4) registran cada cambio de inventario.cantidad
+# dentro de la misma transacción que lo hace, venga de donde venga, igual que stock_totals.
+#
+# Una foto guarda las cantidades distintas de cero y el último movimiento que incluye.
+# El stock a la fecha D es la última foto anterior a D más los movimientos entre esa foto
+# y D: los ids de movimiento crecen con la fecha (SQLite serializa las escrituras), así
+# que el tramo a sumar es un rango de la clave primaria. InventorySnapshots toma una
+# foto cuando se acumulan SNAPSHOT_EVERY movimientos o la última tiene más de
+# SNAPSHOT_MAX_AGE, de modo que el tramo queda acotado aunque el registro crezca.
+SNAPSHOT_EVERY = 10000  # movimientos desde la última foto
+SNAPSHOT_MAX_AGE = 24 * 3600  # segundos, si hubo movimientos
+SNAPSHOT_INTERVAL = 60  # segundos entre revisiones del hilo
+
+# Operador de la fecha pedida -> operador de "posterior a la fecha"
+_AFTER = {"<": ">=", "<=": ">"}
+
+
+class NoHistory(Exception):
+    pass
+
+
+def take_snapshot(engine):
+    # Foto del inventario actual; devuelve su id, o None si no hubo movimientos desde la anterior
+    with engine.connect() as connection:
+        # Bajo el bloqueo de escritura: ningún movimiento entra entre leer el último id y copiar inventario
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        last_movement = connection.exec_driver_sql("SELECT COALESCE(MAX(id), 0) FROM movimientos_inventario").scalar()
+        if connection.exec_driver_sql("SELECT MAX(ultimo_movimiento_id) FROM snapshots_inventario").scalar() == last_movement:
+            connection.rollback()
+            return None
+        snapshot_id = connection.exec_driver_sql(
+            "INSERT INTO snapshots_inventario (ultimo_movimiento_id) VALUES (?)", (last_movement,)
+        ).lastrowid
+        connection.exec_driver_sql("""
+            INSERT INTO snapshot_lineas (snapshot_id, producto_id, ubicacion_id, cantidad)
+            SELECT ?, producto_id, ubicacion_id, cantidad FROM inventario WHERE cantidad != 0
+        """, (snapshot_id,))
+        connection.commit()
+    return snapshot_id
+
+
+def snapshot_due(connection, every=SNAPSHOT_EVERY, max_age=SNAPSHOT_MAX_AGE):
+    # ¿Corresponde una foto nueva? Por cantidad de movimientos o por antigüedad de la última
+    row = connection.exec_driver_sql("""
+        SELECT s.ultimo_movimiento_id, (julianday('now') - julianday(s.fecha)) * 86400
+        FROM snapshots_inventario s ORDER BY s.id DESC LIMIT 1
+    """).first()
+    last_movement, age = (row[0], row[1]) if row else (0, None)
+    pending = connection.exec_driver_sql("SELECT COALESCE(MAX(id), 0) FROM movimientos_inventario").scalar() - last_movement
+    return pending >= every or (pending > 0 and (age is None or age >= max_age))
+
+
+def stock_as_of(date_bound, producto_id=None, ubicacion_id=None):
+    # Stock por producto y ubicación a una fecha. `date_bound` es (operador, fecha) como lo
+    # devuelve parse_date_range para `hasta`. Devuelve (filas, foto, movimientos sumados);
+    # lanza NoHistory si no hay foto anterior
+    connection = db.session.connection()
+    op, value = date_bound
+    snapshot = connection.exec_driver_sql(f"""
+        SELECT id, fecha, ultimo_movimiento_id FROM snapshots_inventario
+        WHERE fecha {op} ? ORDER BY fecha DESC, id DESC LIMIT 1
+    """, (value,)).first()
+    if snapshot is None:
+        raise NoHistory()
+
+    # Último movimiento hasta la fecha: el anterior al primero posterior a ella
+    after = connection.exec_driver_sql(f"""
+        SELECT id FROM movimientos_inventario WHERE fecha {_AFTER[op]} ? ORDER BY fecha, id LIMIT 1
+    """, (value,)).scalar()
+    if after is not None:
+        until = after - 1
+    else:
+        until = connection.exec_driver_sql("SELECT COALESCE(MAX(id), 0) FROM movimientos_inventario").scalar()
+    since = snapshot.ultimo_movimiento_id
+
+    filters, params = "", []
+    if producto_id:
+        filters += " AND producto_id = ?"
+        params.append(producto_id)
+    if ubicacion_id:
+        filters += " AND ubicacion_id = ?"
+        params.append(ubicacion_id)
+
+    rows = connection.exec_driver_sql(f"""
+        SELECT s.producto_id, p.codigo, p.nombre, s.ubicacion_id, u.nombre AS ubicacion_nombre, s.cantidad
+        FROM (
+            SELECT producto_id, ubicacion_id, SUM(cantidad) AS cantidad
+            FROM (
+                SELECT producto_id, ubicacion_id, cantidad FROM snapshot_lineas
+                WHERE snapshot_id = ?{filters}
+                UNION ALL
+                SELECT producto_id, ubicacion_id, delta FROM movimientos_inventario
+                WHERE id > ? AND id <= ?{filters}
+            )
+            GROUP BY producto_id, ubicacion_id
+            HAVING SUM(cantidad) != 0
+        ) s
+        JOIN productos p ON p.id = s.producto_id
+        JOIN ubicaciones u ON u.id = s.ubicacion_id
+        ORDER BY s.producto_id, s.ubicacion_id
+    """, tuple([snapshot.id] + params + [since, until] + params)).all()
+    return rows, snapshot, max(0, until - since)
+
+
+class InventorySnapshots:
+    # Hilo que toma una foto cuando corresponde (snapshot_due), revisando cada `interval` segundos
+    def __init__(self):
+        self.engine = None
+        self.interval = SNAPSHOT_INTERVAL
+        self.every = SNAPSHOT_EVERY
+        self.max_age = SNAPSHOT_MAX_AGE
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.interval = app.config.get("SNAPSHOT_INTERVAL", self.interval)
+        self.every = app.config.get("SNAPSHOT_EVERY", self.every)
+        self.max_age = app.config.get("SNAPSHOT_MAX_AGE", self.max_age)
+        with app.app_context():
+            self.engine = db.engine
+        # Como la cola de trabajos: el hilo arranca con la primera petición de cada proceso que sirve
+        app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            self.start()
+
+    def start(self):
+        # Una sola vez por proceso
+        with self._lock:
+            if self._pid == os.getpid():
+                return self
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="inventory-snapshots", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                with self.engine.connect() as connection:
+                    due = snapshot_due(connection, self.every, self.max_age)
+                if due:
+                    snapshot_id = take_snapshot(self.engine)
+                    if snapshot_id:
+                        logger.info("Foto de inventario %s tomada", snapshot_id)
+            except Exception:
+                logger.exception("Error al tomar la foto de inventario")
+
+
+inventory_snapshots = InventorySnapshots()
@@ -0,0 +1,86 @@
+# stock_totals (modelo StockTotal) se mantiene con triggers sobre inventario y
+# productos, dentro de la misma transacción que modifica el inventario.
+_REFRESH_FLAG = """
+        UPDATE stock_totals SET bajo_stock = COALESCE((
+            SELECT p.activo = 1 AND p.stock_minimo > 0 AND stock_totals.stock_total <= p.stock_minimo
+            FROM productos p WHERE p.id = stock_totals.producto_id
+        ), 0)
+        WHERE producto_id = {id};"""
+
+_ADD_STOCK = """
+        INSERT INTO stock_totals (producto_id, stock_total, bajo_stock) VALUES ({id}, {delta}, 0)
+        ON CONFLICT(producto_id) DO UPDATE SET stock_total = stock_total + excluded.stock_total;"""
+
+STOCK_TOTALS_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS stock_totals_inventario_ai AFTER INSERT ON inventario BEGIN
+        {_ADD_STOCK.format(id="new.producto_id", delta="new.cantidad")}
+        {_REFRESH_FLAG.format(id="new.producto_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS stock_totals_inventario_au AFTER UPDATE OF producto_id, cantidad ON inventario BEGIN
+        {_ADD_STOCK.format(id="old.producto_id", delta="-old.cantidad")}
+        {_ADD_STOCK.format(id="new.producto_id", delta="new.cantidad")}
+        {_REFRESH_FLAG.format(id="old.producto_id")}
+        {_REFRESH_FLAG.format(id="new.producto_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS stock_totals_inventario_ad AFTER DELETE ON inventario BEGIN
+        {_ADD_STOCK.format(id="old.producto_id", delta="-old.cantidad")}
+        {_REFRESH_FLAG.format(id="old.producto_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS stock_totals_productos_ai AFTER INSERT ON productos BEGIN
+        INSERT OR IGNORE INTO stock_totals (producto_id, stock_total, bajo_stock) VALUES (new.id, 0, 0);
+        {_REFRESH_FLAG.format(id="new.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS stock_totals_productos_au AFTER UPDATE OF stock_minimo, activo ON productos BEGIN
+        {_REFRESH_FLAG.format(id="new.id")}
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stock_totals_productos_ad AFTER DELETE ON productos BEGIN
+        DELETE FROM stock_totals WHERE producto_id = old.id;
+    END
+    """,
+]
+
+EXPECTED_STOCK_TOTALS = """
+    SELECT p.id AS producto_id,
+           COALESCE(SUM(i.cantidad), 0) AS stock_total,
+           (p.activo = 1 AND p.stock_minimo > 0 AND COALESCE(SUM(i.cantidad), 0) <= p.stock_minimo) AS bajo_stock
+    FROM productos p
+    LEFT JOIN inventario i ON i.producto_id = p.id
+    GROUP BY p.id
+"""
+
+
+def ensure_stock_totals(connection):
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'stock_totals_inventario_ai'"
+    ).first() is not None
+    for statement in STOCK_TOTALS_TRIGGERS:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        rebuild_stock_totals(connection)
+
+
+def rebuild_stock_totals(connection):
+    connection.exec_driver_sql("DELETE FROM stock_totals")
+    connection.exec_driver_sql(f"INSERT INTO stock_totals (producto_id, stock_total, bajo_stock) {EXPECTED_STOCK_TOTALS}")
+
+
+def verify_stock_totals(connection):
+    # Productos cuyo total materializado no coincide con inventario
+    return connection.exec_driver_sql(f"""
+        SELECT e.producto_id, e.stock_total AS esperado, s.stock_total AS actual,
+               e.bajo_stock AS bajo_stock_esperado, s.bajo_stock AS bajo_stock_actual
+        FROM ({EXPECTED_STOCK_TOTALS}) e
+        LEFT JOIN stock_totals s ON s.producto_id = e.producto_id
+        WHERE s.producto_id IS NULL OR s.stock_total != e.stock_total OR s.bajo_stock != e.bajo_stock
+    """).fetchall()
@@ -0,0 +1,571 @@
+import operator
+import time
+from datetime import datetime
+from src.models.models import db, DetallePedido, Inventario, Pago, Pedido, Producto, TipoTransaccion, Transaccion, Ubicacion, Usuario, Categoria
+from src.services.catalog import catalog_query, inventory_value, low_stock_count, low_stock_products, top_stock_products
+from src.services.costing import inventory_cost_value, record_movements
+from src.services.ledger import extend_chain
+from src.services.pagination import encode_cursor, keyset_page
+from src.services.search import search_subquery
+
+# Capa de almacenamiento: una interfaz (OPERATIONS) y dos motores.
+#   orm: consultas y unidad de trabajo de SQLAlchemy
+#   sql: SQL escrito a mano sobre la misma sesión
+# Los dos trabajan dentro de la transacción de db.session (la ruta hace commit o rollback)
+# y devuelven filas con las mismas columnas, así los serializadores no dependen del motor.
+# STORAGE_ENGINE elige el motor por defecto y STORAGE_OVERRIDES uno por operación, según
+# lo que mida `flask benchmark-storage` con los datos reales.
+OPERATIONS = ("list_products", "get_product", "create_product", "inventory_summary",
+              "list_transactions", "create_transaction", "list_orders", "list_all_orders", "get_order",
+              "order_items", "order_payments", "create_payment")
+
+TRANSACTION_FIELDS = ("id", "producto_id", "ubicacion_id", "tipo_transaccion_id", "cantidad", "precio_unitario", "total",
+                      "referencia", "observaciones", "usuario_id", "blockchain_tx_hash", "blockchain_confirmado",
+                      "fecha_creacion", "producto_codigo", "producto_nombre", "ubicacion_nombre", "tipo_nombre",
+                      "usuario_nombre")
+
+ORDER_FIELDS = ("id", "numero_pedido", "cliente_id", "estado", "subtotal", "impuestos", "total", "direccion_entrega",
+                "telefono_contacto", "observaciones", "fecha_pedido", "fecha_entrega")
+
+# Listado de empleados y detalle de un pedido: con el nombre del cliente
+ORDER_LIST_FIELDS = ORDER_FIELDS + ("cliente_nombre",)
+
+# Relaciones de ?expand=: la primera columna es el pedido al que pertenece la fila
+ORDER_ITEM_FIELDS = ("pedido_id", "id", "producto_id", "codigo", "nombre", "cantidad", "precio_unitario", "subtotal")
+PAYMENT_FIELDS = ("pedido_id", "id", "metodo_pago", "monto", "estado", "referencia_pago", "qr_code", "fecha_pago")
+
+# Operadores de parse_date_range (shared/export.py)
+DATE_OPERATORS = {">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+class OrmStorage:
+    def list_products(self, match, category_id, available_only, cursor, limit):
+        query = catalog_query()
+        sort_columns = [Producto.nombre, Producto.id]
+        if match:
+            matches = search_subquery(match)
+            query = query.join(matches, matches.c.producto_id == Producto.id).add_columns(matches.c.search_rank)
+            sort_columns = [matches.c.search_rank, Producto.id]
+        if category_id:
+            query = query.filter(Producto.categoria_id == category_id)
+        if available_only:
+            query = query.filter(Producto.disponible_venta == True)
+
+        rows, has_more = keyset_page(query, sort_columns, cursor, limit)
+        if not has_more:
+            return rows, None
+        last = rows[-1]
+        return rows, encode_cursor(last.search_rank if match else last.nombre, last.id)
+
+    def get_product(self, product_id):
+        return catalog_query(product_id).first()
+
+    def create_product(self, data):
+        product = Producto(
+            codigo=data.get("codigo"),
+            nombre=data.get("nombre"),
+            descripcion=data.get("descripcion", ""),
+            categoria_id=data.get("categoria_id"),
+            precio_unitario=data.get("precio_unitario"),
+            precio_venta=data.get("precio_venta", data.get("precio_unitario")),
+            unidad_medida=data.get("unidad_medida", "pcs"),
+            stock_minimo=data.get("stock_minimo", 0),
+            imagen_url=data.get("imagen_url", ""),
+            disponible_venta=data.get("disponible_venta", True)
+        )
+        db.session.add(product)
+        db.session.flush()
+        return product.id
+
+    def inventory_summary(self):
+        valor_costo_fifo, valor_costo_promedio = inventory_cost_value()
+        return {
+            "total_productos": Producto.query.filter_by(activo=True).count(),
+            "total_ubicaciones": Ubicacion.query.filter_by(activo=True).count(),
+            "valor_total": float(inventory_value()),
+            "valor_costo_fifo": float(valor_costo_fifo),
+            "valor_costo_promedio": float(valor_costo_promedio),
+            "productos_bajo_stock": low_stock_count(),
+            "alertas_stock": low_stock_products(limit=10),
+            "top_productos": [{
+                "id": p.id,
+                "codigo": p.codigo,
+                "nombre": p.nombre,
+                "precio_venta": float(p.precio_venta) if p.precio_venta else None,
+                "stock_total": p.stock_total
+            } for p in top_stock_products(5)]
+        }
+
+    def list_transactions(self, cursor, limit):
+        query = db.session.query(Transaccion.id, Transaccion.producto_id, Transaccion.ubicacion_id, Transaccion.tipo_transaccion_id,
+                                 Transaccion.cantidad, Transaccion.precio_unitario, Transaccion.total, Transaccion.referencia,
+                                 Transaccion.observaciones, Transaccion.usuario_id, Transaccion.blockchain_tx_hash,
+                                 Transaccion.blockchain_confirmado, Transaccion.fecha_creacion,
+                                 Producto.codigo.label("producto_codigo"), Producto.nombre.label("producto_nombre"),
+                                 Ubicacion.nombre.label("ubicacion_nombre"), TipoTransaccion.nombre.label("tipo_nombre"),
+                                 Usuario.username.label("usuario_nombre")).\
+            join(Producto, Transaccion.producto_id == Producto.id).\
+            join(Ubicacion, Transaccion.ubicacion_id == Ubicacion.id).\
+            join(TipoTransaccion, Transaccion.tipo_transaccion_id == TipoTransaccion.id).\
+            join(Usuario, Transaccion.usuario_id == Usuario.id)
+        rows, has_more = keyset_page(query, [Transaccion.fecha_creacion, Transaccion.id], cursor, limit, descending=True)
+        return rows, encode_cursor(rows[-1].fecha_creacion, rows[-1].id) if has_more else None
+
+    def create_transaction(self, data, user_id):
+        transaction = Transaccion(
+            producto_id=data.get("producto_id"),
+            ubicacion_id=data.get("ubicacion_id"),
+            tipo_transaccion_id=data.get("tipo_transaccion_id"),
+            cantidad=data.get("cantidad"),
+            precio_unitario=data.get("precio_unitario"),
+            total=data.get("total", data.get("precio_unitario", 0) * data.get("cantidad", 0)),
+            referencia=data.get("referencia", ""),
+            observaciones=data.get("observaciones", ""),
+            usuario_id=user_id
+        )
+        db.session.add(transaction)
+        db.session.flush()  # Para obtener el ID de la transacción antes del commit
+
+        # Actualizar inventario
+        tipo_transaccion = TipoTransaccion.query.get(data.get("tipo_transaccion_id"))
+
+        if tipo_transaccion:
+            cantidad_cambio = data.get("cantidad") if tipo_transaccion.tipo == "entrada" else -data.get("cantidad")
+
+            inventario_item = Inventario.query.filter_by(
+                producto_id=data.get("producto_id"),
+                ubicacion_id=data.get("ubicacion_id")
+            ).first()
+
+            if inventario_item:
+                inventario_item.cantidad += cantidad_cambio
+                inventario_item.fecha_actualizacion = datetime.utcnow()
+            else:
+                cantidad_cambio = max(0, cantidad_cambio)  # Asegura que la cantidad no sea negativa al inicio
+                db.session.add(Inventario(
+                    producto_id=data.get("producto_id"),
+                    ubicacion_id=data.get("ubicacion_id"),
+                    cantidad=cantidad_cambio
+                ))
+
+            # Capas de costo: las entradas al precio de la transacción
+            record_movements(db.session.connection(), [(data.get("producto_id"), data.get("ubicacion_id"), cantidad_cambio,
+                                                        data.get("precio_unitario"), "transaccion", transaction.id)])
+
+        # Encadenar la fila nueva antes del commit
+        extend_chain(db.session.connection())
+        return transaction.id
+
+    def list_orders(self, cliente_id, cursor, limit):
+        query = db.session.query(*[getattr(Pedido, field) for field in ORDER_FIELDS]).filter(Pedido.cliente_id == cliente_id)
+        rows, has_more = keyset_page(query, [Pedido.fecha_pedido, Pedido.id], cursor, limit, descending=True)
+        return rows, encode_cursor(rows[-1].fecha_pedido, rows[-1].id) if has_more else None
+
+    def _order_list_query(self):
+        return db.session.query(*[getattr(Pedido, field) for field in ORDER_FIELDS], Usuario.nombre.label("cliente_nombre"))\
+            .join(Usuario, Pedido.cliente_id == Usuario.id)
+
+    def list_all_orders(self, estado, cliente_id, date_range, cursor, limit):
+        query = self._order_list_query()
+        if estado:
+            query = query.filter(Pedido.estado == estado)
+        if cliente_id:
+            query = query.filter(Pedido.cliente_id == cliente_id)
+        for op, value in date_range:
+            query = query.filter(DATE_OPERATORS[op](Pedido.fecha_pedido, datetime.fromisoformat(value)))
+        rows, has_more = keyset_page(query, [Pedido.fecha_pedido, Pedido.id], cursor, limit, descending=True)
+        return rows, encode_cursor(rows[-1].fecha_pedido, rows[-1].id) if has_more else None
+
+    def get_order(self, order_id):
+        return self._order_list_query().filter(Pedido.id == order_id).first()
+
+    def order_items(self, order_ids):
+        # Estilo selectinload: los renglones de todos los pedidos en una consulta
+        return db.session.query(DetallePedido.pedido_id, DetallePedido.id, DetallePedido.producto_id, Producto.codigo,
+                                Producto.nombre, DetallePedido.cantidad, DetallePedido.precio_unitario,
+                                DetallePedido.subtotal)\
+            .join(Producto, DetallePedido.producto_id == Producto.id)\
+            .filter(DetallePedido.pedido_id.in_(order_ids))\
+            .order_by(DetallePedido.pedido_id, DetallePedido.id).all()
+
+    def order_payments(self, order_ids):
+        return db.session.query(*[getattr(Pago, field) for field in PAYMENT_FIELDS])\
+            .filter(Pago.pedido_id.in_(order_ids))\
+            .order_by(Pago.pedido_id, Pago.id).all()
+
+    def create_payment(self, data, qr_code):
+        payment = Pago(
+            pedido_id=data.get("pedido_id"),
+            metodo_pago=data.get("metodo_pago"),
+            monto=data.get("monto"),
+            referencia_pago=data.get("referencia_pago", ""),
+            qr_code=qr_code
+        )
+        db.session.add(payment)
+        db.session.flush()
+        return payment.id
+
+
+# Tipos de las columnas de resultado y de los parámetros de fecha: el SQL a mano devuelve
+# lo mismo que el ORM (fechas como datetime, booleanos como bool) y compara fechas en el
+# mismo formato en que SQLAlchemy las guarda
+PRODUCT_TYPES = {"precio_unitario": db.Float, "precio_venta": db.Float, "disponible_venta": db.Boolean,
+                 "fecha_creacion": db.DateTime, "search_rank": db.Float}
+TRANSACTION_TYPES = {"precio_unitario": db.Float, "total": db.Float, "blockchain_confirmado": db.Boolean,
+                     "fecha_creacion": db.DateTime}
+ORDER_TYPES = {"subtotal": db.Float, "impuestos": db.Float, "total": db.Float,
+               "fecha_pedido": db.DateTime, "fecha_entrega": db.DateTime}
+ORDER_ITEM_TYPES = {"precio_unitario": db.Float, "subtotal": db.Float}
+PAYMENT_TYPES = {"monto": db.Float, "fecha_pago": db.DateTime}
+
+PRODUCT_SELECT = """
+    SELECT p.id, p.codigo, p.nombre, p.descripcion, p.categoria_id, c.nombre AS categoria_nombre,
+           p.precio_unitario, p.precio_venta, p.unidad_medida, p.stock_minimo,
+           COALESCE(s.stock_total, 0) AS stock_total, p.imagen_url, p.disponible_venta, p.fecha_creacion{search_columns}
+    FROM productos p{search_join}
+    JOIN categorias c ON c.id = p.categoria_id
+    LEFT JOIN stock_totals s ON s.producto_id = p.id
+    WHERE p.activo = 1
+"""
+
+SEARCH_JOIN = """
+    JOIN (
+        SELECT rowid AS producto_id, bm25(productos_fts, 10.0, 5.0, 1.0) AS search_rank
+        FROM productos_fts WHERE productos_fts MATCH :match
+    ) f ON f.producto_id = p.id"""
+
+
+def _statement(sql, types=None, dates=()):
+    statement = db.text(sql)
+    if dates:
+        statement = statement.bindparams(*[db.bindparam(name, type_=db.DateTime) for name in dates])
+    return statement.columns(**types) if types else statement
+
+
+class SqlStorage:
+    def list_products(self, match, category_id, available_only, cursor, limit):
+        sql = PRODUCT_SELECT.format(search_columns=", f.search_rank" if match else "",
+                                    search_join=SEARCH_JOIN if match else "")
+        params = {"match": match} if match else {}
+        if category_id:
+            sql += " AND p.categoria_id = :categoria_id"
+            params["categoria_id"] = category_id
+        if available_only:
+            sql += " AND p.disponible_venta = 1"
+        sort_column = "f.search_rank" if match else "p.nombre"
+        if cursor is not None:
+            if len(cursor) != 2:
+                raise ValueError("Cursor inválido")
+            sql += f" AND ({sort_column}, p.id) > (:after_sort, :after_id)"
+            params.update(after_sort=cursor[0], after_id=cursor[1])
+        sql += f" ORDER BY {sort_column}, p.id"
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params["limit"] = limit + 1
+
+        rows = db.session.execute(_statement(sql, PRODUCT_TYPES), params).all()
+        if limit is None or len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, encode_cursor(last.search_rank if match else last.nombre, last.id)
+
+    def get_product(self, product_id):
+        sql = PRODUCT_SELECT.format(search_columns="", search_join="") + " AND p.id = :id"
+        return db.session.execute(_statement(sql, PRODUCT_TYPES), {"id": product_id}).first()
+
+    def create_product(self, data):
+        result = db.session.execute(_statement("""
+            INSERT INTO productos (codigo, nombre, descripcion, categoria_id, precio_unitario, precio_venta, unidad_medida,
+                                   stock_minimo, imagen_url, activo, disponible_venta, fecha_creacion)
+            VALUES (:codigo, :nombre, :descripcion, :categoria_id, :precio_unitario, :precio_venta, :unidad_medida,
+                    :stock_minimo, :imagen_url, 1, :disponible_venta, :ahora)
+        """, dates=("ahora",)), {
+            "codigo": data.get("codigo"),
+            "nombre": data.get("nombre"),
+            "descripcion": data.get("descripcion", ""),
+            "categoria_id": data.get("categoria_id"),
+            "precio_unitario": data.get("precio_unitario"),
+            "precio_venta": data.get("precio_venta", data.get("precio_unitario")),
+            "unidad_medida": data.get("unidad_medida", "pcs"),
+            "stock_minimo": data.get("stock_minimo", 0),
+            "imagen_url": data.get("imagen_url", ""),
+            "disponible_venta": bool(data.get("disponible_venta", True)),
+            "ahora": datetime.utcnow()
+        })
+        return result.lastrowid
+
+    def inventory_summary(self):
+        # Los totales en una sola consulta; cada subconsulta usa su índice
+        totals = db.session.execute(db.text("""
+            SELECT (SELECT COUNT(*) FROM productos WHERE activo = 1) AS total_productos,
+                   (SELECT COUNT(*) FROM ubicaciones WHERE activo = 1) AS total_ubicaciones,
+                   (SELECT COALESCE(SUM(p.precio_venta * s.stock_total), 0)
+                    FROM stock_totals s JOIN productos p ON p.id = s.producto_id
+                    WHERE p.activo = 1) AS valor_total,
+                   (SELECT COALESCE(SUM(c.valor_fifo), 0)
+                    FROM costos_inventario c JOIN productos p ON p.id = c.producto_id
+                    WHERE p.activo = 1) AS valor_costo_fifo,
+                   (SELECT COALESCE(SUM(MAX(c.cantidad, 0) * c.costo_promedio), 0)
+                    FROM costos_inventario c JOIN productos p ON p.id = c.producto_id
+                    WHERE p.activo = 1) AS valor_costo_promedio,
+                   (SELECT COUNT(*) FROM stock_totals WHERE bajo_stock = 1) AS productos_bajo_stock
+        """)).mappings().one()
+        alertas = db.session.execute(db.text("""
+            SELECT p.id, p.codigo, p.nombre, p.stock_minimo, s.stock_total
+            FROM stock_totals s JOIN productos p ON p.id = s.producto_id
+            WHERE s.bajo_stock = 1
+            ORDER BY s.stock_total - p.stock_minimo, p.id
+            LIMIT 10
+        """)).mappings().all()
+        top = db.session.execute(db.text("""
+            SELECT p.id, p.codigo, p.nombre, p.precio_venta, s.stock_total
+            FROM stock_totals s JOIN productos p ON p.id = s.producto_id
+            WHERE p.activo = 1
+            ORDER BY s.stock_total DESC
+            LIMIT 5
+        """)).mappings().all()
+        return {
+            "total_productos": totals["total_productos"],
+            "total_ubicaciones": totals["total_ubicaciones"],
+            "valor_total": float(totals["valor_total"]),
+            "valor_costo_fifo": float(totals["valor_costo_fifo"]),
+            "valor_costo_promedio": float(totals["valor_costo_promedio"]),
+            "productos_bajo_stock": totals["productos_bajo_stock"],
+            "alertas_stock": [dict(row) for row in alertas],
+            "top_productos": [dict(row, precio_venta=float(row["precio_venta"]) if row["precio_venta"] else None)
+                              for row in top]
+        }
+
+    def list_transactions(self, cursor, limit):
+        sql = """
+            SELECT t.id, t.producto_id, t.ubicacion_id, t.tipo_transaccion_id, t.cantidad, t.precio_unitario, t.total,
+                   t.referencia, t.observaciones, t.usuario_id, t.blockchain_tx_hash, t.blockchain_confirmado,
+                   t.fecha_creacion, p.codigo AS producto_codigo, p.nombre AS producto_nombre,
+                   u.nombre AS ubicacion_nombre, tt.nombre AS tipo_nombre, us.username AS usuario_nombre
+            FROM transacciones t
+            JOIN productos p ON p.id = t.producto_id
+            JOIN ubicaciones u ON u.id = t.ubicacion_id
+            JOIN tipos_transaccion tt ON tt.id = t.tipo_transaccion_id
+            JOIN usuarios us ON us.id = t.usuario_id
+        """
+        rows, has_more = self._keyset_desc(sql, [], "t.fecha_creacion", "t.id", {}, cursor, limit, TRANSACTION_TYPES)
+        return rows, encode_cursor(rows[-1].fecha_creacion, rows[-1].id) if has_more else None
+
+    def create_transaction(self, data, user_id):
+        params = {
+            "producto_id": data.get("producto_id"),
+            "ubicacion_id": data.get("ubicacion_id"),
+            "tipo_transaccion_id": data.get("tipo_transaccion_id"),
+            "cantidad": data.get("cantidad"),
+            "ahora": datetime.utcnow()
+        }
+        result = db.session.execute(_statement("""
+            INSERT INTO transacciones (producto_id, ubicacion_id, tipo_transaccion_id, cantidad, precio_unitario, total,
+                                       referencia, observaciones, usuario_id, blockchain_confirmado, fecha_creacion)
+            VALUES (:producto_id, :ubicacion_id, :tipo_transaccion_id, :cantidad, :precio_unitario, :total,
+                    :referencia, :observaciones, :usuario_id, 0, :ahora)
+        """, dates=("ahora",)), dict(
+            params,
+            precio_unitario=data.get("precio_unitario"),
+            total=data.get("total", data.get("precio_unitario", 0) * data.get("cantidad", 0)),
+            referencia=data.get("referencia", ""),
+            observaciones=data.get("observaciones", ""),
+            usuario_id=user_id
+        ))
+
+        # Cambio para las capas de costo, leído antes del upsert: en una fila nueva no baja de cero
+        change = db.session.execute(db.text("""
+            SELECT CASE WHEN tt.tipo = 'entrada' THEN :cantidad
+                        WHEN i.id IS NOT NULL THEN -:cantidad ELSE 0 END
+            FROM tipos_transaccion tt
+            LEFT JOIN inventario i ON i.producto_id = :producto_id AND i.ubicacion_id = :ubicacion_id
+            WHERE tt.id = :tipo_transaccion_id
+        """), params).scalar()
+
+        # Un solo upsert: una fila nueva no arranca en negativo, una existente suma el cambio.
+        # Sin tipo de transacción válido el SELECT no devuelve filas y el inventario no cambia
+        db.session.execute(_statement("""
+            INSERT INTO inventario (producto_id, ubicacion_id, cantidad, fecha_actualizacion)
+            SELECT :producto_id, :ubicacion_id,
+                   MAX(0, CASE tipo WHEN 'entrada' THEN :cantidad ELSE -:cantidad END), :ahora
+            FROM tipos_transaccion WHERE id = :tipo_transaccion_id
+            ON CONFLICT (producto_id, ubicacion_id) DO UPDATE SET
+                cantidad = cantidad + (SELECT CASE tipo WHEN 'entrada' THEN :cantidad ELSE -:cantidad END
+                                       FROM tipos_transaccion WHERE id = :tipo_transaccion_id),
+                fecha_actualizacion = excluded.fecha_actualizacion
+        """, dates=("ahora",)), params)
+
+        if change:
+            record_movements(db.session.connection(), [(params["producto_id"], params["ubicacion_id"], change,
+                                                        data.get("precio_unitario"), "transaccion", result.lastrowid)])
+
+        extend_chain(db.session.connection())
+        return result.lastrowid
+
+    def list_orders(self, cliente_id, cursor, limit):
+        sql = f"SELECT {', '.join(ORDER_FIELDS)} FROM pedidos"
+        rows, has_more = self._keyset_desc(sql, ["cliente_id = :cliente_id"], "fecha_pedido", "id", {"cliente_id": cliente_id},
+                                           cursor, limit, ORDER_TYPES)
+        return rows, encode_cursor(rows[-1].fecha_pedido, rows[-1].id) if has_more else None
+
+    ORDER_LIST_SELECT = f"""
+        SELECT {', '.join('p.' + field for field in ORDER_FIELDS)}, u.nombre AS cliente_nombre
+        FROM pedidos p
+        JOIN usuarios u ON u.id = p.cliente_id
+    """
+
+    def list_all_orders(self, estado, cliente_id, date_range, cursor, limit):
+        # Cada filtro tiene su índice: (estado, fecha_pedido, id), (cliente_id, fecha_pedido, id)
+        # o (fecha_pedido, id) para el rango de fechas solo
+        conditions, params, dates = [], {}, []
+        if estado:
+            conditions.append("p.estado = :estado")
+            params["estado"] = estado
+        if cliente_id:
+            conditions.append("p.cliente_id = :cliente_id")
+            params["cliente_id"] = cliente_id
+        for i, (op, value) in enumerate(date_range):
+            conditions.append(f"p.fecha_pedido {op} :fecha_{i}")
+            params[f"fecha_{i}"] = datetime.fromisoformat(value)
+            dates.append(f"fecha_{i}")
+        rows, has_more = self._keyset_desc(self.ORDER_LIST_SELECT, conditions, "p.fecha_pedido", "p.id", params,
+                                           cursor, limit, ORDER_TYPES, dates)
+        return rows, encode_cursor(rows[-1].fecha_pedido, rows[-1].id) if has_more else None
+
+    def get_order(self, order_id):
+        return db.session.execute(_statement(self.ORDER_LIST_SELECT + " WHERE p.id = :id", ORDER_TYPES),
+                                  {"id": order_id}).first()
+
+    def order_items(self, order_ids):
+        return db.session.execute(_statement("""
+            SELECT d.pedido_id, d.id, d.producto_id, pr.codigo, pr.nombre, d.cantidad, d.precio_unitario, d.subtotal
+            FROM detalle_pedidos d
+            JOIN productos pr ON pr.id = d.producto_id
+            WHERE d.pedido_id IN :ids
+            ORDER BY d.pedido_id, d.id
+        """, ORDER_ITEM_TYPES).bindparams(db.bindparam("ids", expanding=True)), {"ids": list(order_ids)}).all()
+
+    def order_payments(self, order_ids):
+        return db.session.execute(_statement(f"""
+            SELECT {', '.join(PAYMENT_FIELDS)} FROM pagos
+            WHERE pedido_id IN :ids
+            ORDER BY pedido_id, id
+        """, PAYMENT_TYPES).bindparams(db.bindparam("ids", expanding=True)), {"ids": list(order_ids)}).all()
+
+    def create_payment(self, data, qr_code):
+        result = db.session.execute(_statement("""
+            INSERT INTO pagos (pedido_id, metodo_pago, monto, estado, referencia_pago, qr_code, fecha_pago)
+            VALUES (:pedido_id, :metodo_pago, :monto, 'pendiente', :referencia_pago, :qr_code, :ahora)
+        """, dates=("ahora",)), {
+            "pedido_id": data.get("pedido_id"),
+            "metodo_pago": data.get("metodo_pago"),
+            "monto": data.get("monto"),
+            "referencia_pago": data.get("referencia_pago", ""),
+            "qr_code": qr_code,
+            "ahora": datetime.utcnow()
+        })
+        return result.lastrowid
+
+    def _keyset_desc(self, sql, conditions, date_column, id_column, params, cursor, limit, types, dates=()):
+        # Página descendente por (fecha, id) continuando después del cursor, igual que keyset_page
+        conditions, params, dates = list(conditions), dict(params), list(dates)
+        if cursor is not None:
+            if len(cursor) != 2:
+                raise ValueError("Cursor inválido")
+            conditions.append(f"({date_column}, {id_column}) < (:after_date, :after_id)")
+            params.update(after_date=datetime.fromisoformat(cursor[0]) if cursor[0] is not None else None,
+                          after_id=cursor[1])
+            dates.append("after_date")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {date_column} DESC, {id_column} DESC"
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params["limit"] = limit + 1
+        rows = db.session.execute(_statement(sql, types, dates), params).all()
+        if limit is None:
+            return rows, False
+        return rows[:limit], len(rows) > limit
+
+
+class Storage:
+    # Reparte cada operación al motor configurado para ella
+    def __init__(self):
+        self.engines = {"orm": OrmStorage(), "sql": SqlStorage()}
+        self.default = "orm"
+        self.overrides = {}
+
+    def init_app(self, app):
+        default = app.config.get("STORAGE_ENGINE", self.default)
+        overrides = dict(app.config.get("STORAGE_OVERRIDES", {}))
+        for operation, engine in [("STORAGE_ENGINE", default), *overrides.items()]:
+            if engine not in self.engines:
+                raise ValueError(f"Motor de almacenamiento desconocido para {operation}: {engine}")
+            if operation != "STORAGE_ENGINE" and operation not in OPERATIONS:
+                raise ValueError(f"Operación de almacenamiento desconocida: {operation}")
+        self.default, self.overrides = default, overrides
+
+    def engine_for(self, operation):
+        return self.engines[self.overrides.get(operation, self.default)]
+
+    def __getattr__(self, name):
+        if name in OPERATIONS:
+            return getattr(self.engine_for(name), name)
+        raise AttributeError(name)
+
+
+storage = Storage()
+
+
+def benchmark_workloads():
+    # Carga idéntica para los dos motores, con ids tomados de los datos existentes
+    product_id = db.session.query(db.func.min(Producto.id)).filter(Producto.activo == True).scalar()
+    location_id = db.session.query(db.func.min(Ubicacion.id)).scalar()
+    tipo_id = db.session.query(db.func.min(TipoTransaccion.id)).scalar()
+    user_id = db.session.query(db.func.min(Usuario.id)).scalar()
+    cliente_id = db.session.query(Pedido.cliente_id).group_by(Pedido.cliente_id)\
+        .order_by(db.func.count().desc()).limit(1).scalar() or user_id
+    pedido_id = db.session.query(db.func.min(Pedido.id)).scalar()
+    categoria_id = db.session.query(db.func.min(Categoria.id)).scalar()
+    if None in (product_id, location_id, tipo_id, user_id, categoria_id):
+        raise ValueError("La base de datos no tiene productos, ubicaciones, tipos de transacción, usuarios o categorías")
+
+    workloads = {
+        "list_products": lambda s: s.list_products(None, None, False, None, 100),
+        "list_products (búsqueda)": lambda s: s.list_products('"a"*', None, False, None, 100),
+        "get_product": lambda s: s.get_product(product_id),
+        "create_product": lambda s: s.create_product({"codigo": "__benchmark__", "nombre": "Benchmark",
+                                                      "categoria_id": categoria_id, "precio_unitario": 1}),
+        "inventory_summary": lambda s: s.inventory_summary(),
+        "list_transactions": lambda s: s.list_transactions(None, 50),
+        "create_transaction": lambda s: s.create_transaction({"producto_id": product_id, "ubicacion_id": location_id,
+                                                              "tipo_transaccion_id": tipo_id, "cantidad": 1,
+                                                              "precio_unitario": 1}, user_id),
+        "list_orders": lambda s: s.list_orders(cliente_id, None, 50),
+        "list_all_orders": lambda s: s.list_all_orders("pendiente", None, [], None, 50),
+    }
+    if pedido_id is not None:
+        order_ids = [row.id for row in db.session.query(Pedido.id).order_by(Pedido.id.desc()).limit(50)]
+        workloads["get_order"] = lambda s: s.get_order(pedido_id)
+        workloads["order_items"] = lambda s: s.order_items(order_ids)
+        workloads["order_payments"] = lambda s: s.order_payments(order_ids)
+        workloads["create_payment"] = lambda s: s.create_payment({"pedido_id": pedido_id, "metodo_pago": "efectivo",
+                                                                  "monto": 1}, None)
+    return workloads
+
+
+def benchmark(repeat=20):
+    # Mejor tiempo (ms) de cada operación con cada motor; las escrituras se deshacen con rollback
+    results = {}
+    for name, workload in benchmark_workloads().items():
+        results[name] = {}
+        for engine_name, engine in storage.engines.items():
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                workload(engine)
+                best = min(best, time.perf_counter() - start)
+                db.session.rollback()
+            results[name][engine_name] = best * 1000
+    return results
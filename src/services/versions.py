@@ -0,0 +1,74 @@
+import functools
+import hashlib
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+from flask import Response, current_app, request
+from src.models.models import db
+
+# Versiones por tabla para GET condicionales (ETag / Last-Modified). Los triggers
+# las incrementan en cada escritura; una ruta condicional solo lee las versiones de
+# sus tablas y responde 304 sin ejecutar la consulta si el cliente ya las tiene.
+# La migración 7 limita el trigger de UPDATE de productos a las columnas servidas
+# (el anclaje escribe blockchain_hash) y versiona costos_inventario (creada en la 6).
+VERSIONED_TABLES = ("productos", "inventario", "categorias", "ubicaciones")
+
+
+def ensure_table_versions(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS versiones_tablas (
+            tabla VARCHAR(50) PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for table in VERSIONED_TABLES:
+        connection.exec_driver_sql("INSERT OR IGNORE INTO versiones_tablas (tabla) VALUES (?)", (table,))
+        for event, suffix in (("INSERT", "ai"), ("UPDATE", "au"), ("DELETE", "ad")):
+            connection.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS versiones_{table}_{suffix} AFTER {event} ON {table} BEGIN
+                    UPDATE versiones_tablas SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+                    WHERE tabla = '{table}';
+                END
+            """)
+
+
+def table_versions(tables):
+    rows = db.session.execute(
+        db.text("SELECT tabla, version, actualizado FROM versiones_tablas WHERE tabla IN :tables")
+        .bindparams(db.bindparam("tables", expanding=True)),
+        {"tables": list(tables)}
+    ).all()
+    return {tabla: (version, actualizado) for tabla, version, actualizado in rows}
+
+
+def conditional(*tables):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = table_versions(tables)
+            key = "|".join(f"{table}:{versions[table][0]}" for table in tables)
+            query = urlencode(sorted(request.args.items(multi=True)))
+            etag = hashlib.sha1(f"{request.path}?{query}|{key}".encode("utf-8")).hexdigest()
+            last_modified = max(datetime.strptime(updated, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+                                for _, updated in versions.values())
+
+            # Con If-None-Match decide solo el ETag. If-Modified-Since tiene resolución de
+            # segundos: una escritura en el mismo segundo que la fecha del cliente no se
+            # distingue, así que ese segundo cuenta como modificado
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = request.if_modified_since is not None and last_modified < request.if_modified_since
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
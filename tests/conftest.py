@@ -0,0 +1,139 @@
+# Los dos árboles abren su base en una ruta fija al importarse (backend/database/app.db
+# relativa al directorio de trabajo, src/database/app.db junto al paquete). Las pruebas
+# copian el árbol a un directorio temporal e importan la copia: nunca tocan las bases
+# reales. Cada árbol se importa una vez por sesión; las pruebas crean sus propios datos.
+# shared/ se copia junto a cada árbol, como en el repositorio.
+import importlib
+import os
+import shutil
+import sqlite3
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+ROOT = Path(__file__).resolve().parent.parent
+IGNORE = shutil.ignore_patterns("__pycache__", "*.db", "*.db-wal", "*.db-shm")
+
+
+@pytest.fixture(scope="session")
+def backend_app(tmp_path_factory):
+    root = tmp_path_factory.mktemp("backend") / "backend"
+    shutil.copytree(ROOT / "backend", root, ignore=IGNORE)
+    shutil.copytree(ROOT / "shared", root.parent / "shared", ignore=IGNORE)
+    (root / "database").mkdir(exist_ok=True)
+    os.chdir(root)
+    sys.path.insert(0, str(root))
+    module = importlib.import_module("app")
+    assert Path(module.__file__).parent == root
+    module.insert_initial_data()
+    # El anclaje y las fotos arrancan con la primera petición; en las pruebas se usan los
+    # comandos de la CLI, así que los hilos terminan apenas arrancan
+    module.anchorer.stop()
+    module.inventory_snapshots.stop()
+    return SimpleNamespace(module=module, app=module.app, database=str(root / module.DATABASE_PATH),
+                           staff=("admin", "admin123"), customer=("cliente", "cliente123"))
+
+
+@pytest.fixture(scope="session")
+def src_app(tmp_path_factory):
+    root = tmp_path_factory.mktemp("src")
+    shutil.copytree(ROOT / "src", root / "src", ignore=IGNORE)
+    shutil.copytree(ROOT / "shared", root / "shared", ignore=IGNORE)
+    sys.path.insert(0, str(root))
+    module = importlib.import_module("src.main")
+    assert Path(module.__file__).parent == root / "src"
+    module.inventory_snapshots.stop()
+    database = str(root / "src" / "database" / "app.db")
+
+    # src no trae datos iniciales: usuarios, ubicaciones y tipos de transacción mínimos
+    password_hash = generate_password_hash("x", method="pbkdf2:sha256:1000")
+    connection = sqlite3.connect(database)
+    connection.execute("""
+        INSERT INTO usuarios (username, email, password_hash, rol, nombre, activo, fecha_creacion)
+        VALUES ('admin', 'admin@x', ?, 'administrador', 'Admin', 1, CURRENT_TIMESTAMP),
+               ('cliente', 'cliente@x', ?, 'cliente', 'Cliente', 1, CURRENT_TIMESTAMP)
+    """, (password_hash, password_hash))
+    connection.execute("INSERT INTO categorias (nombre, activo, fecha_creacion) VALUES ('General', 1, CURRENT_TIMESTAMP)")
+    connection.execute("""
+        INSERT INTO ubicaciones (nombre, activo, fecha_creacion)
+        VALUES ('Almacén Principal', 1, CURRENT_TIMESTAMP), ('Sucursal', 1, CURRENT_TIMESTAMP)
+    """)
+    connection.execute("INSERT INTO tipos_transaccion (nombre, tipo, activo) VALUES ('Compra', 'entrada', 1), ('Venta', 'salida', 1)")
+    connection.commit()
+    connection.close()
+    return SimpleNamespace(module=module, app=module.app, database=database,
+                           staff=("admin", "x"), customer=("cliente", "x"))
+
+
+@pytest.fixture(params=["backend", "src"])
+def tree(request):
+    # Las pruebas que valen para los dos árboles corren una vez por cada uno
+    return request.getfixturevalue(f"{request.param}_app")
+
+
+def login(client, credentials):
+    username, password = credentials
+    response = client.post("/api/auth/login", json={"username": username, "password": password})
+    assert response.status_code == 200, response.get_json()
+    return {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+
+def create_product(database, stock):
+    # Producto nuevo con `stock` = {ubicacion_id: cantidad}; devuelve su id
+    connection = sqlite3.connect(database)
+    cursor = connection.execute("""
+        INSERT INTO productos (codigo, nombre, categoria_id, precio_unitario, precio_venta, activo, disponible_venta)
+        VALUES ('TMP-' || lower(hex(randomblob(6))), 'Producto de prueba', 1, 10, 15, 1, 1)
+    """)
+    producto_id = cursor.lastrowid
+    connection.executemany("INSERT INTO inventario (producto_id, ubicacion_id, cantidad) VALUES (?, ?, ?)",
+                           [(producto_id, ubicacion_id, cantidad) for ubicacion_id, cantidad in stock.items()])
+    connection.commit()
+    connection.close()
+    return producto_id
+
+
+def transaction_types(database):
+    # (id de un tipo de entrada, id de un tipo de salida)
+    connection = sqlite3.connect(database)
+    tipos = {tipo: id for id, tipo in connection.execute("SELECT id, tipo FROM tipos_transaccion ORDER BY id DESC")}
+    connection.close()
+    return tipos["entrada"], tipos["salida"]
+
+
+def post_transactions(tree, count):
+    # `count` entradas de una unidad de un producto nuevo; devuelve sus ids
+    entrada, _ = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {1: 5})
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+    ids = []
+    for _ in range(count):
+        response = client.post("/api/transactions", json={"producto_id": producto_id, "ubicacion_id": 1,
+                                                          "tipo_transaccion_id": entrada, "cantidad": 1},
+                               headers=headers)
+        assert response.status_code == 201, response.get_json()
+        ids.append(response.get_json()["transaction_id"])
+    return ids
+
+
+@contextmanager
+def tampered(database, transaction_id):
+    # Saltear el trigger de solo anexado como haría alguien con acceso al archivo; al
+    # salir se restaura la fila y el trigger para no afectar a las demás pruebas
+    connection = sqlite3.connect(database)
+    trigger = connection.execute("SELECT sql FROM sqlite_master WHERE name = 'transacciones_solo_anexar_au'").fetchone()[0]
+    connection.execute("DROP TRIGGER transacciones_solo_anexar_au")
+    connection.execute("UPDATE transacciones SET cantidad = cantidad + 100 WHERE id = ?", (transaction_id,))
+    connection.commit()
+    try:
+        yield
+    finally:
+        connection.execute("UPDATE transacciones SET cantidad = cantidad - 100 WHERE id = ?", (transaction_id,))
+        connection.execute(trigger)
+        connection.commit()
+        connection.close()
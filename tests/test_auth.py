@@ -0,0 +1,108 @@
+# El rol viaja en el JWT y @require_role confía en él sin consultar usuarios
+import importlib
+import sqlite3
+import time
+import uuid
+
+import pytest
+
+from conftest import login
+
+
+def test_registration_cannot_choose_a_staff_role(tree):
+    client = tree.app.test_client()
+    username = f"u{uuid.uuid4().hex[:10]}"
+    user = {"username": username, "email": f"{username}@x", "password": "secreto"}
+
+    response = client.post("/api/auth/register", json={**user, "rol": "administrador"})
+    assert response.status_code == 403
+    assert client.post("/api/auth/login", json={"username": username, "password": "secreto"}).status_code == 401
+
+    response = client.post("/api/auth/register", json=user)
+    assert response.status_code == 201, response.get_json()
+    headers = login(client, (username, "secreto"))
+    assert client.get("/api/inventory/valuation", headers=headers).status_code == 403
+
+
+@pytest.mark.parametrize("endpoint", ["/api/system/jobs", "/api/system/cache", "/api/system/passwords"])
+def test_system_stats_require_an_administrator(tree, endpoint):
+    client = tree.app.test_client()
+    assert client.get(endpoint).status_code == 401
+    assert client.get(endpoint, headers=login(client, tree.customer)).status_code == 403
+    assert client.get(endpoint, headers=login(client, tree.staff)).status_code == 200
+
+
+def test_pool_stats_require_an_administrator(backend_app):
+    client = backend_app.app.test_client()
+    assert client.get("/api/system/db-pool").status_code == 401
+    assert client.get("/api/system/db-pool", headers=login(client, backend_app.customer)).status_code == 403
+    assert client.get("/api/system/db-pool", headers=login(client, backend_app.staff)).status_code == 200
+
+
+def register(tree, client):
+    # Cliente nuevo; devuelve (credenciales, id)
+    username = f"u{uuid.uuid4().hex[:10]}"
+    response = client.post("/api/auth/register", json={"username": username, "email": f"{username}@x",
+                                                       "password": "secreto"})
+    assert response.status_code == 201, response.get_json()
+    connection = sqlite3.connect(tree.database)
+    user_id = connection.execute("SELECT id FROM usuarios WHERE username = ?", (username,)).fetchone()[0]
+    connection.close()
+    return (username, "secreto"), user_id
+
+
+def test_access_change_revokes_earlier_tokens(tree):
+    client = tree.app.test_client()
+    admin = login(client, tree.staff)
+    credentials, user_id = register(tree, client)
+    customer_token = login(client, credentials)
+    assert client.get("/api/inventory/valuation", headers=customer_token).status_code == 403
+
+    response = client.put(f"/api/auth/users/{user_id}/access", json={"rol": "empleado"}, headers=admin)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["user"] == {"id": user_id, "rol": "empleado", "activo": True}
+
+    # El token viejo lleva el rol anterior: se rechaza en vez de seguir valiendo como cliente
+    assert client.get("/api/inventory/valuation", headers=customer_token).status_code == 401
+    staff_token = login(client, credentials)
+    assert client.get("/api/inventory/valuation", headers=staff_token).status_code == 200
+
+    assert client.put(f"/api/auth/users/{user_id}/access", json={"activo": False}, headers=admin).status_code == 200
+    assert client.get("/api/inventory/valuation", headers=staff_token).status_code == 401
+    response = client.post("/api/auth/login", json={"username": credentials[0], "password": credentials[1]})
+    assert response.status_code == 401
+
+    # Los tokens de otros usuarios siguen valiendo
+    assert client.get("/api/system/cache", headers=admin).status_code == 200
+
+
+def test_access_change_validation(tree):
+    client = tree.app.test_client()
+    admin = login(client, tree.staff)
+    _, user_id = register(tree, client)
+    url = f"/api/auth/users/{user_id}/access"
+    assert client.put(url, json={}, headers=admin).status_code == 400
+    assert client.put(url, json={"rol": "superusuario"}, headers=admin).status_code == 400
+    assert client.put("/api/auth/users/999999/access", json={"rol": "empleado"}, headers=admin).status_code == 404
+    assert client.put(url, json={"rol": "empleado"}, headers=login(client, tree.customer)).status_code == 403
+
+
+def test_change_from_another_process_is_seen_after_reload(tree, monkeypatch):
+    # Otro proceso cambió el acceso: este lo ve al releer cambios_acceso, pasado el ttl
+    auth = tree.module if hasattr(tree.module, "revoked_users") else importlib.import_module("src.services.auth")
+    client = tree.app.test_client()
+    credentials, user_id = register(tree, client)
+    headers = login(client, credentials)
+    assert client.get("/api/inventory/valuation", headers=headers).status_code == 403
+
+    connection = sqlite3.connect(tree.database)
+    connection.execute("UPDATE usuarios SET activo = 0 WHERE id = ?", (user_id,))
+    connection.execute("""
+        INSERT INTO cambios_acceso (usuario_id, version) VALUES (?, ?)
+        ON CONFLICT (usuario_id) DO UPDATE SET version = excluded.version
+    """, (user_id, time.time()))
+    connection.commit()
+    connection.close()
+
+    monkeypatch.setattr(auth.revoked_users, "ttl", 0)
+    assert client.get("/api/inventory/valuation", headers=headers).status_code == 401
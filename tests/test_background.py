@@ -0,0 +1,72 @@
+# Los hilos de fondo de backend (cola de trabajos, anclaje, fotos de inventario) toman
+# una conexión del pool en cada vuelta. Si el pool está ocupado más allá de su plazo
+# deben registrar el fallo y seguir: un hilo muerto no se vuelve a arrancar.
+import os
+import sys
+import time
+
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def busy_pool(backend_app):
+    db = sys.modules["db"]
+    pool = db.ConnectionPool(backend_app.database, max_size=1, timeout=0.05)
+    held = pool.acquire()
+    yield pool
+    pool.release(held)
+    pool.close_all()
+
+
+def test_job_worker_survives_pool_timeout(backend_app, busy_pool):
+    jobs = sys.modules["jobs"]
+    workers = jobs.JobWorkers(busy_pool, {}, workers=1, poll_interval=0.01).start()
+    try:
+        time.sleep(0.3)
+        assert all(thread.is_alive() for thread in workers._threads)
+        assert busy_pool.stats()["waits"] > 1
+    finally:
+        workers.stop(timeout=1)
+
+
+PERIODIC = [("anchoring", "Anchorer"), ("snapshots", "InventorySnapshots")]
+
+
+@pytest.mark.parametrize("module, cls", PERIODIC)
+def test_periodic_thread_survives_pool_timeout(backend_app, busy_pool, module, cls):
+    periodic = getattr(sys.modules[module], cls)(busy_pool, interval=0.01).start()
+    try:
+        time.sleep(0.3)
+        assert periodic._thread.is_alive()
+        assert busy_pool.stats()["waits"] > 1
+    finally:
+        periodic.stop(timeout=1)
+
+
+@pytest.mark.parametrize("module, cls", PERIODIC)
+def test_periodic_thread_starts_once_with_first_request(backend_app, module, cls):
+    # Sin el bloque __main__ ni el lifespan ASGI: cualquier servidor WSGI lo arranca
+    app = Flask("wsgi")
+    periodic = getattr(sys.modules[module], cls)(sys.modules["app"].pool, interval=60)
+    periodic.init_app(app)
+    assert periodic._thread is None
+    try:
+        app.test_client().get("/")
+        thread = periodic._thread
+        assert thread.is_alive()
+        app.test_client().get("/")
+        assert periodic.start()._thread is thread
+    finally:
+        periodic.stop(timeout=1)
+    assert not thread.is_alive()
+
+
+def test_src_snapshots_start_with_first_request(src_app):
+    # conftest detiene el hilo antes de que arranque: basta ver que la primera petición lo
+    # arrancó en este proceso y que start() no arranca otro
+    periodic = src_app.module.inventory_snapshots
+    src_app.app.test_client().get("/api/inventory/locations")
+    assert periodic._pid == os.getpid()
+    thread = periodic._thread
+    assert periodic.start()._thread is thread
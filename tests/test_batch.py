@@ -0,0 +1,65 @@
+# Un lote de /api/transactions/batch deja el inventario y las capas de costo igual que
+# las mismas filas enviadas una por una a /api/transactions: solo la fila que crea el
+# inventario de un producto x ubicación se recorta a cero, sin movimientos de ajuste.
+import sqlite3
+
+from conftest import create_product, login, transaction_types
+
+
+def rows_for(producto_id, entrada, salida):
+    # La ubicación 1 arranca con stock; la 2 no tiene fila de inventario y su primer movimiento es una salida
+    return [
+        {"producto_id": producto_id, "ubicacion_id": 1, "tipo_transaccion_id": salida, "cantidad": 2},
+        {"producto_id": producto_id, "ubicacion_id": 2, "tipo_transaccion_id": salida, "cantidad": 3},
+        {"producto_id": producto_id, "ubicacion_id": 1, "tipo_transaccion_id": entrada, "cantidad": 3, "precio_unitario": 20},
+        {"producto_id": producto_id, "ubicacion_id": 2, "tipo_transaccion_id": entrada, "cantidad": 4, "precio_unitario": 12},
+        {"producto_id": producto_id, "ubicacion_id": 2, "tipo_transaccion_id": salida, "cantidad": 1},
+    ]
+
+
+def product_state(database, producto_id):
+    connection = sqlite3.connect(database)
+    state = {
+        "inventario": connection.execute("SELECT ubicacion_id, cantidad FROM inventario WHERE producto_id = ? "
+                                         "ORDER BY ubicacion_id", (producto_id,)).fetchall(),
+        "movimientos": connection.execute("SELECT ubicacion_id, cantidad, costo_unitario, origen FROM movimientos_costo "
+                                          "WHERE producto_id = ? ORDER BY id", (producto_id,)).fetchall(),
+        "costos": connection.execute("SELECT ubicacion_id, cantidad, valor_fifo, costo_promedio FROM costos_inventario "
+                                     "WHERE producto_id = ? ORDER BY ubicacion_id", (producto_id,)).fetchall(),
+    }
+    connection.close()
+    return state
+
+
+def test_batch_matches_single_transactions(tree):
+    entrada, salida = transaction_types(tree.database)
+    single_id = create_product(tree.database, {1: 5})
+    batch_id = create_product(tree.database, {1: 5})
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+
+    for row in rows_for(single_id, entrada, salida):
+        response = client.post("/api/transactions", json=row, headers=headers)
+        assert response.status_code == 201, response.get_json()
+    response = client.post("/api/transactions/batch", json=rows_for(batch_id, entrada, salida), headers=headers)
+    assert response.status_code == 201, response.get_json()
+    assert all("transaction_id" in result for result in response.get_json()["results"])
+
+    single, batch = product_state(tree.database, single_id), product_state(tree.database, batch_id)
+    assert single["inventario"] == [(1, 6), (2, 3)]
+    assert batch == single
+    assert all(origen == "transaccion" for *_, origen in batch["movimientos"])
+
+
+def test_invalid_optional_fields_are_row_errors(tree):
+    entrada, _ = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {1: 5})
+    client = tree.app.test_client()
+    row = {"producto_id": producto_id, "ubicacion_id": 1, "tipo_transaccion_id": entrada, "cantidad": 1}
+    rows = [row, {**row, "referencia": {"a": 1}}, {**row, "observaciones": [1]}, {**row, "total": "abc"},
+            {**row, "total": True}, {**row, "referencia": None, "total": 12.5}]
+    response = client.post("/api/transactions/batch", json=rows, headers=login(client, tree.staff))
+    assert response.status_code == 201, response.get_json()
+    results = response.get_json()["results"]
+    assert ["transaction_id" in result for result in results] == [True, False, False, False, False, True]
+    assert product_state(tree.database, producto_id)["inventario"] == [(1, 7)]
@@ -0,0 +1,94 @@
+# Caché de respuestas del catálogo: una lectura repetida sale de la caché y las rutas que
+# escriben invalidan sus etiquetas después del commit, así que la lectura siguiente ya ve
+# el cambio.
+import importlib
+
+import pytest
+
+from conftest import create_product, login, transaction_types
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, backend_app, tmp_path):
+    cache = importlib.import_module("shared.cache")
+    if request.param == "memory":
+        return cache.MemoryBackend(max_entries=4)
+    return cache.SQLiteBackend(str(tmp_path / "cache.db"), max_entries=4)
+
+
+def test_backend_invalidates_by_tag(backend):
+    backend.set("/a", {"body": "a"}, ("products", "inventory"), 60)
+    backend.set("/b", {"body": "b"}, ("categories",), 60)
+    assert backend.get("/a") == {"body": "a"}
+
+    assert backend.invalidate(("inventory",)) == 1
+    assert backend.get("/a") is None
+    assert backend.get("/b") == {"body": "b"}
+    assert backend.invalidate(("inventory",)) == 0
+
+
+def test_backend_expires_and_evicts(backend):
+    backend.set("/expired", {"body": "x"}, ("products",), -1)
+    assert backend.get("/expired") is None
+    for index in range(6):
+        backend.set(f"/{index}", {"body": index}, ("products",), 60)
+    stats = backend.stats()
+    assert stats["size"] == 4 and stats["evictions"] == 2
+
+
+def test_transaction_invalidates_product(tree):
+    entrada, _ = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {1: 5})
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+
+    first = client.get(f"/api/products/{producto_id}")
+    second = client.get(f"/api/products/{producto_id}")
+    assert first.headers["X-Cache"] == "MISS" and second.headers["X-Cache"] == "HIT"
+    assert second.get_json() == first.get_json()
+
+    response = client.post("/api/transactions", json={"producto_id": producto_id, "ubicacion_id": 1,
+                                                       "tipo_transaccion_id": entrada, "cantidad": 3},
+                           headers=headers)
+    assert response.status_code == 201
+
+    after = client.get(f"/api/products/{producto_id}")
+    assert after.headers["X-Cache"] == "MISS"
+    assert after.get_json()["product"]["stock_total"] == 8
+
+
+def test_batch_invalidates_only_when_rows_are_created(tree):
+    entrada, _ = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {1: 5})
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+    client.get(f"/api/products/{producto_id}")
+
+    rejected = client.post("/api/transactions/batch", json={"transactions": [
+        {"producto_id": producto_id, "ubicacion_id": 1, "tipo_transaccion_id": entrada, "cantidad": -1}]},
+        headers=headers)
+    assert rejected.get_json()["created"] == 0
+    assert client.get(f"/api/products/{producto_id}").headers["X-Cache"] == "HIT"
+
+    created = client.post("/api/transactions/batch", json={"transactions": [
+        {"producto_id": producto_id, "ubicacion_id": 1, "tipo_transaccion_id": entrada, "cantidad": 2}]},
+        headers=headers)
+    assert created.get_json()["created"] == 1
+    after = client.get(f"/api/products/{producto_id}")
+    assert after.headers["X-Cache"] == "MISS"
+    assert after.get_json()["product"]["stock_total"] == 7
+
+
+def test_new_product_invalidates_listing(tree):
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+    client.get("/api/products?search=Cacheable")
+    assert client.get("/api/products?search=Cacheable").headers["X-Cache"] == "HIT"
+
+    response = client.post("/api/products", json={"codigo": "CACHE-1", "nombre": "Cacheable", "categoria_id": 1,
+                                                  "precio_unitario": 4}, headers=headers)
+    assert response.status_code == 201
+
+    listing = client.get("/api/products?search=Cacheable")
+    assert listing.headers["X-Cache"] == "MISS"
+    assert [product["codigo"] for product in listing.get_json()["products"]] == ["CACHE-1"]
@@ -0,0 +1,87 @@
+# GET condicionales: el ETag de una ruta sale de las versiones de sus tablas, así que un
+# If-None-Match vigente responde 304 sin cuerpo y cualquier escritura en esas tablas lo
+# invalida.
+from datetime import timedelta
+
+from werkzeug.http import http_date
+
+from conftest import create_product, login, post_transactions, transaction_types
+
+
+def test_unchanged_etag_is_not_modified(tree):
+    producto_id = create_product(tree.database, {1: 5})
+    client = tree.app.test_client()
+    url = f"/api/products/{producto_id}"
+
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.data == b""
+    assert cached.headers["ETag"] == etag
+
+    assert client.get(url, headers={"If-None-Match": '"otro"'}).status_code == 200
+    assert client.get(url, headers={"If-None-Match": f'"otro", {etag}'}).status_code == 304
+    assert client.get(f"{url}?format=columns", headers={"If-None-Match": etag}).status_code == 200
+
+
+
+def test_if_modified_since_is_strict(tree):
+    entrada, _ = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {1: 5})
+    client = tree.app.test_client()
+    url = f"/api/products/{producto_id}"
+    first = client.get(url)
+    last_modified = first.last_modified
+
+    # El mismo segundo puede tener escrituras posteriores a la respuesta: no es un 304
+    assert client.get(url, headers={"If-Modified-Since": http_date(last_modified)}).status_code == 200
+    later = http_date(last_modified + timedelta(seconds=1))
+    assert client.get(url, headers={"If-Modified-Since": later}).status_code == 304
+
+    response = client.post("/api/transactions", json={"producto_id": producto_id, "ubicacion_id": 1,
+                                                       "tipo_transaccion_id": entrada, "cantidad": 1},
+                           headers=login(client, tree.staff))
+    assert response.status_code == 201
+    fresh = client.get(url, headers={"If-Modified-Since": http_date(last_modified)})
+    assert fresh.status_code == 200 and fresh.get_json()["product"]["stock_total"] == 6
+
+    # Con If-None-Match decide el ETag aunque la fecha diga que no cambió
+    headers = {"If-None-Match": first.headers["ETag"], "If-Modified-Since": later}
+    assert client.get(url, headers=headers).status_code == 200
+
+
+def test_write_changes_etag(tree):
+    entrada, _ = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {1: 5})
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+    url = f"/api/products/{producto_id}"
+    etag = client.get(url).headers["ETag"]
+
+    response = client.post("/api/transactions", json={"producto_id": producto_id, "ubicacion_id": 1,
+                                                       "tipo_transaccion_id": entrada, "cantidad": 1},
+                           headers=headers)
+    assert response.status_code == 201
+
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json()["product"]["stock_total"] == 6
+
+
+def test_errors_carry_no_etag(tree):
+    response = tree.app.test_client().get("/api/products/999999")
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+
+
+def test_anchoring_keeps_catalog_etag(backend_app):
+    # El anclaje escribe productos.blockchain_hash, que no se sirve en el catálogo
+    post_transactions(backend_app, 2)
+    client = backend_app.app.test_client()
+    etag = client.get("/api/products").headers["ETag"]
+    result = backend_app.app.test_cli_runner().invoke(args=["anchor-transactions"])
+    assert result.exit_code == 0, result.output
+    assert client.get("/api/products", headers={"If-None-Match": etag}).status_code == 304
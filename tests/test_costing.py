@@ -0,0 +1,108 @@
+# Capas de costo mantenidas al escribir: cada escritura lee solo las capas de la cabeza
+# que consume, y el estado guardado debe ser el mismo que recalcularlo todo desde
+# movimientos_costo.
+import importlib
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import create_product, login, transaction_types
+
+
+def stored_state(database, producto_id):
+    connection = sqlite3.connect(database)
+    states = connection.execute("""
+        SELECT producto_id, ubicacion_id, cantidad, costo_promedio, valor_fifo, salidas, costo_ventas_fifo,
+               costo_ventas_promedio
+        FROM costos_inventario WHERE producto_id = ? ORDER BY ubicacion_id
+    """, (producto_id,)).fetchall()
+    layers = connection.execute("""
+        SELECT producto_id, ubicacion_id, movimiento_id, restante, costo_unitario
+        FROM capas_costo WHERE producto_id = ? ORDER BY ubicacion_id, movimiento_id
+    """, (producto_id,)).fetchall()
+    connection.close()
+    return states, layers
+
+
+def test_incremental_layers_match_replay(tree):
+    entrada, salida = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {})
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+
+    generator = random.Random(25)
+    # Muchas capas chicas y una salida que agota más de las que se leen por consulta
+    rows = [(1, entrada, 1, 10 + i) for i in range(40)] + [(1, salida, 35, None)]
+    rows += [(generator.choice((1, 2)), generator.choice((entrada, salida)), generator.randint(1, 8),
+              generator.choice((None, 5, 7.5, 12))) for _ in range(60)]
+    for ubicacion_id, tipo, cantidad, precio in rows:
+        row = {"producto_id": producto_id, "ubicacion_id": ubicacion_id, "tipo_transaccion_id": tipo,
+               "cantidad": cantidad}
+        if precio is not None:
+            row["precio_unitario"] = precio
+        response = client.post("/api/transactions", json=row, headers=headers)
+        assert response.status_code == 201, response.get_json()
+
+    costing = importlib.import_module("shared.costing")
+    states, layers, _, _ = costing.replay_partition(tree.database, 1, 0)
+    stored_states, stored_layers = stored_state(tree.database, producto_id)
+    expected_states = sorted(state for state in states if state[0] == producto_id)
+    assert [state[:2] for state in stored_states] == [state[:2] for state in expected_states]
+    for stored, expected in zip(stored_states, expected_states):
+        assert stored == pytest.approx(expected)
+    assert stored_layers == sorted(layer for layer in layers if layer[0] == producto_id)
+
+
+def product_row(response, producto_id):
+    assert response.status_code == 200, response.get_json()
+    return next(row for row in response.get_json()["products"] if row["producto_id"] == producto_id)
+
+
+def test_fifo_and_weighted_average(tree):
+    entrada, salida = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {})
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+
+    # FIFO: la primera salida consume las 10 a 5 y 5 de las 10 a 8; la segunda, las 5 a 8
+    # restantes y 1 a 11. Promedio: 6.5 tras las dos entradas, 8.75 tras la tercera.
+    for ubicacion_id, tipo, cantidad, precio in [(1, entrada, 10, 5), (1, entrada, 10, 8), (1, salida, 15, None),
+                                                 (1, entrada, 5, 11), (1, salida, 6, None), (2, entrada, 2, 100)]:
+        row = {"producto_id": producto_id, "ubicacion_id": ubicacion_id, "tipo_transaccion_id": tipo,
+               "cantidad": cantidad}
+        if precio is not None:
+            row["precio_unitario"] = precio
+        assert client.post("/api/transactions", json=row, headers=headers).status_code == 201
+
+    valuation = product_row(client.get("/api/inventory/valuation", headers=headers), producto_id)
+    assert valuation["cantidad"] == 6
+    assert valuation["valor_fifo"] == pytest.approx(4 * 11 + 200)
+    assert valuation["valor_promedio"] == pytest.approx(4 * 8.75 + 200)
+
+    local = product_row(client.get("/api/inventory/valuation?ubicacion_id=1", headers=headers), producto_id)
+    assert local["cantidad"] == 4
+    assert local["valor_fifo"] == pytest.approx(44)
+    assert local["valor_promedio"] == pytest.approx(35)
+
+    sales = product_row(client.get("/api/inventory/cost-of-sales", headers=headers), producto_id)
+    assert sales["cantidad"] == 21
+    assert sales["costo_fifo"] == pytest.approx(10 * 5 + 5 * 8 + 5 * 8 + 11)
+    assert sales["costo_promedio"] == pytest.approx(15 * 6.5 + 6 * 8.75)
+
+    # Por día: hoy (UTC, como fecha_creacion) trae las mismas ventas; un rango pasado, ninguna
+    today = datetime.now(timezone.utc).date()
+    daily = product_row(client.get(f"/api/inventory/cost-of-sales?desde={today}&hasta={today}", headers=headers),
+                        producto_id)
+    assert daily == sales
+    past = client.get(f"/api/inventory/cost-of-sales?hasta={today - timedelta(days=1)}", headers=headers)
+    assert producto_id not in [row["producto_id"] for row in past.get_json()["products"]]
+
+
+def test_costing_endpoints_require_staff(tree):
+    client = tree.app.test_client()
+    headers = login(client, tree.customer)
+    assert client.get("/api/inventory/valuation", headers=headers).status_code == 403
+    assert client.get("/api/inventory/cost-of-sales", headers=headers).status_code == 403
+    assert client.get("/api/inventory/cost-of-sales?desde=ayer", headers=login(client, tree.staff)).status_code == 400
@@ -0,0 +1,109 @@
+# Pronóstico de demanda: el cálculo vectorizado de shared/forecast.py debe coincidir con
+# recorrer cada serie día por día, y forecast-reorder guarda puntos de reorden que la ruta
+# cruza con el stock actual.
+import importlib
+import math
+import random
+import sqlite3
+from statistics import NormalDist
+
+import pytest
+
+from conftest import create_product, login
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def forecast(backend_app):
+    return importlib.import_module("shared.forecast")
+
+
+def reference(daily, history, average_days, deviation_days, smoothing, lead_time, service_level):
+    # Una serie densa de `history` días, el último es ayer
+    level = 0.0
+    for value in daily:
+        level = smoothing * value + (1 - smoothing) * level
+    suavizada = level / (1 - (1 - smoothing) ** history)
+    desviacion = float(np.std(daily[-deviation_days:]))
+    stock_seguridad = NormalDist().inv_cdf(service_level) * desviacion * math.sqrt(lead_time)
+    return {
+        "demanda_media": sum(daily[-average_days:]) / average_days,
+        "demanda_suavizada": suavizada,
+        "desviacion": desviacion,
+        "stock_seguridad": stock_seguridad,
+        "punto_reorden": math.ceil(suavizada * lead_time + stock_seguridad),
+    }
+
+
+def test_vectorized_forecast_matches_daily_loop(forecast):
+    params = dict(history=60, average_days=14, deviation_days=30, smoothing=0.3, lead_time=5, service_level=0.9)
+    generator = random.Random(24)
+    series = {(producto, ubicacion): [0] * params["history"] for producto in (3, 70000) for ubicacion in (1, 2)}
+    rows = []
+    for key, daily in series.items():
+        # Varias salidas el mismo día y días sin demanda
+        for _ in range(80):
+            day, amount = generator.randrange(params["history"]), generator.randint(1, 9)
+            daily[day] += amount
+            rows.append((*key, day, amount))
+
+    producto, ubicacion, dia, cantidad = (np.array(column) for column in zip(*rows))
+    result = forecast.forecast(producto, ubicacion, dia, cantidad.astype(np.float64), **params)
+    assert list(zip(result["producto_id"].tolist(), result["ubicacion_id"].tolist())) == sorted(series)
+    for position, key in enumerate(sorted(series)):
+        expected = reference(series[key], **params)
+        for field, value in expected.items():
+            assert result[field][position] == pytest.approx(value), (key, field)
+
+
+@pytest.fixture
+def demand_history(tree):
+    # Dos unidades diarias por ubicación en los últimos 90 días completos, en orden de fecha
+    # como las escribe el trigger de inventario. Los movimientos no se reflejan en
+    # inventario, así que se borran al terminar para no alterar el stock a una fecha.
+    producto_id = create_product(tree.database, {1: 5, 2: 50})
+    connection = sqlite3.connect(tree.database)
+    connection.executemany(
+        "INSERT INTO movimientos_inventario (producto_id, ubicacion_id, delta, fecha) "
+        "VALUES (?, ?, -2, datetime(date('now', ?), '+12 hours'))",
+        [(producto_id, ubicacion_id, f"-{days} days") for days in range(90, 0, -1) for ubicacion_id in (1, 2)])
+    connection.commit()
+    yield producto_id
+    connection.execute("DELETE FROM movimientos_inventario WHERE producto_id = ? AND delta = -2", (producto_id,))
+    connection.commit()
+    connection.close()
+
+
+def test_reorder_points_from_history(tree, demand_history):
+    producto_id = demand_history
+    result = tree.app.test_cli_runner().invoke(args=["forecast-reorder"])
+    assert result.exit_code == 0, result.output
+
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+    response = client.get(f"/api/inventory/reorder-points?producto_id={producto_id}", headers=headers)
+    assert response.status_code == 200, response.get_json()
+    rows = response.get_json()["reorder_points"]
+    assert [(row["ubicacion_id"], row["stock_actual"]) for row in rows] == [(1, 5), (2, 50)]
+    for row in rows:
+        assert row["demanda_media"] == pytest.approx(2)
+        assert row["demanda_suavizada"] == pytest.approx(2)
+        assert row["desviacion"] == pytest.approx(0, abs=1e-9)
+        assert row["punto_reorden"] == 14  # 2 por día durante los 7 de reposición
+
+    below = client.get(f"/api/inventory/reorder-points?producto_id={producto_id}&below=1", headers=headers)
+    assert [row["ubicacion_id"] for row in below.get_json()["reorder_points"]] == [1]
+
+    first = client.get(f"/api/inventory/reorder-points?producto_id={producto_id}&limit=1", headers=headers).get_json()
+    assert [row["ubicacion_id"] for row in first["reorder_points"]] == [1] and first["next_cursor"]
+    second = client.get(f"/api/inventory/reorder-points?producto_id={producto_id}&limit=1&cursor={first['next_cursor']}",
+                        headers=headers).get_json()
+    assert [row["ubicacion_id"] for row in second["reorder_points"]] == [2]
+
+
+def test_reorder_points_require_staff(tree):
+    client = tree.app.test_client()
+    headers = login(client, tree.customer)
+    assert client.get("/api/inventory/reorder-points", headers=headers).status_code == 403
+    assert client.post("/api/inventory/reorder-points/refresh", headers=headers).status_code == 403
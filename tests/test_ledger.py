@@ -0,0 +1,38 @@
+# Cadena de hashes de transacciones: editar una fila por fuera de la aplicación rompe la
+# cadena desde esa fila, y verify-ledger informa la primera inválida.
+import sqlite3
+
+import pytest
+
+from conftest import post_transactions, tampered
+
+
+def verify_ledger(tree):
+    return tree.app.test_cli_runner().invoke(args=["verify-ledger"])
+
+
+def test_ledger_is_valid_after_writes(tree):
+    post_transactions(tree, 3)
+    result = verify_ledger(tree)
+    assert result.exit_code == 0, result.output
+    assert "Cadena válida" in result.output
+
+
+def test_edited_row_is_the_first_invalid_id(tree):
+    first, middle, last = post_transactions(tree, 3)
+    with tampered(tree.database, middle):
+        result = verify_ledger(tree)
+    assert result.exit_code == 1
+    assert f"Cadena rota en la transacción {middle} (hash)" in result.output
+    assert verify_ledger(tree).exit_code == 0
+
+
+def test_application_cannot_edit_the_ledger(tree):
+    transaction_id, = post_transactions(tree, 1)
+    connection = sqlite3.connect(tree.database)
+    try:
+        for statement in ("UPDATE transacciones SET cantidad = 1 WHERE id = ?", "DELETE FROM transacciones WHERE id = ?"):
+            with pytest.raises(sqlite3.IntegrityError, match="solo anexado"):
+                connection.execute(statement, (transaction_id,))
+    finally:
+        connection.close()
@@ -0,0 +1,68 @@
+# Pedidos concurrentes contra stock limitado: la reserva corre bajo BEGIN IMMEDIATE, así
+# que ninguna ubicación queda negativa, se venden exactamente las unidades disponibles y
+# los pedidos que no alcanzan responden 409 sin descontar nada.
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import create_product, login
+
+ORDERS = 24
+QUANTITY = 2
+STOCK = {1: 5, 2: 3}  # 8 unidades repartidas en dos ubicaciones: entran 4 pedidos
+
+
+def order_payload(producto_id):
+    subtotal = 15 * QUANTITY
+    return {
+        "items": [{"producto_id": producto_id, "cantidad": QUANTITY, "precio_unitario": 15, "subtotal": subtotal}],
+        "subtotal": subtotal,
+        "total": subtotal,
+        "direccion_entrega": "Calle 1",
+    }
+
+
+def test_concurrent_orders_never_oversell(tree):
+    producto_id = create_product(tree.database, STOCK)
+    headers = login(tree.app.test_client(), tree.customer)
+
+    # Registrar cualquier escritura que deje una ubicación en negativo, aunque luego se deshaga
+    connection = sqlite3.connect(tree.database)
+    connection.executescript(f"""
+        CREATE TABLE IF NOT EXISTS prueba_stock_negativo (producto_id INTEGER, ubicacion_id INTEGER, cantidad INTEGER);
+        CREATE TRIGGER prueba_stock_negativo_au AFTER UPDATE OF cantidad ON inventario
+        WHEN NEW.producto_id = {producto_id} AND NEW.cantidad < 0 BEGIN
+            INSERT INTO prueba_stock_negativo VALUES (NEW.producto_id, NEW.ubicacion_id, NEW.cantidad);
+        END;
+    """)
+
+    start = threading.Barrier(ORDERS)
+
+    def place_order(_):
+        client = tree.app.test_client()
+        start.wait()
+        response = client.post("/api/orders", json=order_payload(producto_id), headers=headers)
+        return response.status_code, response.get_json()
+
+    try:
+        with ThreadPoolExecutor(ORDERS) as executor:
+            results = list(executor.map(place_order, range(ORDERS)))
+    finally:
+        connection.execute("DROP TRIGGER prueba_stock_negativo_au")
+
+    statuses = sorted(status for status, _ in results)
+    sold = sum(STOCK.values()) // QUANTITY
+    assert statuses == [201] * sold + [409] * (ORDERS - sold), results
+    for status, body in results:
+        if status == 409:
+            assert body["producto_id"] == producto_id
+            assert body["solicitado"] == QUANTITY
+            assert body["disponible"] < QUANTITY
+
+    stock = dict(connection.execute("SELECT ubicacion_id, cantidad FROM inventario WHERE producto_id = ?",
+                                    (producto_id,)).fetchall())
+    assert stock == {ubicacion_id: 0 for ubicacion_id in STOCK}
+    assert connection.execute("SELECT COUNT(*) FROM prueba_stock_negativo").fetchone()[0] == 0
+    assert connection.execute("SELECT stock_total FROM stock_totals WHERE producto_id = ?",
+                              (producto_id,)).fetchone()[0] == 0
+    connection.close()
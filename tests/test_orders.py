@@ -0,0 +1,55 @@
+# Validación de los renglones de un pedido antes de tocar el stock
+import pytest
+
+from conftest import create_product, login
+
+
+@pytest.mark.parametrize("item", [
+    {"cantidad": 1},
+    {"producto_id": None, "cantidad": 1},
+    {"producto_id": "1", "cantidad": 1},
+    {"producto_id": True, "cantidad": 1},
+    {"producto_id": 0, "cantidad": 1},
+    {"producto_id": -3, "cantidad": 1},
+    {"producto_id": 1.5, "cantidad": 1},
+    {"producto_id": 1, "cantidad": 0},
+    {"producto_id": 1, "cantidad": "2"},
+    7,
+])
+def test_invalid_items_are_rejected(tree, item):
+    client = tree.app.test_client()
+    response = client.post("/api/orders", json={"items": [item], "subtotal": 0, "total": 0, "direccion_entrega": "Calle 1"},
+                           headers=login(client, tree.customer))
+    assert response.status_code == 400, response.get_json()
+
+
+def test_repeated_lines_are_merged(tree):
+    producto_id = create_product(tree.database, {1: 3})
+    client = tree.app.test_client()
+    items = [{"producto_id": producto_id, "cantidad": 2, "precio_unitario": 15, "subtotal": 30},
+             {"producto_id": producto_id, "cantidad": 2, "precio_unitario": 15, "subtotal": 30}]
+    response = client.post("/api/orders", json={"items": items, "subtotal": 60, "total": 60, "direccion_entrega": "Calle 1"},
+                           headers=login(client, tree.customer))
+    assert response.status_code == 409
+    assert response.get_json()["solicitado"] == 4
+
+
+@pytest.mark.parametrize("ubicacion", [[1], {"x": 1}, "1", 0, -1, 1.5, True])
+def test_invalid_preferred_location_is_rejected(tree, ubicacion):
+    producto_id = create_product(tree.database, {1: 3})
+    client = tree.app.test_client()
+    items = [{"producto_id": producto_id, "cantidad": 1, "precio_unitario": 15, "subtotal": 15}]
+    response = client.post("/api/orders", json={"items": items, "subtotal": 15, "total": 15, "direccion_entrega": "Calle 1",
+                                                "ubicacion_preferida": ubicacion},
+                           headers=login(client, tree.customer))
+    assert response.status_code == 400, response.get_json()
+
+
+def test_null_preferred_location_takes_locations_by_id(tree):
+    producto_id = create_product(tree.database, {1: 3, 2: 3})
+    client = tree.app.test_client()
+    items = [{"producto_id": producto_id, "cantidad": 1, "precio_unitario": 15, "subtotal": 15}]
+    response = client.post("/api/orders", json={"items": items, "subtotal": 15, "total": 15, "direccion_entrega": "Calle 1",
+                                                "ubicacion_preferida": None},
+                           headers=login(client, tree.customer))
+    assert response.status_code == 201, response.get_json()
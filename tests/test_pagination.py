@@ -0,0 +1,53 @@
+# Cursores de paginación: lo que llega en ?cursor= viene del cliente y se pasa a la
+# consulta como parámetros, así que cualquier forma que no sea [clave de orden, id]
+# responde 400 en lugar de 500.
+import base64
+import json
+
+import pytest
+
+from conftest import create_product, login
+
+
+def encode(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+BAD_CURSORS = [
+    "WyJhIix7fV0",  # ["a",{}]
+    encode(["a"]),
+    encode(["a", 1, 2]),
+    encode([["a"], 1]),
+    encode([None, 1]),
+    encode([True, 1]),
+    encode(["a", "1"]),
+    encode(["a", 1.5]),
+    encode(["a", False]),
+    encode({"a": 1}),
+    "no-es-base64!",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+]
+
+
+@pytest.mark.parametrize("path", ["/api/products", "/api/transactions", "/api/orders"])
+@pytest.mark.parametrize("cursor", BAD_CURSORS)
+def test_malformed_cursor_is_rejected(tree, path, cursor):
+    client = tree.app.test_client()
+    response = client.get(path, query_string={"cursor": cursor, "limit": 1}, headers=login(client, tree.staff))
+    assert response.status_code == 400, response.get_json()
+    assert response.get_json()["error"] == "Cursor inválido"
+
+
+def test_next_cursor_walks_the_catalog(tree):
+    for _ in range(3):
+        create_product(tree.database, {1: 1})
+    client = tree.app.test_client()
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/api/products", query_string=params).get_json()
+        seen.extend(product["id"] for product in body["products"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) >= 3
@@ -0,0 +1,89 @@
+# Anclaje en bloques Merkle (solo backend/): cada transacción anclada tiene una prueba de
+# inclusión contra la raíz de su bloque, y la verificación masiva detecta filas editadas.
+import importlib
+import sqlite3
+
+import pytest
+
+from conftest import login, post_transactions, tampered
+
+
+@pytest.fixture
+def merkle(backend_app):
+    return importlib.import_module("shared.merkle")
+
+
+def anchor(tree, block_size=3):
+    result = tree.app.test_cli_runner().invoke(args=["anchor-transactions", "--block-size", str(block_size)])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+@pytest.mark.parametrize("count", range(1, 10))
+def test_every_leaf_proves_against_the_root(merkle, count):
+    leaves = merkle.hash_leaves([f"tx-{i}".encode() for i in range(count)])
+    levels = merkle.build_tree(leaves)
+    root = levels[-1][0]
+    for index, leaf in enumerate(leaves):
+        path = merkle.proof_path(levels, index)
+        assert merkle.verify_proof(leaf, path, root)
+        assert not merkle.verify_proof(merkle.leaf_hash(b"otra"), path, root)
+
+
+def test_transaction_proof_matches_block_root(backend_app, merkle):
+    ids = post_transactions(backend_app, 5)
+    client = backend_app.app.test_client()
+
+    pending = client.get(f"/api/blockchain/transactions/{ids[0]}").get_json()["transaction"]
+    assert pending["anchored"] is False
+
+    assert "Bloque" in anchor(backend_app)
+    assert "No hay transacciones pendientes" in anchor(backend_app)
+
+    for transaction_id in ids:
+        proof = client.get(f"/api/blockchain/transactions/{transaction_id}").get_json()["transaction"]
+        assert proof["anchored"] and proof["verified"]
+        assert proof["leaf"] == proof["stored_leaf"]
+        path = [(step["position"], step["hash"]) for step in proof["proof"]]
+        assert merkle.root_from_proof(proof["leaf"], path) == proof["block"]["merkle_root"]
+
+    assert client.get("/api/blockchain/transactions/999999").status_code == 404
+
+
+def test_bulk_verification_reports_tampered_rows(backend_app):
+    ids = post_transactions(backend_app, 5)
+    anchor(backend_app)
+    client = backend_app.app.test_client()
+    headers = login(client, backend_app.staff)
+
+    result = client.post("/api/blockchain/verify", json={"transaction_ids": ids + [999999]}, headers=headers).get_json()
+    assert result["valid"] is True
+    assert result["verified"] == len(ids) and result["failed"] == []
+    assert result["not_found"] == [999999]
+
+    with tampered(backend_app.database, ids[2]):
+        result = client.post("/api/blockchain/verify", json={"transaction_ids": ids}, headers=headers).get_json()
+        assert result["valid"] is False
+        assert result["failed"] == [ids[2]]
+        assert result["verified"] == len(ids) - 1
+
+        proof = client.get(f"/api/blockchain/transactions/{ids[2]}").get_json()["transaction"]
+        assert proof["verified"] is False and proof["leaf"] != proof["stored_leaf"]
+
+        connection = sqlite3.connect(backend_app.database)
+        producto_id = connection.execute("SELECT producto_id FROM transacciones WHERE id = ?", (ids[2],)).fetchone()[0]
+        connection.close()
+        verification = client.get(f"/api/blockchain/products/{producto_id}").get_json()["verification"]
+        assert verification["failed"] == [ids[2]]
+        assert verification["verified"] == len(ids) - 1
+
+    result = client.post("/api/blockchain/verify", json={"transaction_ids": ids}, headers=headers).get_json()
+    assert result["valid"] is True
+
+
+def test_bulk_verification_validates_input(backend_app):
+    client = backend_app.app.test_client()
+    headers = login(client, backend_app.staff)
+    assert client.post("/api/blockchain/verify", json={}).status_code == 401
+    assert client.post("/api/blockchain/verify", json={}, headers=headers).status_code == 400
+    assert client.post("/api/blockchain/verify", json={"transaction_ids": [1, "2"]}, headers=headers).status_code == 400
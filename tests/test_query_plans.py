@@ -0,0 +1,36 @@
+# Las consultas calientes (HOT_QUERIES) deben usar su índice en el esquema que crean
+# create_schema y las migraciones, también con estadísticas de ANALYZE sobre datos.
+import sqlite3
+
+from conftest import create_product
+
+
+def plan_failures(tree):
+    module = tree.module
+    if hasattr(module, "DATABASE_PATH"):
+        connection = sqlite3.connect(tree.database)
+        try:
+            return module.check_query_plans(connection)
+        finally:
+            connection.close()
+    with tree.app.app_context():
+        return module.check_query_plans(module.db.engine)
+
+
+def test_hot_queries_use_their_index(tree):
+    assert plan_failures(tree) == []
+
+
+def test_hot_queries_use_their_index_after_analyze(tree):
+    for _ in range(20):
+        create_product(tree.database, {1: 5, 2: 1})
+    connection = sqlite3.connect(tree.database)
+    connection.execute("ANALYZE")
+    connection.close()
+    assert plan_failures(tree) == []
+
+
+def test_check_query_plans_command(tree):
+    result = tree.app.test_cli_runner().invoke(args=["check-query-plans"])
+    assert result.exit_code == 0, result.output
+    assert "usan su índice" in result.output
@@ -0,0 +1,94 @@
+# Inventario a una fecha: la última foto anterior a la fecha más los movimientos entre la
+# foto y la fecha. Con la fecha de hoy en adelante debe dar el inventario actual.
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+from conftest import create_product, login, transaction_types
+
+
+def take_snapshot(tree):
+    result = tree.app.test_cli_runner().invoke(args=["snapshot-inventory"])
+    assert result.exit_code == 0, result.output
+    connection = sqlite3.connect(tree.database)
+    snapshot_id = connection.execute("SELECT MAX(id) FROM snapshots_inventario").fetchone()[0]
+    connection.close()
+    return snapshot_id
+
+
+def as_of(client, headers, date, **params):
+    response = client.get("/api/inventory/as-of", query_string=dict(params, date=date), headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def stock(body):
+    return {(row["producto_id"], row["ubicacion_id"]): row["cantidad"] for row in body["inventory"]}
+
+
+def test_as_of_replays_movements_after_snapshot(tree):
+    entrada, salida = transaction_types(tree.database)
+    producto_id = create_product(tree.database, {1: 10, 2: 4})
+    snapshot_id = take_snapshot(tree)
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+
+    def post(ubicacion_id, tipo, cantidad):
+        response = client.post("/api/transactions", json={"producto_id": producto_id, "ubicacion_id": ubicacion_id,
+                                                           "tipo_transaccion_id": tipo, "cantidad": cantidad},
+                               headers=headers)
+        assert response.status_code == 201, response.get_json()
+
+    post(1, entrada, 5)
+    connection = sqlite3.connect(tree.database)
+    cut = connection.execute("SELECT fecha FROM movimientos_inventario ORDER BY id DESC LIMIT 1").fetchone()[0]
+    # Las fechas tienen resolución de segundos: lo que sigue cae después del corte
+    time.sleep(1.1)
+    post(1, salida, 3)
+    post(2, salida, 4)
+
+    at_cut = as_of(client, headers, cut, producto_id=producto_id)
+    assert at_cut["snapshot"]["id"] == snapshot_id
+    assert at_cut["movimientos"] == 1
+    assert stock(at_cut) == {(producto_id, 1): 15, (producto_id, 2): 4}
+
+    tomorrow = (datetime.now(timezone.utc).date() + timedelta(days=1)).isoformat()
+    latest = as_of(client, headers, tomorrow, producto_id=producto_id)
+    assert latest["snapshot"]["id"] == snapshot_id
+    assert latest["movimientos"] == 3
+    # La ubicación que quedó en cero no aparece
+    assert stock(latest) == {(producto_id, 1): 12}
+    assert stock(as_of(client, headers, tomorrow, producto_id=producto_id, ubicacion_id=2)) == {}
+
+    # Sin filtros, la reconstrucción coincide con el inventario actual
+    current = dict(((producto, ubicacion), cantidad) for producto, ubicacion, cantidad in connection.execute(
+        "SELECT producto_id, ubicacion_id, cantidad FROM inventario WHERE cantidad != 0"))
+    connection.close()
+    assert stock(as_of(client, headers, tomorrow)) == current
+
+
+def test_new_snapshot_shortens_the_tail(tree):
+    producto_id = create_product(tree.database, {1: 7})
+    take_snapshot(tree)
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+    tomorrow = (datetime.now(timezone.utc).date() + timedelta(days=1)).isoformat()
+
+    body = as_of(client, headers, tomorrow, producto_id=producto_id)
+    assert body["movimientos"] == 0
+    assert stock(body) == {(producto_id, 1): 7}
+    assert "Sin movimientos" in tree.app.test_cli_runner().invoke(args=["snapshot-inventory"]).output
+
+
+def test_as_of_without_history(tree):
+    client = tree.app.test_client()
+    headers = login(client, tree.staff)
+    assert client.get("/api/inventory/as-of", headers=headers).status_code == 400
+    assert client.get("/api/inventory/as-of?date=ayer", headers=headers).status_code == 400
+    assert client.get("/api/inventory/as-of?date=2000-01-01", headers=headers).status_code == 404
+
+
+def test_as_of_requires_staff(tree):
+    client = tree.app.test_client()
+    assert client.get("/api/inventory/as-of?date=2000-01-01").status_code == 401
+    assert client.get("/api/inventory/as-of?date=2000-01-01", headers=login(client, tree.customer)).status_code == 403